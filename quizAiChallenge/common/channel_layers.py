@@ -0,0 +1,30 @@
+"""
+Channel layer chia theo nhiều Redis bằng consistent hashing.
+
+RedisChannelLayer của channels_redis đã chia group / channel theo danh sách
+`hosts`, nhưng bằng CRC chia theo khoảng (tương đương mod N): thêm một Redis
+làm gần như mọi group quiz_{code} đổi host, các consumer đang ở group cũ không
+còn nhận group_send. Layer này chỉ thay hàm băm bằng HashRing nên khi thêm
+host chỉ khoảng 1/N group bị chuyển.
+
+Tất cả process phải dùng cùng danh sách hosts (thứ tự không quan trọng).
+"""
+from channels_redis.core import RedisChannelLayer
+from .hashring import HashRing
+
+
+def host_id(host):
+    if isinstance(host, dict):
+        return str(host.get('address') or sorted(host.items()))
+    return str(host)
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    def __init__(self, hosts=None, **kwargs):
+        super().__init__(hosts=hosts, **kwargs)
+        self.ring = HashRing([host_id(host) for host in self.hosts])
+
+    def consistent_hash(self, value):
+        if isinstance(value, bytes):
+            value = value.decode('utf8')
+        return self.ring.get_index(value)
@@ -0,0 +1,40 @@
+"""
+Consistent hashing (hash ring với virtual node).
+
+Dùng cho channel layer nhiều Redis (common.channel_layers) và cho room
+affinity (quiz.affinity): thêm / bớt một node chỉ chuyển khoảng 1/N key sang
+node khác thay vì chia lại toàn bộ như hash mod N. Hash là md5 nên mọi process
+cho cùng kết quả (khác với hash() của Python).
+"""
+import bisect
+import hashlib
+
+REPLICAS = 160
+
+
+def stable_hash(value):
+    if isinstance(value, str):
+        value = value.encode('utf8')
+    return int.from_bytes(hashlib.md5(value).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=REPLICAS):
+        """nodes: danh sách định danh node (chuỗi), thứ tự không ảnh hưởng kết quả."""
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted(
+            (stable_hash(f'{node}#{replica}'), index)
+            for index, node in enumerate(self.nodes)
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+
+    def get_index(self, key):
+        position = bisect.bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._indexes[position]
+
+    def get_node(self, key):
+        return self.nodes[self.get_index(key)]
@@ -0,0 +1,108 @@
+"""
+Redis connection pool dùng chung cho toàn project.
+
+Cấu hình lấy từ settings (REDIS_URL, REDIS_POOL_MAX_CONNECTIONS,
+REDIS_POOL_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL) - cùng cấu hình mà
+CHANNEL_LAYERS dùng - để có thể tính số connection Redis cho mỗi Daphne
+worker thay vì mỗi module tự tạo client riêng.
+
+Connection của redis.asyncio gắn với event loop tạo ra nó, nên mỗi event
+loop có một pool riêng (giữ bằng WeakKeyDictionary, pool tự mất khi loop bị
+huỷ). Code sync (views, management commands) dùng get_sync_redis().
+Mức sử dụng các pool được xuất ở /metrics (redis_pool_connections).
+"""
+import asyncio
+import threading
+import weakref
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from .metrics import Gauge
+
+_async_pools = weakref.WeakKeyDictionary()  # event loop -> BlockingConnectionPool
+_sync_pool = None
+_sync_lock = threading.Lock()
+
+
+def pool_options():
+    return {
+        'max_connections': getattr(settings, 'REDIS_POOL_MAX_CONNECTIONS', 50),
+        'timeout': getattr(settings, 'REDIS_POOL_TIMEOUT', 5),
+        'health_check_interval': getattr(settings, 'REDIS_HEALTH_CHECK_INTERVAL', 30),
+        'decode_responses': True,
+        'encoding': 'utf-8',
+    }
+
+
+def redis_url():
+    return getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')
+
+
+def get_async_pool():
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        # BlockingConnectionPool: khi hết connection thì chờ (tối đa `timeout`)
+        # thay vì mở thêm connection vượt giới hạn
+        pool = aioredis.BlockingConnectionPool.from_url(redis_url(), **pool_options())
+        _async_pools[loop] = pool
+    return pool
+
+
+async def get_redis():
+    """Client redis.asyncio dùng pool của event loop hiện tại."""
+    return aioredis.Redis(connection_pool=get_async_pool())
+
+
+def get_sync_redis():
+    global _sync_pool
+    if _sync_pool is None:
+        with _sync_lock:
+            if _sync_pool is None:
+                _sync_pool = redis.BlockingConnectionPool.from_url(redis_url(), **pool_options())
+    return redis.Redis(connection_pool=_sync_pool)
+
+
+def _pool_stats(pool):
+    in_use = len(getattr(pool, '_in_use_connections', ()) or ())
+    available = getattr(pool, '_available_connections', None)
+    if available is None:
+        # redis-py sync BlockingConnectionPool giữ connection trong queue `pool`
+        # (None = slot chưa tạo connection) và tất cả trong `_connections`
+        created = len(getattr(pool, '_connections', ()))
+        idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        in_use = created - idle
+    else:
+        idle = len(available)
+        created = in_use + idle
+    return {
+        'max_connections': pool.max_connections,
+        'created': created,
+        'in_use': in_use,
+        'idle': idle,
+    }
+
+
+def pool_stats():
+    """Mức sử dụng các pool của process hiện tại (một entry cho mỗi event loop + sync)."""
+    stats = {
+        f'async:{id(loop):x}': _pool_stats(pool)
+        for loop, pool in list(_async_pools.items())
+    }
+    if _sync_pool is not None:
+        stats['sync'] = _pool_stats(_sync_pool)
+    return stats
+
+
+def _pool_gauge():
+    return {
+        (pool, state): value
+        for pool, stats in pool_stats().items()
+        for state, value in stats.items()
+    }
+
+
+POOL_CONNECTIONS = Gauge(
+    'redis_pool_connections', 'Redis connections of each pool in this process',
+    ['pool', 'state'], collect=_pool_gauge,
+)
@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from common import metrics as metrics_registry
+from common import redis_pool  # noqa: F401 - đăng ký gauge redis_pool_connections
 from learning_path.models import LearningPath
 from entrance_test.models import EntranceTestResult
 from leaderboard.services import get_top_users
@@ -30,3 +34,17 @@ def root_redirect(request):
     if request.user.is_authenticated:
         return redirect('homepage')
     return redirect('public-home')
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint (metrics của process hiện tại). Cần
+    METRICS_TOKEN; chưa đặt token thì chỉ mở khi DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse(status=403)
+    elif not settings.DEBUG:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
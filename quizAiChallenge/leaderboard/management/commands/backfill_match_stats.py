@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from leaderboard.models import UserMatchStats
+from leaderboard.services import pvp_outcome
+from quiz.models import GameHistory
+from quiz_ai_battle.models import Match
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild UserMatchStats from finalized quiz_ai_battle matches and realtime "
+        "GameHistory, replaying results in time order so streaks are correct"
+    )
+
+    def handle(self, *args, **options):
+        stats = {}
+
+        def apply(user_id, mode, outcome):
+            row = stats.get((user_id, mode))
+            if row is None:
+                row = stats[(user_id, mode)] = UserMatchStats(user_id=user_id, mode=mode)
+            row.apply(outcome)
+
+        matches = (
+            Match.objects.filter(finalized=True, user__isnull=False)
+            .order_by('created_at', 'id')
+            .only('user_id', 'user_score', 'ai_score')
+        )
+        ai_count = 0
+        for match in matches.iterator(chunk_size=CHUNK_SIZE):
+            apply(match.user_id, UserMatchStats.MODE_AI, match.result)
+            ai_count += 1
+
+        histories = (
+            GameHistory.objects.order_by('played_at', 'id')
+            .prefetch_related('participants')
+        )
+        pvp_count = 0
+        for history in histories.iterator(chunk_size=CHUNK_SIZE):
+            # Trận cũ (trước GameParticipant) chỉ có player1 / player2
+            players = [(p.user_id, p.score) for p in history.participants.all()] or [
+                (history.player1_id, history.player1_score),
+                (history.player2_id, history.player2_score),
+            ]
+            scores = [score for _, score in players]
+            for user_id, score in players:
+                apply(user_id, UserMatchStats.MODE_PVP, pvp_outcome(score, scores))
+            pvp_count += 1
+
+        with transaction.atomic():
+            UserMatchStats.objects.all().delete()
+            UserMatchStats.objects.bulk_create(stats.values(), batch_size=CHUNK_SIZE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"📊 Rebuilt {len(stats)} stats rows from {ai_count} AI matches and {pvp_count} realtime games"
+        ))
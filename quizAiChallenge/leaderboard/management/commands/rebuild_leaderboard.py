@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from leaderboard.ranking import rebuild, REBUILD_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis leaderboard index (leaderboard:elo) from User.elo_rating"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"🏆 Indexed {total} ranked users"))
@@ -0,0 +1,145 @@
+import time
+from itertools import groupby
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from leaderboard.rating import (
+    AI_RATINGS, AI_RD, DEFAULT_VOLATILITY, get_engine, initial_state, np, outcome,
+)
+from leaderboard.services import set_elo
+from quiz.models import GameHistory, GameParticipant
+from quiz_ai_battle.models import Match
+
+CHUNK_SIZE = 2000
+WRITE_BATCH_SIZE = 1000
+AI_PLAYERS = list(AI_RATINGS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate every rating from scratch by replaying finalized AI matches and "
+        "realtime games in rating periods (NumPy batch per period), then write "
+        "User.elo_rating / UserElo. Ratings of users without games are left as is."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', default=None, help="elo | glicko2 (default: settings.RATING_ENGINE)")
+        parser.add_argument('--period-days', type=float, default=1.0, help="Length of a rating period")
+        parser.add_argument('--dry-run', action='store_true', help="Print the top ratings without writing")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy is required (pip install numpy)")
+        if options['period_days'] <= 0:
+            raise CommandError("--period-days must be positive")
+        engine = get_engine(options['engine'])
+        started = time.perf_counter()
+
+        self.user_index = {}
+        self.observations = []  # (timestamp, player, opponent, score, weight)
+        games = self.load_ai_matches() + self.load_games()
+        if not self.observations:
+            self.stdout.write("Nothing to rate")
+            return
+
+        state, periods = self.replay(engine, options['period_days'] * 86400)
+        count = len(self.user_index)
+        ratings = {
+            user_id: int(round(state.rating[i])) for user_id, i in self.user_index.items()
+        }
+        self.stdout.write(
+            f"📈 {engine.name}: {games} games, {periods} periods, {count} players "
+            f"rated in {time.perf_counter() - started:.2f}s"
+        )
+
+        if options['dry_run']:
+            for user_id, rating in sorted(ratings.items(), key=lambda item: -item[1])[:10]:
+                self.stdout.write(f"   user {user_id}: {rating}")
+            return
+
+        glicko = None
+        if engine.name == 'glicko2':
+            glicko = {
+                user_id: (float(state.rd[i]), float(state.volatility[i]))
+                for user_id, i in self.user_index.items()
+            }
+        user_ids = list(ratings)
+        with transaction.atomic():
+            for start in range(0, len(user_ids), WRITE_BATCH_SIZE):
+                batch = user_ids[start:start + WRITE_BATCH_SIZE]
+                set_elo(
+                    {user_id: ratings[user_id] for user_id in batch},
+                    glicko and {user_id: glicko[user_id] for user_id in batch},
+                )
+        self.stdout.write(self.style.SUCCESS(f"✅ Wrote {count} ratings"))
+
+    def index(self, user_id):
+        return self.user_index.setdefault(user_id, len(self.user_index))
+
+    def add_game(self, timestamp, players):
+        """players: [(user_id, score), ...]; mỗi cặp là một quan sát với weight 1 / (N - 1)."""
+        weight = 1 / (len(players) - 1)
+        for user_id, score in players:
+            for other_id, other_score in players:
+                if other_id != user_id:
+                    self.observations.append((
+                        timestamp, self.index(user_id), self.index(other_id),
+                        outcome(score, other_score), weight,
+                    ))
+
+    def load_ai_matches(self):
+        # AI là đối thủ có rating cố định: index âm, đổi sang cuối mảng khi replay
+        matches = (
+            Match.objects.filter(finalized=True, user__isnull=False)
+            .values_list('created_at', 'user_id', 'ai_difficulty', 'user_score', 'ai_score')
+        )
+        count = 0
+        for created_at, user_id, difficulty, user_score, ai_score in matches.iterator(chunk_size=CHUNK_SIZE):
+            ai = AI_PLAYERS.index(difficulty) if difficulty in AI_RATINGS else AI_PLAYERS.index('medium')
+            self.observations.append((
+                created_at.timestamp(), self.index(user_id), -ai - 1, outcome(user_score, ai_score), 1.0,
+            ))
+            count += 1
+        return count
+
+    def load_games(self):
+        participants = (
+            GameParticipant.objects.order_by('history_id')
+            .values_list('history_id', 'history__played_at', 'user_id', 'score')
+        )
+        count = 0
+        for _, rows in groupby(participants.iterator(chunk_size=CHUNK_SIZE), key=lambda row: row[0]):
+            rows = list(rows)
+            if len(rows) > 1:
+                self.add_game(rows[0][1].timestamp(), [(user_id, score) for _, _, user_id, score in rows])
+                count += 1
+
+        # Trận cũ (trước GameParticipant) chỉ có player1 / player2
+        legacy = (
+            GameHistory.objects.filter(participants__isnull=True)
+            .values_list('played_at', 'player1_id', 'player1_score', 'player2_id', 'player2_score')
+        )
+        for played_at, player1, score1, player2, score2 in legacy.iterator(chunk_size=CHUNK_SIZE):
+            self.add_game(played_at.timestamp(), [(player1, score1), (player2, score2)])
+            count += 1
+        return count
+
+    def replay(self, engine, period_seconds):
+        timestamp, player, opponent, score, weight = (np.array(column) for column in zip(*self.observations))
+        order = np.argsort(timestamp, kind='stable')
+        period = ((timestamp - timestamp.min()) // period_seconds).astype(np.int64)[order]
+        player, score, weight = player[order], score[order], weight[order]
+
+        count = len(self.user_index)
+        opponent = opponent[order]
+        opponent = np.where(opponent < 0, count - opponent - 1, opponent)
+        ai_ratings = np.array([AI_RATINGS[ai] for ai in AI_PLAYERS], dtype=float)
+
+        state = initial_state(count + len(AI_PLAYERS))
+        # Cả kỳ không có trận cũng được chạy: với Glicko-2, RD tăng theo thời gian nghỉ
+        bounds = np.searchsorted(period, np.arange(period[-1] + 2))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            state.rating[count:], state.rd[count:], state.volatility[count:] = ai_ratings, AI_RD, DEFAULT_VOLATILITY
+            state = engine.rate_period(
+                state, player[start:end], opponent[start:end], score[start:end], weight[start:end]
+            )
+        return state, len(bounds) - 1
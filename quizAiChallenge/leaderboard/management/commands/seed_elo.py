@@ -1,7 +1,7 @@
 import random
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from leaderboard.models import UserElo
+from leaderboard.services import set_elo
 
 class Command(BaseCommand):
     help = "Seed random ELO for all users"
@@ -12,14 +12,13 @@ class Command(BaseCommand):
 
         self.stdout.write("🌱 Seeding ELO for users...")
 
+        ratings = {}
         for user in users:
-            elo_obj, _ = UserElo.objects.get_or_create(user=user)
-
-            elo_obj.elo = random.randint(800, 2000)
-            elo_obj.save()
+            ratings[user.id] = random.randint(800, 2000)
 
             self.stdout.write(
-                f"✅ {user.username} → ELO {elo_obj.elo}"
+                f"✅ {user.username} → ELO {ratings[user.id]}"
             )
+        set_elo(ratings)
 
         self.stdout.write(self.style.SUCCESS("🎉 ELO seeding completed"))
\ No newline at end of file
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0002_usermatchstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userelo',
+            name='rating_deviation',
+            field=models.FloatField(default=350.0),
+        ),
+        migrations.AddField(
+            model_name='userelo',
+            name='volatility',
+            field=models.FloatField(default=0.06),
+        ),
+    ]
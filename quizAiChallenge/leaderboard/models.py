@@ -9,6 +9,9 @@ class UserElo(models.Model):
          related_name='elo_profile'
     )
     elo = models.IntegerField(default=1000)
+    # Glicko-2 (leaderboard.rating), cập nhật khi tính lại theo rating period
+    rating_deviation = models.FloatField(default=350.0)
+    volatility = models.FloatField(default=0.06)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -25,4 +28,56 @@ class EloHistory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username}: {self.elo_before} → {self.elo_after}"
\ No newline at end of file
+        return f"{self.user.username}: {self.elo_before} → {self.elo_after}"
+
+class UserMatchStats(models.Model):
+    """
+    Thống kê trận của user theo chế độ chơi, cộng dồn khi trận kết thúc
+    (leaderboard.services.record_match_results) thay vì đếm lại Match / GameHistory
+    """
+    MODE_AI = 'ai'
+    MODE_PVP = 'pvp'
+    MODE_CHOICES = [
+        (MODE_AI, 'User vs AI'),
+        (MODE_PVP, 'Realtime PvP'),
+    ]
+
+    WIN = 'win'
+    LOSS = 'loss'
+    DRAW = 'draw'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='match_stats'
+    )
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    draws = models.PositiveIntegerField(default=0)
+    current_streak = models.IntegerField(default=0, help_text="> 0: chuỗi thắng, < 0: chuỗi thua")
+    best_win_streak = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'mode')
+
+    def __str__(self):
+        return f"{self.user.username} [{self.mode}] {self.wins}W/{self.losses}L/{self.draws}D"
+
+    @property
+    def total(self):
+        return self.wins + self.losses + self.draws
+
+    def apply(self, outcome):
+        """Cộng một kết quả ('win' / 'loss' / 'draw') vào thống kê."""
+        if outcome == self.WIN:
+            self.wins += 1
+            self.current_streak = self.current_streak + 1 if self.current_streak > 0 else 1
+            self.best_win_streak = max(self.best_win_streak, self.current_streak)
+        elif outcome == self.LOSS:
+            self.losses += 1
+            self.current_streak = self.current_streak - 1 if self.current_streak < 0 else -1
+        else:
+            self.draws += 1
+            self.current_streak = 0
@@ -0,0 +1,173 @@
+"""
+Chỉ mục xếp hạng ELO trong Redis.
+
+    leaderboard:elo        ZSET    user_id -> score (ELO kèm tie-break theo user_id)
+    leaderboard:elo:built  STRING  có nghĩa là ZSET đã được dựng đầy đủ
+
+Nguồn dữ liệu vẫn là User.elo_rating; ZSET được dựng từ DB bằng `manage.py
+rebuild_leaderboard` và cập nhật sau khi transaction đổi ELO commit
+(set_ratings). Trước khi dựng, set_ratings không ghi gì (một ZSET chỉ có vài
+user mới sẽ trông như một chỉ mục hợp lệ) và mọi truy vấn fallback về DB. Rank, trang bất kỳ và cửa sổ quanh một user đều là
+O(log n) thay vì ORDER BY trên bảng user. User có ELO <= 0 không được xếp hạng
+(giống leaderboard cũ).
+"""
+import logging
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from common.redis_pool import get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+KEY = 'leaderboard:elo'
+REBUILD_KEY = f'{KEY}:rebuild'
+BUILT_KEY = f'{KEY}:built'
+REBUILD_BATCH_SIZE = 5000
+# score = elo * ID_SPACE - user_id: cùng ELO thì user_id nhỏ đứng trước (như
+# order_by('-elo_rating', 'id')); vẫn chính xác với float 53 bit
+ID_SPACE = 10 ** 9
+
+
+def score_for(user_id, elo):
+    return elo * ID_SPACE - user_id
+
+
+def elo_from_score(score):
+    return int(-(-score // ID_SPACE))
+
+
+# Ghi vào chỉ mục chỉ khi đã được dựng; key tạm của rebuild chỉ sửa user đã chép (XX).
+# KEYS = [built, key, rebuild key], ARGV = [user_id, score ('' = bỏ xếp hạng), ...]
+SET_SCRIPT = """
+local built = redis.call('EXISTS', KEYS[1]) == 1
+for i = 1, #ARGV, 2 do
+    local member, score = ARGV[i], ARGV[i + 1]
+    if score == '' then
+        redis.call('ZREM', KEYS[2], member)
+        redis.call('ZREM', KEYS[3], member)
+    else
+        if built then
+            redis.call('ZADD', KEYS[2], score, member)
+        end
+        redis.call('ZADD', KEYS[3], 'XX', score, member)
+    end
+end
+"""
+
+
+def _write(pipe, key, ratings):
+    ranked = {user_id: score_for(user_id, elo) for user_id, elo in ratings.items() if elo > 0}
+    unranked = [user_id for user_id, elo in ratings.items() if elo <= 0]
+    if ranked:
+        pipe.zadd(key, ranked)
+    if unranked:
+        pipe.zrem(key, *unranked)
+
+
+def set_ratings(ratings):
+    """ratings: user_id -> ELO mới. Lỗi Redis chỉ được log: rebuild sẽ sửa lại."""
+    if not ratings:
+        return
+    args = []
+    for user_id, elo in ratings.items():
+        args += [user_id, score_for(user_id, elo) if elo > 0 else '']
+    try:
+        redis_conn = get_sync_redis()
+        redis_conn.register_script(SET_SCRIPT)(keys=[BUILT_KEY, KEY, REBUILD_KEY], args=args)
+    except Exception as e:
+        logger.warning(f"Could not update leaderboard index: {e}")
+
+
+def set_ratings_on_commit(ratings):
+    ratings = dict(ratings)
+    transaction.on_commit(lambda: set_ratings(ratings))
+
+
+def remove_user(user_id):
+    try:
+        get_sync_redis().zrem(KEY, user_id)
+    except Exception as e:
+        logger.warning(f"Could not remove user {user_id} from leaderboard index: {e}")
+
+
+def _entries(rows, first_rank):
+    return [
+        (first_rank + i, int(user_id), elo_from_score(score))
+        for i, (user_id, score) in enumerate(rows)
+    ]
+
+
+def get_page(page=1, per_page=100):
+    """
+    [(rank, user_id, elo), ...] của trang `page` (bắt đầu từ 1), hoặc None
+    nếu chỉ mục chưa được dựng (gọi nơi dùng fallback về DB).
+    """
+    redis_conn = get_sync_redis()
+    start = (page - 1) * per_page
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.exists(BUILT_KEY)
+    pipe.zrevrange(KEY, start, start + per_page - 1, withscores=True)
+    built, rows = pipe.execute()
+    if not built:
+        return None
+    return _entries(rows, start + 1)
+
+
+def count():
+    """Số user được xếp hạng, None nếu chỉ mục chưa được dựng."""
+    pipe = get_sync_redis().pipeline(transaction=False)
+    pipe.exists(BUILT_KEY)
+    pipe.zcard(KEY)
+    built, total = pipe.execute()
+    return total if built else None
+
+
+def get_rank(user_id):
+    """Hạng (bắt đầu từ 1) của user, None nếu không được xếp hạng."""
+    rank = get_sync_redis().zrevrank(KEY, user_id)
+    return rank + 1 if rank is not None else None
+
+
+def get_around(user_id, radius=5):
+    """Các user quanh `user_id` (tối đa radius người mỗi phía), [] nếu user không được xếp hạng."""
+    redis_conn = get_sync_redis()
+    if not redis_conn.exists(BUILT_KEY):
+        return []
+    rank = redis_conn.zrevrank(KEY, user_id)
+    if rank is None:
+        return []
+    start = max(0, rank - radius)
+    rows = redis_conn.zrevrange(KEY, start, rank + radius, withscores=True)
+    return _entries(rows, start + 1)
+
+
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    """Dựng lại ZSET từ User.elo_rating vào key tạm rồi RENAME (đổi nguyên tử). Trả về số user."""
+    redis_conn = get_sync_redis()
+    redis_conn.delete(REBUILD_KEY)
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = list(
+            User.objects.filter(id__gt=last_id, elo_rating__gt=0)
+            .order_by('id')
+            .values_list('id', 'elo_rating')[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        pipe = redis_conn.pipeline(transaction=False)
+        _write(pipe, REBUILD_KEY, dict(rows))
+        pipe.execute()
+        total += len(rows)
+
+    pipe = redis_conn.pipeline(transaction=True)
+    if total:
+        pipe.rename(REBUILD_KEY, KEY)
+    else:
+        pipe.delete(KEY)
+    pipe.set(BUILT_KEY, 1)
+    pipe.execute()
+    return total
@@ -0,0 +1,180 @@
+"""
+Engine tính rating.
+
+- EloEngine: Elo chuẩn theo expected score, dùng cho từng trận khi kết thúc
+  (match_deltas, thuần Python) và cho tính lại theo rating period.
+- Glicko2Engine: Glicko-2 (Glickman) với rating deviation (RD) và volatility,
+  chỉ dùng khi tính lại theo rating period.
+
+rate_period xử lý cả một rating period bằng NumPy. Mỗi kết quả là một quan
+sát (player, opponent, score, weight) theo góc nhìn của `player`: trận 1v1 cho
+hai quan sát, trận N người được tách thành các cặp với weight 1 / (N - 1).
+Mọi quan sát trong kỳ được so với rating đầu kỳ. NumPy là dependency tuỳ chọn,
+chỉ cần cho rate_period.
+"""
+import math
+from collections import namedtuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_RATING = 1000
+DEFAULT_RD = 350.0
+DEFAULT_VOLATILITY = 0.06
+
+# Rating cố định của AI (quiz_ai_battle) theo độ khó
+AI_RATINGS = {'easy': 800, 'medium': 1000, 'hard': 1200, 'expert': 1400}
+AI_RD = 50.0
+
+# Mảng NumPy cùng độ dài (số người chơi): rating, RD, volatility
+RatingState = namedtuple('RatingState', ['rating', 'rd', 'volatility'])
+
+
+def expected_score(rating, opponent):
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def outcome(score, opponent_score):
+    """1 thắng, 0 thua, 0.5 hoà."""
+    if score > opponent_score:
+        return 1.0
+    if score < opponent_score:
+        return 0.0
+    return 0.5
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured("NumPy is required for rating periods (pip install numpy)")
+
+
+def initial_state(count, rating=DEFAULT_RATING):
+    _require_numpy()
+    return RatingState(
+        np.full(count, float(rating)),
+        np.full(count, DEFAULT_RD),
+        np.full(count, DEFAULT_VOLATILITY),
+    )
+
+
+class EloEngine:
+    name = 'elo'
+
+    def __init__(self, k_factor=None):
+        self.k_factor = k_factor if k_factor is not None else settings.ELO_K_FACTOR
+
+    def match_deltas(self, ratings, scores):
+        """
+        ELO delta (số nguyên) cho một trận N người: mỗi người được so với từng
+        đối thủ như một trận 1v1, tổng chia cho N - 1.
+        """
+        n = len(ratings)
+        if n < 2:
+            return [0] * n
+        totals = [0.0] * n
+        for i in range(n):
+            for j in range(i + 1, n):
+                change = self.k_factor * (
+                    outcome(scores[i], scores[j]) - expected_score(ratings[i], ratings[j])
+                )
+                totals[i] += change
+                totals[j] -= change
+        return [round(total / (n - 1)) for total in totals]
+
+    def rate_period(self, state, player, opponent, score, weight):
+        _require_numpy()
+        rating = state.rating
+        expected = 1 / (1 + 10 ** ((rating[opponent] - rating[player]) / 400))
+        delta = np.zeros_like(rating)
+        np.add.at(delta, player, self.k_factor * weight * (score - expected))
+        return RatingState(rating + delta, state.rd, state.volatility)
+
+
+class Glicko2Engine:
+    name = 'glicko2'
+    SCALE = 173.7178
+    CENTER = 1500
+    EPSILON = 1e-6
+    MAX_ITERATIONS = 100
+
+    def __init__(self, tau=0.5):
+        self.tau = tau
+
+    def _f(self, x, delta2, phi2, v, a):
+        ex = np.exp(x)
+        return ex * (delta2 - phi2 - v - ex) / (2 * (phi2 + v + ex) ** 2) - (x - a) / self.tau ** 2
+
+    def _volatility(self, sigma, phi, v, delta):
+        """Bước 5 của Glicko-2 (Illinois), chạy song song cho mọi người chơi."""
+        a = np.log(sigma ** 2)
+        delta2, phi2 = delta ** 2, phi ** 2
+        f = lambda x: self._f(x, delta2, phi2, v, a)
+
+        big = delta2 > phi2 + v
+        B = np.where(big, np.log(np.where(big, delta2 - phi2 - v, 1.0)), a - self.tau)
+        pending = ~big
+        for k in range(2, self.MAX_ITERATIONS):
+            pending &= f(B) < 0
+            if not pending.any():
+                break
+            B = np.where(pending, a - k * self.tau, B)
+
+        A, fA, fB = a, f(a), f(B)
+        for _ in range(self.MAX_ITERATIONS):
+            active = np.abs(B - A) > self.EPSILON
+            if not active.any():
+                break
+            with np.errstate(divide='ignore', invalid='ignore'):
+                C = np.where(active, A + (A - B) * fA / (fB - fA), B)
+            fC = f(C)
+            swap = active & (fC * fB <= 0)
+            A = np.where(swap, B, A)
+            fA = np.where(swap, fB, np.where(active, fA / 2, fA))
+            B = np.where(active, C, B)
+            fB = np.where(active, fC, fB)
+        return np.exp(A / 2)
+
+    def rate_period(self, state, player, opponent, score, weight):
+        _require_numpy()
+        mu = (state.rating - self.CENTER) / self.SCALE
+        phi = state.rd / self.SCALE
+        sigma = state.volatility
+
+        g = 1 / np.sqrt(1 + 3 * phi[opponent] ** 2 / math.pi ** 2)
+        expected = 1 / (1 + np.exp(-g * (mu[player] - mu[opponent])))
+        v_inv = np.zeros_like(mu)
+        np.add.at(v_inv, player, weight * g ** 2 * expected * (1 - expected))
+        improvement = np.zeros_like(mu)
+        np.add.at(improvement, player, weight * g * (score - expected))
+
+        # Người không đánh trận nào trong kỳ: chỉ RD tăng
+        new_mu, new_sigma = mu.copy(), sigma.copy()
+        new_phi = np.sqrt(phi ** 2 + sigma ** 2)
+
+        played = v_inv > 0
+        v = 1 / v_inv[played]
+        new_sigma[played] = self._volatility(sigma[played], phi[played], v, v * improvement[played])
+        phi_star = np.sqrt(phi[played] ** 2 + new_sigma[played] ** 2)
+        new_phi[played] = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+        new_mu[played] = mu[played] + new_phi[played] ** 2 * improvement[played]
+
+        return RatingState(
+            new_mu * self.SCALE + self.CENTER,
+            np.minimum(new_phi * self.SCALE, DEFAULT_RD),
+            new_sigma,
+        )
+
+
+ENGINES = {engine.name: engine for engine in (EloEngine, Glicko2Engine)}
+
+
+def get_engine(name=None):
+    name = name or settings.RATING_ENGINE
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown rating engine {name!r}, expected one of {sorted(ENGINES)}")
@@ -1,24 +1,252 @@
-from .models import UserElo, EloHistory
+import logging
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from learning_path.services.progress_service import get_learning_progress_many
+from . import ranking
+from .models import UserElo, EloHistory, UserMatchStats
 
-def update_elo(user, delta):
-    elo_profile = user.elo_profile
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+def _add_to_ratings(deltas):
+    """
+    UPDATE user SET elo_rating = elo_rating + CASE id ... END ... RETURNING id, elo_rating:
+    đọc giá trị mới cùng lúc với ghi nên không có lost update giữa các trận đồng thời.
+    Backend không có UPDATE ... RETURNING thì đọc lại trong cùng transaction.
+    Trả về {user_id: elo sau khi cộng}.
+    """
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        quote = connection.ops.quote_name
+        table = quote(User._meta.db_table)
+        pk = quote(User._meta.pk.column)
+        column = quote(User._meta.get_field('elo_rating').column)
+        whens = ' '.join(['WHEN %s THEN %s'] * len(deltas))
+        placeholders = ', '.join(['%s'] * len(deltas))
+        sql = (
+            f'UPDATE {table} SET {column} = {column} + CASE {pk} {whens} ELSE 0 END '
+            f'WHERE {pk} IN ({placeholders}) RETURNING {pk}, {column}'
+        )
+        params = [value for item in deltas.items() for value in item] + list(deltas)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
 
-    before = elo_profile.elo
-    after = before + delta
+    users = User.objects.filter(id__in=deltas)
+    users.update(elo_rating=Case(
+        *[When(id=user_id, then=F('elo_rating') + delta) for user_id, delta in deltas.items()],
+        default=F('elo_rating'),
+    ))
+    return dict(users.values_list('id', 'elo_rating'))
 
-    elo_profile.elo = after
-    elo_profile.save()
 
-    EloHistory.objects.create(
-        user=user,
-        elo_before=before,
-        elo_after=after,
-        change=delta
+def sync_user_elo(ratings, glicko=None):
+    """
+    Chép ELO (giá trị của User.elo_rating) sang UserElo bằng một upsert.
+    glicko: user_id -> (rating_deviation, volatility), ghi kèm nếu có.
+    """
+    rows = [UserElo(user_id=user_id, elo=elo) for user_id, elo in ratings.items()]
+    update_fields = ['elo', 'updated_at']
+    if glicko:
+        for row in rows:
+            row.rating_deviation, row.volatility = glicko[row.user_id]
+        update_fields += ['rating_deviation', 'volatility']
+    UserElo.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=update_fields,
     )
 
+
+@transaction.atomic
+def apply_elo_deltas(deltas, record_history=True):
+    """
+    Nơi duy nhất cộng / trừ ELO. deltas: user_id -> thay đổi.
+    User.elo_rating là nguồn dữ liệu; UserElo, EloHistory (nếu record_history)
+    và chỉ mục Redis được cập nhật theo trong cùng transaction.
+    Trả về {user_id: (elo_before, elo_after)}; user không tồn tại bị bỏ qua.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+    afters = _add_to_ratings(deltas)
+    sync_user_elo(afters)
+    if record_history:
+        EloHistory.objects.bulk_create([
+            EloHistory(user_id=user_id, elo_before=after - deltas[user_id], elo_after=after, change=deltas[user_id])
+            for user_id, after in afters.items()
+        ])
+    ranking.set_ratings_on_commit(afters)
+    return {user_id: (after - deltas[user_id], after) for user_id, after in afters.items()}
+
+
+@transaction.atomic
+def set_elo(ratings, glicko=None):
+    """
+    Đặt ELO tuyệt đối (seed, tính lại theo rating period) cho cả User và
+    UserElo, không ghi EloHistory. glicko: xem sync_user_elo.
+    """
+    if not ratings:
+        return
+    User.objects.filter(id__in=ratings).update(elo_rating=Case(
+        *[When(id=user_id, then=Value(elo)) for user_id, elo in ratings.items()],
+        default=F('elo_rating'),
+    ))
+    sync_user_elo(ratings, glicko)
+    ranking.set_ratings_on_commit(ratings)
+
+
+def update_elo(user, delta):
+    before, after = apply_elo_deltas({user.id: delta}).get(user.id, (user.elo_rating, user.elo_rating))
+    user.elo_rating = after
+    return before, after
+
+
 def get_top_users(limit=3):
-    return (
-        UserElo.objects
-        .select_related("user")
-        .order_by("-elo")[:limit]
-    )
\ No newline at end of file
+    """Top ELO cho trang chủ, đọc từ chỉ mục Redis (fallback: bảng UserElo)."""
+    try:
+        entries = ranking.get_page(1, limit)
+    except Exception as e:
+        logger.warning(f"Leaderboard index unavailable: {e}")
+        entries = None
+    if entries is None:
+        return (
+            UserElo.objects
+            .select_related("user")
+            .order_by("-elo")[:limit]
+        )
+    users = User.objects.in_bulk([user_id for _, user_id, _ in entries])
+    return [
+        {"user": users[user_id], "elo": elo}
+        for _, user_id, elo in entries if user_id in users
+    ]
+
+
+def pvp_outcome(score, scores):
+    """Kết quả của một người trong trận PvP: thấp hơn điểm cao nhất là thua, cao nhất duy nhất là thắng."""
+    top = max(scores)
+    if score < top:
+        return UserMatchStats.LOSS
+    return UserMatchStats.WIN if scores.count(top) == 1 else UserMatchStats.DRAW
+
+
+@transaction.atomic
+def record_match_results(results):
+    """
+    Cộng kết quả trận vào UserMatchStats. results: [(user_id, mode, outcome), ...]
+    theo thứ tự thời gian. Các dòng được khoá (SELECT ... FOR UPDATE, theo id
+    để tránh deadlock) nên streak đúng khi nhiều trận kết thúc cùng lúc.
+    """
+    if not results:
+        return
+    keys = {(user_id, mode) for user_id, mode, _ in results}
+    UserMatchStats.objects.bulk_create(
+        [UserMatchStats(user_id=user_id, mode=mode) for user_id, mode in keys],
+        ignore_conflicts=True,
+    )
+    rows = (
+        UserMatchStats.objects
+        .filter(user_id__in={user_id for user_id, _ in keys}, mode__in={mode for _, mode in keys})
+        .select_for_update()
+        .order_by('id')
+    )
+    stats = {(row.user_id, row.mode): row for row in rows}
+    for user_id, mode, outcome in results:
+        stats[(user_id, mode)].apply(outcome)
+    now = timezone.now()
+    for key in keys:
+        stats[key].updated_at = now  # bulk_update không chạy auto_now
+    UserMatchStats.objects.bulk_update(
+        [stats[key] for key in keys],
+        ['wins', 'losses', 'draws', 'current_streak', 'best_win_streak', 'updated_at'],
+    )
+
+
+def match_stats_many(user_ids, mode=None):
+    """user_id -> {'wins', 'losses', 'draws', 'total_matches'} cộng qua các chế độ (hoặc một chế độ)."""
+    totals = {user_id: {'wins': 0, 'losses': 0, 'draws': 0, 'total_matches': 0} for user_id in user_ids}
+    rows = UserMatchStats.objects.filter(user_id__in=user_ids)
+    if mode:
+        rows = rows.filter(mode=mode)
+    for row in rows:
+        total = totals[row.user_id]
+        total['wins'] += row.wins
+        total['losses'] += row.losses
+        total['draws'] += row.draws
+        total['total_matches'] += row.total
+    return totals
+
+
+def win_rate(wins, total):
+    return round((wins / total * 100), 2) if total > 0 else 0
+
+
+def ranked_page(page=1, per_page=100):
+    """[(rank, user_id, elo), ...] từ chỉ mục Redis; fallback ORDER BY trên DB."""
+    try:
+        entries = ranking.get_page(page, per_page)
+        if entries is not None:
+            return entries
+    except Exception as e:
+        logger.warning(f"Leaderboard index unavailable: {e}")
+
+    start = (page - 1) * per_page
+    rows = (
+        User.objects.filter(elo_rating__gt=0)
+        .order_by('-elo_rating', 'id')
+        .values_list('id', 'elo_rating')[start:start + per_page]
+    )
+    return [(start + i + 1, user_id, elo) for i, (user_id, elo) in enumerate(rows)]
+
+
+def ranked_count():
+    try:
+        total = ranking.count()
+        if total is not None:
+            return total
+    except Exception as e:
+        logger.warning(f"Leaderboard index unavailable: {e}")
+    return User.objects.filter(elo_rating__gt=0).count()
+
+
+def leaderboard_rows(entries):
+    """
+    Thêm thống kê trận và tiến độ học cho các entry (rank, user_id, elo):
+    ba query cho cả trang (user, UserMatchStats, tiến độ GROUP BY user).
+    """
+    user_ids = [user_id for _, user_id, _ in entries]
+    users = User.objects.in_bulk(user_ids)
+    stats = match_stats_many(user_ids)
+    progress = get_learning_progress_many(user_ids)
+
+    return [
+        {
+            "rank": rank,
+            "user": users[user_id],
+            "elo": elo,
+            **stats[user_id],
+            "win_rate": win_rate(stats[user_id]['wins'], stats[user_id]['total_matches']),
+            "progress": progress[user_id],
+        }
+        for rank, user_id, elo in entries if user_id in users
+    ]
+
+
+def get_leaderboard(page=1, per_page=100):
+    return leaderboard_rows(ranked_page(page, per_page))
+
+
+def get_user_rank(user_id, radius=5):
+    """(hạng của user, các dòng leaderboard quanh user); (None, []) nếu chưa xếp hạng."""
+    try:
+        entries = ranking.get_around(user_id, radius)
+    except Exception as e:
+        logger.warning(f"Leaderboard index unavailable: {e}")
+        return None, []
+    if not entries:
+        return None, []
+    rank = next((rank for rank, uid, _ in entries if uid == user_id), None)
+    return rank, leaderboard_rows(entries)
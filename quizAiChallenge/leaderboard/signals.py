@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from . import ranking
 from .models import UserElo
 
 User = get_user_model()
@@ -8,4 +9,10 @@ User = get_user_model()
 @receiver(post_save, sender=User)
 def create_user_elo(sender, instance, created, **kwargs):
     if created:
-        UserElo.objects.create(user = instance)
\ No newline at end of file
+        UserElo.objects.create(user = instance)
+        ranking.set_ratings_on_commit({instance.id: instance.elo_rating})
+
+
+@receiver(post_delete, sender=User)
+def remove_user_rank(sender, instance, **kwargs):
+    ranking.remove_user(instance.id)
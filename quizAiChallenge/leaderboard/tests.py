@@ -1,3 +1,153 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
+import fakeredis
+from django.test import SimpleTestCase, TestCase
+from accounts.models import User
+from leaderboard.models import EloHistory, UserMatchStats
+from leaderboard import ranking
+from leaderboard.ranking import elo_from_score, score_for
+from leaderboard.rating import EloEngine, Glicko2Engine, RatingState, np
+from leaderboard.services import (
+    apply_elo_deltas, get_leaderboard, pvp_outcome, ranked_count, ranked_page, record_match_results,
+    update_elo,
+)
 
-# Create your tests here.
+
+class LeaderboardQueryTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='x', elo_rating=1100)
+        self.bob = User.objects.create_user(username='bob', password='x', elo_rating=1000)
+        record_match_results([
+            (self.alice.id, UserMatchStats.MODE_AI, outcome) for outcome in ('win', 'win', 'loss')
+        ] + [(self.alice.id, UserMatchStats.MODE_PVP, 'draw')])
+
+    @mock.patch('leaderboard.services.ranking.get_page', return_value=None)
+    def test_constant_queries_and_counts(self, get_page):
+        # Chỉ mục Redis chưa dựng: xếp hạng từ DB, vẫn số query cố định
+        with self.assertNumQueries(4):
+            board = get_leaderboard(1, 100)
+
+        alice, bob = board
+        self.assertEqual((alice['rank'], alice['user'], bob['user']), (1, self.alice, self.bob))
+        self.assertEqual(
+            (alice['wins'], alice['losses'], alice['draws'], alice['total_matches']), (2, 1, 1, 4)
+        )
+        self.assertEqual(alice['win_rate'], 50.0)
+        self.assertEqual(bob['total_matches'], 0)
+        self.assertEqual(bob['progress'], {'total': 0, 'complete': 0, 'percent': 0})
+
+    @mock.patch('leaderboard.services.ranking.get_page')
+    def test_page_from_index(self, get_page):
+        get_page.return_value = [(101, self.bob.id, 1000)]
+        with self.assertNumQueries(3):
+            board = get_leaderboard(2, 100)
+        self.assertEqual([(row['rank'], row['user']) for row in board], [(101, self.bob)])
+
+
+class RankingIndexTest(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        patcher = mock.patch('leaderboard.ranking.get_sync_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_users(self, *ratings):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [
+                User.objects.create_user(username=f'user{elo}', password='x', elo_rating=elo)
+                for elo in ratings
+            ]
+
+    def test_unbuilt_index_falls_back_to_db(self):
+        old, new = self.create_users(1200, 900)
+        # Signal của user mới không được tạo ra một chỉ mục chỉ có vài user
+        self.assertIsNone(ranking.get_page())
+        self.assertIsNone(ranking.count())
+        self.assertEqual(ranked_page(1, 10), [(1, old.id, 1200), (2, new.id, 900)])
+        self.assertEqual(ranked_count(), 2)
+
+    def test_built_index_takes_updates(self):
+        alice, bob = self.create_users(1000, 1100)
+        self.assertEqual(ranking.rebuild(), 2)
+        (carol,) = self.create_users(1050)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_elo(alice, 200)
+
+        self.assertEqual(
+            ranking.get_page(1, 10), [(1, alice.id, 1200), (2, bob.id, 1100), (3, carol.id, 1050)]
+        )
+        self.assertEqual(ranked_count(), 3)
+
+
+class UserMatchStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carol', password='x')
+
+    def test_streaks_accumulate_across_calls(self):
+        outcomes = ['win', 'win', 'win', 'loss', 'loss', 'draw', 'win']
+        record_match_results([(self.user.id, UserMatchStats.MODE_AI, o) for o in outcomes[:4]])
+        record_match_results([(self.user.id, UserMatchStats.MODE_AI, o) for o in outcomes[4:]])
+
+        stats = UserMatchStats.objects.get(user=self.user, mode=UserMatchStats.MODE_AI)
+        self.assertEqual((stats.wins, stats.losses, stats.draws, stats.total), (4, 2, 1, 7))
+        self.assertEqual((stats.current_streak, stats.best_win_streak), (1, 3))
+
+    def test_pvp_outcome(self):
+        self.assertEqual(pvp_outcome(5, [5, 3, 1]), 'win')
+        self.assertEqual(pvp_outcome(3, [5, 3, 1]), 'loss')
+        self.assertEqual(pvp_outcome(5, [5, 5, 1]), 'draw')
+
+
+class ApplyEloDeltasTest(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='x')
+        self.bob = User.objects.create_user(username='bob', password='x')
+
+    def test_deltas_stack_on_stale_instances(self):
+        stale = User.objects.get(id=self.alice.id)
+        update_elo(self.alice, 30)
+        # Instance cũ vẫn ELO 1000: cộng ở DB nên không mất lần cộng trước
+        self.assertEqual(update_elo(stale, -20), (1030, 1010))
+
+        changes = apply_elo_deltas({self.alice.id: 5, self.bob.id: -5, 0: 10})
+        self.assertEqual(changes, {self.alice.id: (1010, 1015), self.bob.id: (1000, 995)})
+
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.elo_rating, self.alice.elo_profile.elo), (1015, 1015))
+        self.assertEqual(
+            list(EloHistory.objects.filter(user=self.alice).order_by('id').values_list('change', flat=True)),
+            [30, -20, 5],
+        )
+
+
+class RankingScoreTest(SimpleTestCase):
+    def test_score_orders_by_elo_then_user_id(self):
+        scores = {uid: score_for(uid, elo) for uid, elo in ((1, 1000), (2, 1000), (3, 1200))}
+        self.assertEqual(sorted(scores, key=scores.get, reverse=True), [3, 1, 2])
+        self.assertEqual(elo_from_score(scores[2]), 1000)
+        self.assertEqual(elo_from_score(float(score_for(999999, 2345))), 2345)
+
+
+class RatingEngineTest(SimpleTestCase):
+    def test_elo_uses_expected_score(self):
+        engine = EloEngine(k_factor=32)
+        self.assertEqual(engine.match_deltas([1000, 1000], [10, 20]), [-16, 16])
+        self.assertEqual(engine.match_deltas([1016, 984], [30, 20]), [15, -15])
+        # Hoà với người rating thấp hơn thì mất điểm
+        self.assertEqual(engine.match_deltas([1200, 1000], [5, 5]), [-8, 8])
+        self.assertEqual(engine.match_deltas([1000, 1000, 1000], [30, 20, 10]), [16, 0, -16])
+
+    @skipUnless(np is not None, "NumPy not installed")
+    def test_glicko2_matches_reference_example(self):
+        # Ví dụ trong bài của Glickman: 1500 / RD 200 gặp 1400, 1550, 1700
+        state = RatingState(
+            np.array([1500.0, 1400, 1550, 1700]), np.array([200.0, 30, 100, 300]), np.full(4, 0.06)
+        )
+        new = Glicko2Engine(tau=0.5).rate_period(
+            state, np.array([0, 0, 0]), np.array([1, 2, 3]), np.array([1.0, 0, 0]), np.ones(3)
+        )
+        self.assertAlmostEqual(new.rating[0], 1464.06, places=1)
+        self.assertAlmostEqual(new.rd[0], 151.52, places=1)
+        self.assertAlmostEqual(new.volatility[0], 0.059996, places=6)
+        # Không đánh trận nào: rating giữ nguyên, RD tăng
+        self.assertEqual(new.rating[3], 1700)
+        self.assertGreater(new.rd[3], 300)
@@ -1,49 +1,33 @@
 from django.shortcuts import render
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from .models import UserElo, EloHistory
-from learning_path.services.progress_service import get_learning_progress
-from quiz_ai_battle.models import Match
+from .models import EloHistory
+from .services import get_leaderboard, get_user_rank, match_stats_many, ranked_count, win_rate
 
-User = get_user_model()
+PER_PAGE = 100
 
 # Create your views here.
 def leaderboard_view(req):
-    """Display ELO leaderboard"""
-    leaderboard = []
+    """Display ELO leaderboard (phân trang, kèm hạng của user đang đăng nhập)"""
+    try:
+        page = max(1, int(req.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    total = ranked_count()
+    num_pages = max(1, (total + PER_PAGE - 1) // PER_PAGE)
+    page = min(page, num_pages)
 
-    # Get top users by ELO rating
-    top_users = User.objects.filter(
-        elo_rating__gt=0
-    ).order_by("-elo_rating")[:100]
-
-    for rank, user in enumerate(top_users, 1):
-        try:
-            progress = get_learning_progress(user)
-        except:
-            progress = {}
-        
-        # Get match stats
-        user_matches = Match.objects.filter(user=user)
-        wins = len([m for m in user_matches if m.result == 'win'])
-        losses = len([m for m in user_matches if m.result == 'loss'])
-        draws = len([m for m in user_matches if m.result == 'draw'])
-        total_matches = user_matches.count()
-        
-        leaderboard.append({
-            "rank": rank,
-            "user": user,
-            "elo": user.elo_rating,
-            "wins": wins,
-            "losses": losses,
-            "draws": draws,
-            "total_matches": total_matches,
-            "win_rate": round((wins / total_matches * 100), 2) if total_matches > 0 else 0,
-            "progress": progress
-        })
+    my_rank, around_me = (None, [])
+    if req.user.is_authenticated:
+        my_rank, around_me = get_user_rank(req.user.id)
 
     return render(req, "leaderboard/leaderboard.html", {
-        "leaderboard": leaderboard
+        "leaderboard": get_leaderboard(page, PER_PAGE),
+        "page": page,
+        "num_pages": num_pages,
+        "previous_page": page - 1 if page > 1 else None,
+        "next_page": page + 1 if page < num_pages else None,
+        "my_rank": my_rank,
+        "around_me": around_me,
     })
 
 
@@ -56,11 +40,9 @@ def user_elo_history(request):
     ).order_by('-created_at')[:50]
     
     # Get current stats
-    user_matches = Match.objects.filter(user=request.user)
-    wins = len([m for m in user_matches if m.result == 'win'])
-    losses = len([m for m in user_matches if m.result == 'loss'])
-    draws = len([m for m in user_matches if m.result == 'draw'])
-    
+    stats = match_stats_many([request.user.id])[request.user.id]
+    wins, losses, draws = stats['wins'], stats['losses'], stats['draws']
+
     return render(request, 'leaderboard/user_elo_history.html', {
         'user': request.user,
         'elo_rating': request.user.elo_rating,
@@ -70,6 +52,6 @@ def user_elo_history(request):
             'losses': losses,
             'draws': draws,
             'total': wins + losses + draws,
-            'win_rate': round((wins / (wins + losses + draws) * 100), 2) if (wins + losses + draws) > 0 else 0
+            'win_rate': win_rate(wins, wins + losses + draws)
         }
     })
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.utils import timezone
+from django.db.models import Count, Q
 from learning_path.models import LearningPathItem
 from common.constants import LearningPathItemStatus
 from django.db import transaction
@@ -56,4 +57,28 @@ def get_learning_progress(user):
         "total": total,
         "complete": completed,
         "percent": percent 
-    }
\ No newline at end of file
+    }
+
+
+def get_learning_progress_many(user_ids):
+    """
+    Như get_learning_progress nhưng cho nhiều user bằng một query GROUP BY.
+    Trả về dict user_id -> progress (user không có lộ trình thì total = 0).
+    """
+    rows = (
+        LearningPathItem.objects
+        .filter(path__user_id__in=user_ids, path__is_active=True)
+        .values('path__user_id')
+        .annotate(
+            total=Count('id'),
+            complete=Count('id', filter=Q(status=LearningPathItemStatus.COMPLETED)),
+        )
+    )
+    progress = {user_id: {"total": 0, "complete": 0, "percent": 0} for user_id in user_ids}
+    for row in rows:
+        progress[row['path__user_id']] = {
+            "total": row['total'],
+            "complete": row['complete'],
+            "percent": int((row['complete'] / row['total']) * 100),
+        }
+    return progress
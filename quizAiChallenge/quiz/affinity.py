@@ -0,0 +1,23 @@
+"""
+Room affinity: mọi socket của một room (người chơi, khán giả) kết nối tới
+cùng một node Daphne trong settings.QUIZ_WS_NODES, chọn bằng consistent
+hashing theo room code. Node đó nhận action đầu tiên nên giữ lease của game
+loop (quiz.game_loop), action và event của room không phải đi qua inbox của
+worker khác; thêm node chỉ chuyển khoảng 1/N room.
+"""
+from functools import lru_cache
+from django.conf import settings
+from common.hashring import HashRing
+
+
+@lru_cache(maxsize=1)
+def _ring(nodes):
+    return HashRing(nodes)
+
+
+def room_ws_host(code):
+    """Host websocket cho room, hoặc '' để client dùng host của trang."""
+    nodes = tuple(getattr(settings, 'QUIZ_WS_NODES', ()))
+    if not nodes:
+        return ''
+    return _ring(nodes).get_node(code)
@@ -1,213 +1,64 @@
 import json
-import asyncio
 import logging
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Room, Question
-from accounts.models import User
-import redis.asyncio as redis
-from redis.asyncio.lock import Lock as RedisLock
-from leaderboard.services import update_elo
+from django.urls import reverse
+from .game_loop import registry, load_question_payloads
+from .lobby import LOBBY_GROUP, lobby_rooms_async
+from .matchmaking import matchmaker
+from .protocol import negotiate, public_question
+from .room_state import store
+from .spectators import hub
+from . import services
 
 logger = logging.getLogger(__name__)
 
 class QuizConsumer(AsyncWebsocketConsumer):
-    redis_client = None
-    
-    @classmethod
-    async def get_redis(cls):
-        if cls.redis_client is None:
-            cls.redis_client = await redis.from_url(
-                'redis://localhost:6379',
-                encoding='utf-8',
-                decode_responses=True
-            )
-        return cls.redis_client
-
-    def state_key(self, code):
-        return f'quiz:room:{code}'
-    
-    def lock_key(self, code):
-        return f'quiz:lock:{code}'
-    
-    async def get_state(self, code):
-        redis_conn = await self.get_redis()
-        data = await redis_conn.get(self.state_key(code))
-        if data:
-            state = json.loads(data)
-            state.setdefault('active_players', [])
-            state.setdefault('used_questions', [])
-            state.setdefault('channel_to_user', {})
-            state.setdefault('last_results_ack', [])
-            return state
-        return None
-    
-    async def set_state(self, code, state, ttl=3600):
-        redis_conn = await self.get_redis()
-        state_copy = state.copy()
-        if 'last_results_ack' in state_copy and isinstance(state_copy['last_results_ack'], set):
-            state_copy['last_results_ack'] = list(state_copy['last_results_ack'])
-        await redis_conn.setex(self.state_key(code), ttl, json.dumps(state_copy))
-    
-    async def delete_state(self, code):
-        redis_conn = await self.get_redis()
-        await redis_conn.delete(self.state_key(code))
-    
-    async def get_redis_lock(self, code, timeout=10):
-        redis_conn = await self.get_redis()
-        return RedisLock(redis_conn, self.lock_key(code), timeout=timeout, blocking_timeout=timeout)
-
-    # DB helpers
-    @database_sync_to_async
-    def get_room(self, code):
-        return Room.objects.get(code=code)
-
-    @database_sync_to_async
-    def get_user(self, user_id):
-        return User.objects.get(id=user_id)
+    """
+    Websocket của một người chơi. Consumer không giữ state của room: mọi
+    action được chuyển cho game loop của room (quiz.game_loop), consumer chỉ
+    forward các event mà game loop broadcast xuống client.
+    """
 
     @database_sync_to_async
-    def increment_player_count(self, code):
-        room = Room.objects.get(code=code)
-        room.player_count += 1
-        room.save()
-        return room
-
-    @database_sync_to_async
-    def decrement_player_count(self, code):
-        room = Room.objects.get(code=code)
-        room.player_count = max(0, room.player_count - 1)
-        if room.player_count == 0:
-            room.started = False
-        room.save()
-        return room
-
-    @database_sync_to_async
-    def mark_room_started(self, code):
-        room = Room.objects.get(code=code)
-        room.started = True
-        room.save()
+    def get_room(self, code):
+        return services.get_room(code)
 
-    @database_sync_to_async
-    def mark_room_stopped(self, code):
-        room = Room.objects.get(code=code)
-        room.started = False
-        room.save()
+    async def send_message(self, message):
+        if self.last_seq is not None:
+            message['seq'] = self.last_seq
+        await self.send(**self.codec.encode(message))
 
-    @database_sync_to_async
-    def get_random_unused_question(self, used_ids):
-        qs = Question.objects.exclude(id__in=used_ids)
-        if qs.exists():
-            return qs.order_by('?').first()
-        return Question.objects.order_by('?').first()
-    
-    @database_sync_to_async
-    def get_total_max_score(self, num_questions=10):
-        """Calculate maximum possible score for quiz"""
-        from django.db.models import Sum
-        qs = Question.objects.all()[:num_questions]
-        total = qs.aggregate(total=Sum('score'))['total'] or 0
-        return total
-    
-    def calculate_elo_delta(self, player1_elo, player2_elo, player1_score, player2_score):
+    def sequenced(self, event):
         """
-        Tính toán ELO delta - simple system:
-        Win: +30 ELO
-        Loss: -20 ELO (only for player-vs-player, not for quiz mode)
-        Draw: 0 ELO
+        True nếu event cần được xử lý. Event có seq (quiz.game_loop.LOGGED_EVENTS)
+        tới trước 'join.accepted' được giữ lại để phát sau phần replay; event đã
+        nhận rồi (seq <= last_seq) bị bỏ qua.
         """
-        # Xác định kết quả
-        if player1_score > player2_score:
-            # Player 1 thắng - cộng +30 ELO
-            delta1 = 30
-            delta2 = -20  # Player 2 thua - trừ -20 ELO
-        elif player1_score < player2_score:
-            # Player 2 thắng - cộng +30 ELO
-            delta1 = -20  # Player 1 thua - trừ -20 ELO
-            delta2 = 30
-        else:
-            # Hòa - không ai thay đổi
-            delta1 = 0
-            delta2 = 0
-        
-        return int(delta1), int(delta2)
-    
-    @database_sync_to_async
-    def update_players_elo(self, player1_id, player2_id, player1_score, player2_score):
-        """
-        Cập nhật ELO cho cả 2 người chơi dựa vào kết quả match
-        Also updates User.elo_rating and creates GameHistory record
-        """
-        try:
-            from quiz.models import GameHistory
-            
-            player1 = User.objects.get(id=player1_id)
-            player2 = User.objects.get(id=player2_id)
-            
-            # Lấy ELO hiện tại từ User model (primary source)
-            player1_elo_before = player1.elo_rating
-            player2_elo_before = player2.elo_rating
-            
-            # Tính ELO delta
-            delta1, delta2 = self.calculate_elo_delta(
-                player1_elo_before, player2_elo_before, 
-                player1_score, player2_score
-            )
-            
-            # Cập nhật ELO cho cả 2 người chơi
-            if delta1 != 0:
-                update_elo(player1, delta1)
-                player1.elo_rating += delta1
-                player1.save(update_fields=['elo_rating'])
-            
-            if delta2 != 0:
-                update_elo(player2, delta2)
-                player2.elo_rating += delta2
-                player2.save(update_fields=['elo_rating'])
-            
-            # Tạo GameHistory record (nếu tồn tại)
-            try:
-                from quiz.models import Room
-                room = Room.objects.filter(code=self.code).first()
-                if room:
-                    # Xác định người thắng
-                    winner = None
-                    if player1_score > player2_score:
-                        winner = player1
-                    elif player2_score > player1_score:
-                        winner = player2
-                    
-                    game_history = GameHistory.objects.create(
-                        room=room,
-                        player1=player1,
-                        player2=player2,
-                        player1_score=player1_score,
-                        player2_score=player2_score,
-                        winner=winner,
-                        # ELO tracking
-                        player1_elo_before=player1_elo_before,
-                        player1_elo_after=player1.elo_rating,
-                        player1_elo_change=delta1,
-                        player2_elo_before=player2_elo_before,
-                        player2_elo_after=player2.elo_rating,
-                        player2_elo_change=delta2,
-                        elo_updated=True
-                    )
-                    logger.info(f"GameHistory created: {game_history.id}")
-            except Exception as e:
-                logger.warning(f"Could not create GameHistory: {e}")
-            
-            logger.info(
-                f"ELO Updated - Player1({player1.username}): "
-                f"{player1_elo_before} → {player1.elo_rating} ({delta1:+d}), "
-                f"Player2({player2.username}): "
-                f"{player2_elo_before} → {player2.elo_rating} ({delta2:+d})"
-            )
-            
+        seq = event.get('seq')
+        if seq is None:
             return True
-        except Exception as e:
-            logger.error(f"Error updating ELO: {e}", exc_info=True)
+        if not self.synced:
+            self.buffered.append(event)
+            return False
+        if seq <= self.last_seq:
             return False
+        self.last_seq = seq
+        return True
+
+    async def dispatch_event(self, event):
+        handler = getattr(self, event['type'].replace('.', '_'), None)
+        if handler is not None:
+            await handler(event)
+
+    async def submit(self, action_type, **payload):
+        await registry.submit(self.code, {
+            'type': action_type,
+            'channel': self.channel_name,
+            **payload,
+        })
 
     async def connect(self):
         # Kiểm tra authentication
@@ -219,493 +70,119 @@ class QuizConsumer(AsyncWebsocketConsumer):
         self.user = user
         self.user_id = user.id
         self.username = user.username
-        
+
         self.code = self.scope['url_route']['kwargs']['code']
         self.room_group_name = f'quiz_{self.code}'
+        self.joined = False
+        self.prefetched = {}  # question id -> payload nhận trước qua round.transition
+        # Seq của event cuối client đã nhận; client reconnect gửi lại qua ?last_seq=
+        self.last_seq = self.parse_last_seq()
+        self.synced = False
+        self.buffered = []
+        # JSON hoặc msgpack gọn (quiz.protocol), chọn qua websocket subprotocol
+        self.codec = negotiate(self.scope.get('subprotocols'))
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=self.codec.subprotocol)
 
         try:
-            room = await self.get_room(self.code)
+            await self.get_room(self.code)
         except Exception:
-            await self.send(json.dumps({'type': 'no_room'}))
+            await self.send_message({'type': 'no_room'})
             await self.close()
             return
 
-        if room.started:
-            await self.send(json.dumps({'type': 'error', 'message': 'Match already started'}))
-            await self.close()
-            return
+        # Trận đã bắt đầu: game loop chỉ nhận người trong roster (kể cả khi
+        # không có last_seq, vd. tải lại trang), người khác bị join.rejected
 
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if state is None:
-                state = {
-                    'question': None,
-                    'question_num': 1,
-                    'used_questions': [],
-                    'active_players': [],
-                    'user_snapshot': {},
-                    'answers': {},
-                    'answered_flags': {},
-                    'auto_answered': {},
-                    'channel_to_user': {},
-                    'scores': {},
-                    'timer_running': False,
-                    'processing': False,
-                    'processed': False,
-                    'expected_players': 2,
-                    'last_results_by_user': None,
-                    'last_results_ack': [],
-                }
-
-            # Kiểm tra user đã tồn tại chưa
-            existing_users = set(state['channel_to_user'].values())
-            if self.user_id in existing_users:
-                await self.send(json.dumps({'type': 'error', 'message': 'Bạn đã tham gia phòng này rồi'}))
-                await self.close()
-                return
-
-            # Kiểm tra phòng đầy chưa
-            if len(existing_users) >= 2:
-                await self.send(json.dumps({'type': 'error', 'message': 'Room full'}))
-                await self.close()
-                return
-
-            state['channel_to_user'][self.channel_name] = self.user_id
-            
-            # Khởi tạo score cho user nếu chưa có - sử dụng string key
-            if str(self.user_id) not in state['scores']:
-                state['scores'][str(self.user_id)] = 0
-
-            await self.set_state(self.code, state)
-
-        room = await self.increment_player_count(self.code)
-
-        # Get list of other players already in room
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            other_players = []
-            if state:
-                for ch, uid in state['channel_to_user'].items():
-                    if uid != self.user_id:
-                        try:
-                            other_user = await self.get_user(uid)
-                            other_players.append({
-                                'user_id': uid,
-                                'username': other_user.username
-                            })
-                        except:
-                            pass
+        self.joined = True
+        await self.submit('join', user_id=self.user_id, username=self.username, last_seq=self.last_seq)
 
-        await self.send(json.dumps({
-            'type': 'joined',
-            'user_id': self.user_id,
-            'username': self.username,
-            'player_count': room.player_count,
-            'other_players': other_players,
-        }))
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'player.joined', 
-                'user_id': self.user_id,
-                'username': self.username
-            }
-        )
-
-        # Resend last result on reconnect
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if state and state.get('last_results_by_user'):
-                last = state['last_results_by_user']
-                ack = set(state.get('last_results_ack', []))
-                if str(self.user_id) not in ack:
-                    res = last['results'].get(str(self.user_id), {})
-                    payload = {
-                        'type': 'result',
-                        'message': (f"Time up! Correct: {last.get('correct_answer')}"
-                                    if res.get('timed_out')
-                                    else f"Your answer: {res.get('your_answer')} {'✓' if res.get('is_correct') else '✗'}"),
-                        'scores': last['scores'],
-                        'question_num': last['question_num'],
-                        'correct_answer': last.get('correct_answer')
-                    }
-                    await self.send(json.dumps(payload))
-
-        # Start game when both joined
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if (state and len(state['channel_to_user']) == 2 and state.get('question') is None
-                and not state.get('timer_running') and not state.get('processed')):
-                await self.mark_room_started(self.code)
-                asyncio.create_task(self.send_next_question())
+    def parse_last_seq(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['last_seq'][0])
+        except (KeyError, ValueError):
+            return None
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_group_name'):
+            return
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        await self.decrement_player_count(self.code)
-
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if not state:
-                return
-            state['channel_to_user'].pop(self.channel_name, None)
-            
-            if not state.get('channel_to_user'):
-                await self.set_state(self.code, state)
-                await self.delete_state(self.code)
-                await self.mark_room_stopped(self.code)
-            else:
-                await self.set_state(self.code, state)
+        if self.joined:
+            await self.submit('leave')
 
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError:
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.codec.decode(text_data, bytes_data)
+        if not isinstance(data, dict):
             return
 
-        if data.get('type') != 'answer':
-            return
+        if data.get('type') == 'answer':
+            await self.submit('answer', answer=data.get('answer'))
+        elif data.get('type') == 'start':
+            await self.submit('start', user_id=self.user_id)
 
-        lock = await self.get_redis_lock(self.code)
-        should_stop_timer = False
-        should_process = False
-        
-        async with lock:
-            state = await self.get_state(self.code)
-            if not state:
-                return
-
-            # Player already answered or not in active list
-            if (self.channel_name not in state.get('active_players', [])
-                or state['answered_flags'].get(self.channel_name)):
-                return
-
-            state['answered_flags'][self.channel_name] = True
-            state['answers'][self.channel_name] = data['answer']
-            state['auto_answered'][self.channel_name] = False
-
-            answered_count = sum(1 for ch in state['active_players'] 
-                               if state['answered_flags'].get(ch, False))
-
-            logger.info(f"Player answered: {answered_count}/{state.get('expected_players', 2)} answered for room {self.code}")
-
-            # LAST ANSWER → Immediately stop timer and broadcast
-            if answered_count == state.get('expected_players', 2):
-                if state.get('timer_running'):
-                    state['timer_running'] = False
-                    should_stop_timer = True
-                    logger.info(f"All players answered, stopping timer for room {self.code}")
-
-                # Then process results (after broadcast)
-                if not state.get('processing') and not state.get('processed'):
-                    state['processing'] = True
-                    should_process = True
-
-            await self.set_state(self.code, state)
-
-        # Broadcasts OUTSIDE the lock to avoid deadlocks
-        # 1. Tell all players to stop timer
-        if should_stop_timer:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'stop_timer',
-                    'reason': 'all_answered'
-                }
-            )
-
-        # 2. Notify others that this player has answered
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'player.answered', 
-                'user_id': self.user_id,
-                'username': self.username
-            }
-        )
-
-        # 3. Process answers if all players answered
-        if should_process:
-            asyncio.create_task(self.process_answers())
-
-    async def send_next_question(self):
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if not state:
-                return
-                
-            if state['question_num'] > 10:
-                # Cập nhật ELO cho cả 2 người chơi trước khi kết thúc
-                user_ids = list(state['user_snapshot'].keys())
-                scores = state['scores']
-                
-                logger.info(f"Quiz ended for room {self.code}. User IDs: {user_ids}, Scores: {scores}")
-                
-                if len(user_ids) == 2:
-                    player1_id = int(user_ids[0])
-                    player2_id = int(user_ids[1])
-                    player1_score = int(scores.get(user_ids[0], 0))
-                    player2_score = int(scores.get(user_ids[1], 0))
-                    
-                    logger.info(f"Updating ELO - Player1({player1_id}): {player1_score} pts vs Player2({player2_id}): {player2_score} pts")
-                    
-                    result = await self.update_players_elo(
-                        player1_id, player2_id, 
-                        player1_score, player2_score
-                    )
-                    logger.info(f"ELO update result: {result}")
-                else:
-                    logger.warning(f"Not enough players for ELO update: {len(user_ids)} players")
-                
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'finished', 'scores': state['scores']}
-                )
-                await self.delete_state(self.code)
-                await self.mark_room_stopped(self.code)
-                return
-
-            q = await self.get_random_unused_question(state['used_questions'])
-            if not q:
-                # Cập nhật ELO cho cả 2 người chơi trước khi kết thúc
-                user_ids = list(state['user_snapshot'].keys())
-                scores = state['scores']
-                
-                logger.info(f"No more questions for room {self.code}. User IDs: {user_ids}, Scores: {scores}")
-                
-                if len(user_ids) == 2:
-                    player1_id = int(user_ids[0])
-                    player2_id = int(user_ids[1])
-                    player1_score = int(scores.get(user_ids[0], 0))
-                    player2_score = int(scores.get(user_ids[1], 0))
-                    
-                    logger.info(f"Updating ELO (no more questions) - Player1({player1_id}): {player1_score} pts vs Player2({player2_id}): {player2_score} pts")
-                    
-                    result = await self.update_players_elo(
-                        player1_id, player2_id, 
-                        player1_score, player2_score
-                    )
-                    logger.info(f"ELO update result: {result}")
-                else:
-                    logger.warning(f"Not enough players for ELO update: {len(user_ids)} players")
-                
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'finished', 'scores': state['scores']}
-                )
-                await self.delete_state(self.code)
-                await self.mark_room_stopped(self.code)
-                return
-
-            state['question'] = {
-                'id': q.id, 
-                'correct': getattr(q, 'correct', None),
-                'score': getattr(q, 'score', 0),
-                'explanation': getattr(q, 'explanation', '')
-            }
-            state['used_questions'].append(q.id)
-            state['active_players'] = list(state['channel_to_user'].keys())
-
-            # Snapshot user_id và username
-            snapshot = {}
-            for ch, user_id in state['channel_to_user'].items():
-                try:
-                    user = await self.get_user(user_id)
-                    snapshot[str(user_id)] = {
-                        'channel': ch,
-                        'username': user.username
-                    }
-                except Exception as e:
-                    logger.error(f"Snapshot error for user {user_id}: {e}")
-                    pass
-            state['user_snapshot'] = snapshot
-            logger.info(f"Snapshot created with {len(snapshot)} users: {list(snapshot.keys())}")
-
-            state['answers'] = {ch: None for ch in state['active_players']}
-            state['answered_flags'] = {ch: False for ch in state['active_players']}
-            state['auto_answered'] = {ch: False for ch in state['active_players']}
-            state['processed'] = False
-            state['processing'] = False
-            state['timer_running'] = True
-
-            question_payload = q.as_dict() if hasattr(q, 'as_dict') else {
-                'text': q.text, 
-                'a': q.a, 
-                'b': q.b, 
-                'c': q.c, 
-                'd': q.d,
-                'score': getattr(q, 'score', 0),
-                'explanation': getattr(q, 'explanation', '')
-            }
-
-            await self.set_state(self.code, state)
-
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'start',
-                    'question': question_payload,
-                    'question_num': state['question_num'],
-                    'timer': 30,
-                }
-            )
-
-        asyncio.create_task(self.start_timer())
-
-    async def start_timer(self):
-        await asyncio.sleep(30)
-
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if not state or not state.get('timer_running'):
-                logger.info(f"Timer already stopped for room {self.code}")
-                return
-
-            logger.info(f"Timer expired for room {self.code}, auto-answering remaining players")
-            # Only auto-answer if still not answered
-            for ch in state['active_players']:
-                if not state['answered_flags'].get(ch, False):
-                    state['answered_flags'][ch] = True
-                    state['auto_answered'][ch] = True
-                    state['answers'][ch] = None
-
-            # Count how many have answered after auto-answering
-            answered_count = sum(1 for ch in state['active_players'] 
-                               if state['answered_flags'].get(ch, False))
-            
-            logger.info(f"After timeout: {answered_count}/{state.get('expected_players', 2)} answered")
-            
-            # Stop timer and process if all answered
-            state['timer_running'] = False
-            
-            if answered_count == state.get('expected_players', 2):
-                if not state.get('processing') and not state.get('processed'):
-                    state['processing'] = True
-                    await self.set_state(self.code, state)
-                    asyncio.create_task(self.process_answers())
-                else:
-                    await self.set_state(self.code, state)
-            else:
-                # This shouldn't happen in a 2-player game, but handle it
-                await self.set_state(self.code, state)
-
-    async def process_answers(self):
-        lock = await self.get_redis_lock(self.code)
-        async with lock:
-            state = await self.get_state(self.code)
-            if not state or state.get('processed'):
-                return
-
-            state['processed'] = True
-            state['processing'] = False
-
-            q = state.get('question')
-            if not q:
-                await self.set_state(self.code, state)
-                return
-            correct = q.get('correct')
-            question_score = q.get('score', 0)
-            explanation = q.get('explanation', '')
-
-            results_by_user = {}
-            results_by_channel = {}
-            snapshot = state.get('user_snapshot', {})
-
-            for user_id_str, user_data in snapshot.items():
-                ch = user_data.get('channel')
-                username = user_data.get('username')
-
-                ans = state['answers'].get(ch)
-                timed_out = state['auto_answered'].get(ch, False)
-                is_correct = (ans == correct and not timed_out and correct is not None)
-
-                points_earned = 0
-                if is_correct:
-                    points_earned = question_score
-                    state['scores'][user_id_str] = state['scores'].get(user_id_str, 0) + points_earned
-
-                res = {
-                    'your_answer': ans,
-                    'is_correct': is_correct,
-                    'timed_out': timed_out,
-                    'username': username,
-                    'points_earned': points_earned,
-                    'explanation': explanation if not is_correct else None
-                }
-                results_by_user[user_id_str] = res
-                if ch:
-                    results_by_channel[ch] = res
-
-            state['last_results_by_user'] = {
-                'results': results_by_user,
-                'correct_answer': correct,
-                'scores': dict(state['scores']),
-                'question_num': state['question_num'],
-                'explanation': explanation
-            }
-            state['last_results_ack'] = []
-            state['question_num'] += 1
-            await self.set_state(self.code, state)
-
-        # Send result outside lock
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'show.result',
-                'results_by_user': results_by_user,
-                'results_by_channel': results_by_channel,
-                'correct_answer': correct,
-                'explanation': explanation,
-                'scores': state['scores'],
-                'question_num': state['question_num'] - 1
-            }
-        )
-        
-        # Also send stop_timer to ensure all clients stop their timers
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'stop_timer',
-                'reason': 'results_shown'
-            }
-        )
-        
-        # Wait for player to read explanation and results (5 seconds)
-        logger.info(f"Waiting for players to read results for room {self.code}")
-        await asyncio.sleep(5)
-        
-        await self.send_next_question()
-
-    async def show_result(self, event):
-        results_by_channel = event.get('results_by_channel', {})
+    async def join_accepted(self, event):
+        # Game loop chỉ đánh dấu resumed khi trận đang diễn ra; ngược lại
+        # last_seq của client (vd. của phòng cũ cùng code) không còn giá trị
+        resumed_from = self.last_seq if event.get('resumed') else None
+        if resumed_from is None:
+            self.last_seq = event.get('seq', 0)
+
+        await self.send_message({
+            'type': 'joined',
+            'user_id': self.user_id,
+            'username': self.username,
+            'player_count': event.get('player_count'),
+            'max_players': event.get('max_players', 2),
+            'is_owner': event.get('is_owner', False),
+            'other_players': event.get('other_players', []),
+            'resumed': event.get('resumed', False),
+            # Client tính lệch đồng hồ từ đây; server_time trong event phát lại đã cũ
+            'server_time': int(time.time() * 1000),
+        })
+
+        # Phát lại các event bị lỡ từ log của room, rồi các event tới trong lúc chờ
+        self.synced = True
+        if resumed_from is not None and event.get('seq', 0) > resumed_from:
+            for missed in await store.read_events(self.code, resumed_from, event['seq']):
+                await self.dispatch_event(missed)
+        buffered, self.buffered = self.buffered, []
+        for pending in buffered:
+            await self.dispatch_event(pending)
+
+    async def join_rejected(self, event):
+        # Game loop không nhận người chơi này nên không cần gửi 'leave'
+        self.joined = False
+        await self.send_message({'type': 'error', 'message': event.get('message')})
+        await self.close()
+
+    async def round_transition(self, event):
+        if not self.sequenced(event):
+            return
         results_by_user = event.get('results_by_user', {})
         correct_answer = event.get('correct_answer')
-        explanation = event.get('explanation', '')
-        scores = event.get('scores')
-        question_num = event.get('question_num')
 
         base_payload = {
             'type': 'result',
-            'scores': scores,
-            'question_num': question_num,
+            'scores': event.get('scores'),
+            'question_num': event.get('question_num'),
             'correct_answer': correct_answer,
-            'explanation': explanation
+            'explanation': event.get('explanation', ''),
+            'histogram': event.get('histogram', {}),
         }
 
-        sent = False
-        user_id = getattr(self, 'user_id', None)
+        next_question = public_question(event.get('next_question'))
+        if next_question:
+            self.prefetched = {next_question['id']: next_question}
+            if self.codec.prefetch_questions:
+                # Client gọn nhận trước câu hỏi kế tiếp, 'start' chỉ gửi id
+                base_payload['next_question'] = next_question
+
+        r = results_by_user.get(str(self.user_id))
+        if self.codec.prefetch_questions:
+            base_payload['result'] = r
 
-        r = results_by_channel.get(self.channel_name)
         if r:
             if r.get('timed_out'):
                 msg = f"Time up! Correct: {correct_answer}"
@@ -713,99 +190,142 @@ class QuizConsumer(AsyncWebsocketConsumer):
                 msg = f"Your answer: {r.get('your_answer')} ✓ (+{r.get('points_earned', 0)} points)"
             else:
                 msg = f"Your answer: {r.get('your_answer')} ✗"
-            await self.send(json.dumps({**base_payload, 'message': msg}))
-            sent = True
-
-        if not sent and user_id:
-            try:
-                lock = await self.get_redis_lock(self.code)
-                async with lock:
-                    state = await self.get_state(self.code)
-                    if state:
-                        current_user_id = state['channel_to_user'].get(self.channel_name)
-                        if not current_user_id:
-                            snapshot = state.get('user_snapshot', {})
-                            for uid, data in snapshot.items():
-                                if data.get('channel') == self.channel_name:
-                                    current_user_id = uid
-                                    break
-
-                        if current_user_id and str(current_user_id) in results_by_user:
-                            r2 = results_by_user[str(current_user_id)]
-                            if r2.get('timed_out'):
-                                msg = f"Time up! Correct: {correct_answer}"
-                            elif r2.get('is_correct'):
-                                msg = f"Your answer: {r2.get('your_answer')} ✓ (+{r2.get('points_earned', 0)} points)"
-                            else:
-                                msg = f"Your answer: {r2.get('your_answer')} ✗"
-                            await self.send(json.dumps({**base_payload, 'message': msg}))
-                            sent = True
-            except Exception as e:
-                logger.error(f"User lookup error: {e}")
-
-        if not sent:
-            await self.send(json.dumps({**base_payload, 'message': 'Kết quả đã cập nhật'}))
-
-        if user_id:
-            try:
-                lock = await self.get_redis_lock(self.code)
-                async with lock:
-                    state = await self.get_state(self.code)
-                    if state:
-                        ack = set(state.get('last_results_ack', []))
-                        ack.add(str(user_id))
-                        state['last_results_ack'] = list(ack)
-                        await self.set_state(self.code, state)
-            except Exception as e:
-                logger.error(f"Ack failed: {e}")
+        else:
+            msg = 'Kết quả đã cập nhật'
+        # Client dừng timer khi nhận 'result', không cần frame stop_timer riêng
+        await self.send_message({**base_payload, 'message': msg})
+
+        try:
+            await store.ack_result(self.code, self.user_id)
+        except Exception as e:
+            logger.error(f"Ack failed: {e}")
 
     async def start(self, event):
-        await self.send(json.dumps({
+        if not self.sequenced(event):
+            return
+        question = event.get('question') or self.prefetched.pop(event['question_id'], None)
+        if question is None:
+            # Consumer không nhận được round.transition trước đó (vd. vừa kết nối)
+            question = (await load_question_payloads([event['question_id']])).get(event['question_id'])
+        await self.send_message({
             'type': 'start',
-            'question': event['question'],
+            'question': public_question(question),
             'question_num': event['question_num'],
-            'timer': event['timer']
-        }))
+            'timer': event['timer'],
+            'deadline': event.get('deadline'),
+        })
 
     async def finished(self, event):
-        scores = event.get('scores', {})
-        
-        # Convert scores để gửi kèm username
-        scores_with_names = {}
-        for user_id, score in scores.items():
-            try:
-                user = await self.get_user(int(user_id))
-                scores_with_names[user.username] = score
-            except:
-                scores_with_names[f'User {user_id}'] = score
-        
-        # Tính tổng điểm tối đa có thể
-        total_max_score = await self.get_total_max_score()
-        
-        await self.send(json.dumps({
-            'type': 'finished', 
-            'scores': scores,
-            'scores_with_names': scores_with_names,
-            'total_max_score': total_max_score,
+        if not self.sequenced(event):
+            return
+        await self.send_message({
+            'type': 'finished',
+            'scores': event.get('scores', {}),
+            'scores_with_names': event.get('scores_with_names', {}),
+            'total_max_score': event.get('total_max_score', 0),
             'message': 'Quiz completed! Final scores:'
-        }))
+        })
 
     async def player_answered(self, event):
-        await self.send(json.dumps({
-            'type': 'player_answered', 
+        if not self.sequenced(event):
+            return
+        await self.send_message({
+            'type': 'player_answered',
+            'user_id': event.get('user_id'),
+            'username': event.get('username'),
+            'answered_count': event.get('answered_count'),
+            'active_count': event.get('active_count'),
+        })
+
+    async def player_joined(self, event):
+        if not self.sequenced(event):
+            return
+        await self.send_message({
+            'type': 'player_joined',
             'user_id': event.get('user_id'),
             'username': event.get('username')
-        }))
+        })
+
+
+class MatchmakingConsumer(AsyncWebsocketConsumer):
+    """
+    Kết nối = đứng trong hàng chờ ghép cặp theo ELO, ngắt kết nối = rời hàng
+    chờ. Khi ghép được, client nhận 'match_found' với URL của phòng đã tạo sẵn.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close(code=4001)
+            return
+
+        self.user_id = user.id
+        self.queued = False
+        await self.accept()
+
+        self.queued = True
+        await self.send(json.dumps({'type': 'queued', 'elo': user.elo_rating}))
+        await matchmaker.enqueue(self.user_id, user.elo_rating, self.channel_name)
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'queued', False):
+            self.queued = False
+            await matchmaker.cancel(self.user_id, self.channel_name)
 
-    async def stop_timer(self, event):
+    async def match_found(self, event):
+        self.queued = False
         await self.send(json.dumps({
-            'type': 'stop_timer',
-            'reason': event.get('reason', 'server')
+            'type': 'match_found',
+            'code': event['code'],
+            'url': reverse('quiz:quiz_room', kwargs={'code': event['code']}),
         }))
+        await self.close()
 
-    async def player_joined(self, event):
-        await self.send(json.dumps({
-            'type': 'player_joined', 
-            'user_id': event.get('user_id'),
-            'username': event.get('username')
-        }))
\ No newline at end of file
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """
+    Khán giả chỉ-đọc của một room. Không vào group quiz_{code} và không đọc
+    state: frame (keyframe / diff) do quiz.spectators.hub đẩy thẳng xuống.
+    """
+
+    async def connect(self):
+        self.code = self.scope['url_route']['kwargs']['code']
+        await self.accept()
+        await hub.add(self.code, self)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'code'):
+            await hub.remove(self.code, self)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Read-only
+        return
+
+
+class LobbyConsumer(AsyncWebsocketConsumer):
+    """
+    Lobby realtime: snapshot các phòng đang mở khi kết nối, sau đó nhận event
+    add / remove từ group quiz_lobby. Không query DB.
+    """
+
+    async def connect(self):
+        await self.accept()
+        # Vào group trước khi đọc snapshot để không lỡ event; add trùng là idempotent ở client
+        await self.channel_layer.group_add(LOBBY_GROUP, self.channel_name)
+        await self.send(text_data=json.dumps({
+            'type': 'snapshot',
+            'rooms': await lobby_rooms_async(),
+        }))
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(LOBBY_GROUP, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Read-only
+        return
+
+    async def lobby_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': event['action'],
+            'room': event['room'],
+        }))
@@ -0,0 +1,902 @@
+"""
+Per-room game driver cho realtime quiz.
+
+Mỗi room có đúng một RoomGameLoop chạy trên một worker, được bầu qua một
+Redis lease (quiz:driver:{code}). Consumers không đọc/ghi state nữa, chỉ đẩy
+action (join / answer / leave) vào inbox của worker đang sở hữu
+room bằng một lệnh EVALSHA duy nhất. Driver là writer duy nhất của state nên
+không cần distributed lock. Deadline của round (hết giờ, hết thời gian xem
+kết quả) do quiz.timers bắn vào queue như một action, nên không phụ thuộc
+consumer nào còn sống. State được ghi theo từng field qua
+quiz.room_state, nên driver mới có thể tiếp quản room khi worker cũ chết.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from . import lobby, services
+from .question_cache import question_cache
+from common.metrics import Histogram
+from common.redis_pool import get_redis
+from .match_writer import enqueue_match, match_writer
+from .protocol import public_question
+from .reaper import run_reaper
+from .room_state import store, STATE_TTL
+from .spectators import SpectatorFeed
+from .timers import DeadlineScheduler
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+LEASE_TTL_MS = 15000
+
+# Thay cho thời gian chờ / giữ lock trước đây: action chờ trong inbox + queue
+# bao lâu, và game loop xử lý nó bao lâu (gồm Redis, DB, group_send)
+ACTION_WAIT_SECONDS = Histogram(
+    'quiz_action_wait_seconds', 'Time from submit until the game loop starts handling an action', ['action'],
+)
+ACTION_SECONDS = Histogram(
+    'quiz_action_seconds', 'Time the game loop spends handling an action', ['action'],
+)
+MAX_QUESTIONS = 10
+QUESTION_TIMER = 30
+RESULT_DELAY = 5
+# Đáp án hợp lệ từ client; None là hết giờ
+VALID_ANSWERS = {'A', 'B', 'C', 'D'}
+
+# Event broadcast tới người chơi được đánh seq và ghi vào log của room để
+# client reconnect chỉ cần phát lại phần bị lỡ
+LOGGED_EVENTS = {'start', 'round.transition', 'player.answered', 'player.joined', 'finished'}
+
+# Đẩy action vào inbox của worker sở hữu room; nếu room chưa có driver thì
+# worker gọi script sẽ trở thành driver. Trả về worker id của driver.
+# KEYS[1] = lease key, ARGV = [caller worker id, lease ttl ms, action json, inbox ttl s]
+SUBMIT_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if not owner then
+    owner = ARGV[1]
+    redis.call('SET', KEYS[1], owner, 'PX', ARGV[2])
+end
+local inbox = 'quiz:inbox:' .. owner
+redis.call('RPUSH', inbox, ARGV[3])
+redis.call('EXPIRE', inbox, ARGV[4])
+return owner
+"""
+
+# Gia hạn lease cho các room worker đang chạy; lease đã hết hạn thì lấy lại,
+# lease đã thuộc worker khác thì trả về 0 để driver local dừng.
+# KEYS = lease keys, ARGV = [worker id, lease ttl ms]
+RENEW_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local owner = redis.call('GET', key)
+    if owner == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+        result[i] = 1
+    elseif not owner then
+        redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+        result[i] = 1
+    else
+        result[i] = 0
+    end
+end
+return result
+"""
+
+# KEYS[1] = lease key, ARGV[1] = worker id
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(code):
+    return f'quiz:driver:{code}'
+
+
+def inbox_key(worker_id):
+    return f'quiz:inbox:{worker_id}'
+
+
+def new_state():
+    return {
+        'question': None,
+        'question_num': 1,
+        'deck': [],
+        'used_questions': [],
+        'active_players': [],
+        'user_snapshot': {},
+        'roster': [],  # user_id (str) tham gia trận, chỉ thêm từ lúc bắt đầu
+        'usernames': {},
+        'answers': {},
+        'answer_times': {},  # channel -> ms từ lúc broadcast câu hỏi tới lúc nhận đáp án
+        'histogram': {},  # answer -> số người chọn trong round hiện tại
+        'channel_to_user': {},
+        'scores': {},
+        'started': False,
+        'processed': False,
+        'expected_players': 2,  # Room.max_players
+        'owner_id': None,
+        'reserved': [],  # user_id được matchmaking giữ chỗ (rỗng = phòng mở)
+        'deadline_at': None,
+        'deadline_kind': None,
+        'deadline_token': None,
+        'last_results_by_user': None,
+        'round_started_at': None,  # epoch giây lúc broadcast câu hỏi hiện tại
+        'rounds': [],  # log gọn của các round đã xong, ghi DB khi trận kết thúc
+        'seq': 0,  # seq của event cuối cùng trong log (không lưu trong meta)
+    }
+
+
+async def load_question_payloads(question_ids):
+    """Lấy payload từ cache ngay trên event loop; chỉ đi qua thread pool khi cache miss."""
+    payloads, missing = question_cache.get_many(question_ids)
+    if missing:
+        payloads.update(await database_sync_to_async(services.get_question_payloads)(missing))
+    return payloads
+
+
+class RoomGameLoop:
+    """
+    Driver duy nhất của một room: nhận action tuần tự từ queue, giữ state
+    trong memory và chỉ ghi phần state thay đổi xuống Redis (quiz.room_state).
+    """
+
+    def __init__(self, registry, code, queue=None):
+        self.registry = registry
+        self.code = code
+        self.room_group_name = f'quiz_{code}'
+        self.queue = queue or asyncio.Queue()
+        self.channel_layer = get_channel_layer()
+        self.state = None
+        self.payloads = {}  # question id -> Question.as_dict() của deck
+        self.round_started = None  # time.monotonic() lúc broadcast câu hỏi hiện tại
+        self.spectators = SpectatorFeed(code)
+        self.closed = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            await self.load()
+            while not self.closed:
+                action = await self.queue.get()
+                await self.dispatch(action)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Game loop crashed for room {self.code}: {e}", exc_info=True)
+        finally:
+            await self.spectators.close()
+            await self.registry.loop_finished(self)
+
+    async def dispatch(self, action):
+        handlers = {
+            'join': self.on_join,
+            'leave': self.on_leave,
+            'answer': self.on_answer,
+            'start': self.on_start,
+            'deadline': self.on_deadline,
+        }
+        action_type = action.pop('type', None)
+        submitted_at = action.pop('submitted_at', None)
+        handler = handlers.get(action_type)
+        if handler is None:
+            return
+        if submitted_at is not None:
+            ACTION_WAIT_SECONDS.observe(max(0.0, time.time() - submitted_at), action=action_type)
+        try:
+            with ACTION_SECONDS.time(action=action_type):
+                await handler(**action)
+        except TypeError as e:
+            logger.warning(f"Malformed action for room {self.code}: {e}")
+        except Exception as e:
+            # Một action lỗi không được làm chết loop của cả room
+            logger.error(f"Action {action_type} failed for room {self.code}: {e}", exc_info=True)
+
+    # State
+    async def load(self):
+        loaded = await store.load(self.code)
+        if loaded is None or 'expected_players' not in loaded:
+            # Room chưa có người chơi: đọc max_players / chủ phòng một lần
+            room_settings = await database_sync_to_async(services.get_room_settings)(self.code)
+            if not room_settings:
+                await self.discard_late_actions()
+                return
+            loaded = {**(loaded or {}), **room_settings}
+        self.state = {**new_state(), **loaded}
+        # Mốc broadcast câu hỏi (driver trước có thể ở process khác) quy đổi
+        # sang đồng hồ monotonic của process này
+        elapsed = time.time() - self.state['round_started_at'] if self.state['round_started_at'] else 0
+        self.round_started = time.monotonic() - max(0.0, elapsed)
+        if self.state['channel_to_user']:
+            self.spectators.update(
+                players=self.spectator_players(),
+                scores=dict(self.state['scores']),
+                question_num=self.state['question_num'],
+            )
+        remaining_deck = self.state['deck'][self.state['question_num'] - 1:]
+        if remaining_deck:
+            self.payloads = await load_question_payloads(remaining_deck)
+        # Driver trước đó chết giữa round: đặt lại timer local cho deadline
+        if self.state.get('deadline_at'):
+            await self.registry.deadlines.schedule(
+                self.code, self.state['deadline_kind'],
+                self.state['deadline_token'], self.state['deadline_at'],
+            )
+
+    async def discard_late_actions(self):
+        """
+        Room đã kết thúc (hoặc không còn): action tới muộn, vd. 'leave' sau
+        'finished', bị bỏ qua thay vì dựng lại state và đưa room về lobby.
+        """
+        self.closed = True
+        while not self.queue.empty():
+            action = self.queue.get_nowait()
+            if action.get('type') == 'join':
+                await self.send_to(action['channel'], 'join.rejected', message='Phòng không tồn tại')
+        logger.info(f"Dropped late actions for finished room {self.code}")
+
+    async def set_deadline(self, seconds, kind):
+        state = self.state
+        state['deadline_at'] = time.time() + seconds
+        state['deadline_kind'] = kind
+        state['deadline_token'] = state['question_num']
+        await self.registry.deadlines.schedule(
+            self.code, kind, state['deadline_token'], state['deadline_at'],
+        )
+
+    async def clear_deadline(self):
+        self.state['deadline_at'] = None
+        self.state['deadline_kind'] = None
+        self.state['deadline_token'] = None
+        await self.registry.deadlines.cancel(self.code)
+
+    def deadline_meta(self):
+        return {
+            'deadline_at': self.state['deadline_at'],
+            'deadline_kind': self.state['deadline_kind'],
+            'deadline_token': self.state['deadline_token'],
+        }
+
+    # Messaging
+    async def group_send(self, event_type, **payload):
+        message = {'type': event_type, **payload}
+        if event_type in LOGGED_EVENTS:
+            self.state['seq'] += 1
+            message['seq'] = self.state['seq']
+            await store.append_event(self.code, message)
+        await self.channel_layer.group_send(self.room_group_name, message)
+
+    async def send_to(self, channel, event_type, **payload):
+        await self.channel_layer.send(channel, {'type': event_type, **payload})
+
+    def spectator_players(self):
+        return {
+            str(uid): self.state['usernames'].get(str(uid))
+            for uid in self.state['channel_to_user'].values()
+        }
+
+    async def update_lobby(self, started=None):
+        """Đồng bộ phòng với lobby realtime (phòng đầy / đã bắt đầu bị gỡ khỏi lobby)."""
+        state = self.state
+        player_count = len(state['channel_to_user'])
+        started = state['started'] if started is None else started
+        try:
+            await lobby.publish_room(
+                self.code, player_count, state['expected_players'],
+                listed=lobby.is_listed(
+                    player_count, state['expected_players'], started, bool(state['reserved'])
+                ),
+            )
+        except Exception as e:
+            logger.warning(f"Could not update lobby for room {self.code}: {e}")
+
+    # Actions
+    async def on_join(self, channel, user_id, username, last_seq=None):
+        state = self.state
+
+        if state['started']:
+            await self.on_rejoin(channel, user_id, last_seq)
+            return
+
+        existing_users = set(state['channel_to_user'].values())
+        if user_id in existing_users:
+            await self.send_to(channel, 'join.rejected', message='Bạn đã tham gia phòng này rồi')
+            return
+        if len(existing_users) >= state['expected_players']:
+            await self.send_to(channel, 'join.rejected', message='Room full')
+            return
+        if state['reserved'] and user_id not in state['reserved']:
+            await self.send_to(channel, 'join.rejected', message='Phòng này dành cho trận đã ghép')
+            return
+
+        state['channel_to_user'][channel] = user_id
+        state['usernames'][str(user_id)] = username
+        state['scores'].setdefault(str(user_id), 0)
+        await store.add_player(self.code, channel, user_id, username)
+
+        player_count = len(state['channel_to_user'])
+        await database_sync_to_async(services.set_player_count)(self.code, player_count)
+        if player_count == 1:
+            await store.set_meta(
+                self.code,
+                expected_players=state['expected_players'],
+                owner_id=state['owner_id'],
+            )
+
+        other_players = [
+            {'user_id': uid, 'username': state['usernames'].get(str(uid))}
+            for uid in state['channel_to_user'].values()
+            if uid != user_id
+        ]
+        await self.send_to(
+            channel, 'join.accepted',
+            player_count=player_count,
+            max_players=state['expected_players'],
+            is_owner=user_id == state['owner_id'],
+            other_players=other_players,
+            seq=state['seq'],
+        )
+        await self.group_send('player.joined', user_id=user_id, username=username)
+        self.spectators.update(players=self.spectator_players(), scores=dict(state['scores']))
+        await self.update_lobby()
+
+        # Start game when room is full
+        if player_count == state['expected_players']:
+            await self.start_game()
+
+    async def on_rejoin(self, channel, user_id, last_seq):
+        """
+        Người chơi của trận đang diễn ra kết nối lại: chuyển họ sang channel
+        mới, client tự phát lại các event sau last_seq từ log của room.
+        """
+        state = self.state
+        uid = str(user_id)
+        # Roster giữ suốt trận: người rời phòng qua ranh giới round vẫn vào lại được
+        # (state cũ chưa có roster: dùng snapshot của round)
+        if uid not in (state['roster'] or state['user_snapshot']):
+            await self.send_to(channel, 'join.rejected', message='Match already started')
+            return
+
+        # Không có trong snapshot: đã rời trước khi round hiện tại bắt đầu
+        snapshot = state['user_snapshot'].get(uid)
+        old_channel = snapshot['channel'] if snapshot else None
+        # Socket cũ có thể chưa kịp gửi 'leave'
+        for ch, other in list(state['channel_to_user'].items()):
+            if other == user_id:
+                del state['channel_to_user'][ch]
+        state['channel_to_user'][channel] = user_id
+        if snapshot:
+            snapshot['channel'] = channel
+
+        active = old_channel in state['active_players']
+        if active:
+            state['active_players'] = [
+                channel if ch == old_channel else ch for ch in state['active_players']
+            ]
+        answer = None
+        if old_channel in state['answers']:
+            answer = state['answers'].pop(old_channel)
+            state['answers'][channel] = answer
+            answer = answer or ''
+        response_ms = state['answer_times'].pop(old_channel, None)
+        if response_ms is not None:
+            state['answer_times'][channel] = response_ms
+        await store.rebind_player(self.code, user_id, old_channel, channel, active, answer, response_ms)
+        await database_sync_to_async(services.set_player_count)(
+            self.code, len(state['channel_to_user'])
+        )
+
+        await self.send_to(
+            channel, 'join.accepted',
+            player_count=len(state['channel_to_user']),
+            max_players=state['expected_players'],
+            is_owner=user_id == state['owner_id'],
+            other_players=[
+                {'user_id': other, 'username': state['usernames'].get(str(other))}
+                for other in state['channel_to_user'].values() if other != user_id
+            ],
+            seq=state['seq'],
+            resumed=last_seq is not None,
+        )
+        logger.info(f"User {user_id} rejoined room {self.code} (last seq {last_seq}, now {state['seq']})")
+
+        # Client không gửi last_seq (vd. tải lại trang): gửi lại kết quả round trước nếu chưa nhận
+        last = state.get('last_results_by_user')
+        if last_seq is None and last and not await store.has_acked(self.code, user_id):
+            await self.send_to(
+                channel, 'round.transition',
+                results_by_user=last['results'],
+                correct_answer=last.get('correct_answer'),
+                explanation=last.get('explanation', ''),
+                scores=last['scores'],
+                question_num=last['question_num'],
+                next_question=None,
+            )
+
+    async def on_start(self, channel, user_id):
+        """Chủ phòng bắt đầu sớm khi phòng chưa đủ người (tối thiểu 2)."""
+        state = self.state
+        if user_id != state['owner_id'] or state['channel_to_user'].get(channel) != user_id:
+            return
+        if len(state['channel_to_user']) >= 2:
+            await self.start_game()
+
+    async def start_game(self):
+        state = self.state
+        if state['question'] is None and not state['started']:
+            state['started'] = True
+            state['roster'] = sorted({str(uid) for uid in state['channel_to_user'].values()})
+            await store.add_roster(self.code, state['roster'])
+            if not state['deck']:
+                # Phòng matchmaking đã có deck (payload được load trong load())
+                state['deck'], self.payloads = await database_sync_to_async(services.draw_question_deck)(
+                    self.code, MAX_QUESTIONS
+                )
+            await store.set_meta(
+                self.code,
+                started=True,
+                expected_players=state['expected_players'],
+                deck=state['deck'],
+            )
+            await database_sync_to_async(services.mark_room_started)(self.code)
+            await self.update_lobby()
+            await self.send_next_question()
+
+    async def on_leave(self, channel):
+        state = self.state
+        state['channel_to_user'].pop(channel, None)
+        await database_sync_to_async(services.set_player_count)(
+            self.code, len(state['channel_to_user'])
+        )
+
+        if not state['channel_to_user']:
+            await self.clear_deadline()
+            await store.delete(self.code)
+            reopened = await database_sync_to_async(services.mark_room_stopped)(self.code)
+            # Phòng trống được mở lại trong DB nên cũng quay lại lobby
+            # (phòng đã kết thúc thì không còn gì để mở lại)
+            if reopened:
+                await self.update_lobby(started=False)
+            self.closed = True
+            return
+
+        # Rời phòng khi chưa trả lời: round không phải chờ người này tới hết giờ
+        abandoned = (
+            not state['processed']
+            and channel in state['active_players']
+            and channel not in state['answers']
+        )
+        if abandoned:
+            state['active_players'].remove(channel)
+        await store.remove_player(self.code, channel, active=abandoned)
+        self.spectators.update(players=self.spectator_players())
+        await self.update_lobby()
+
+        if abandoned and all(ch in state['answers'] for ch in state['active_players']):
+            await self.clear_deadline()
+            await self.process_answers()
+
+    async def on_answer(self, channel, answer):
+        state = self.state
+
+        if answer is not None and (not isinstance(answer, str) or answer not in VALID_ANSWERS):
+            logger.warning(f"Invalid answer {answer!r} from {channel} in room {self.code}")
+            return
+
+        # Player already answered or not in active list
+        if channel not in state['active_players'] or channel in state['answers']:
+            return
+
+        response_ms = int((time.monotonic() - self.round_started) * 1000)
+        answered_count, active_count = await store.record_answer(self.code, channel, answer, response_ms)
+        if answered_count < 0:
+            return
+        state['answers'][channel] = answer
+        state['answer_times'][channel] = response_ms
+        if answer:
+            state['histogram'][answer] = state['histogram'].get(answer, 0) + 1
+
+        all_answered = answered_count == active_count
+        logger.info(f"Player answered: {answered_count}/{active_count} answered for room {self.code}")
+
+        # LAST ANSWER → hủy deadline; client dừng timer khi nhận round.transition
+        if all_answered:
+            await self.clear_deadline()
+
+        user_id = state['channel_to_user'].get(channel)
+        await self.group_send(
+            'player.answered',
+            user_id=user_id,
+            username=state['usernames'].get(str(user_id)),
+            answered_count=answered_count,
+            active_count=active_count,
+        )
+        self.spectators.update(
+            answered=[state['channel_to_user'].get(ch) for ch in state['answers']],
+            histogram=dict(state['histogram']),
+        )
+
+        if all_answered:
+            await self.process_answers()
+
+    async def on_deadline(self, kind, token):
+        state = self.state
+        # Deadline cũ (round đã kết thúc sớm, hoặc bị bắn hai lần) thì bỏ qua
+        if kind != state['deadline_kind'] or token != state['deadline_token']:
+            return
+        state['deadline_at'] = state['deadline_kind'] = state['deadline_token'] = None
+
+        if kind == 'round':
+            await self.expire_round()
+        elif kind == 'next':
+            await self.send_next_question()
+
+    # Round lifecycle
+    async def expire_round(self):
+        state = self.state
+        if state['processed'] or state['question'] is None:
+            return
+
+        logger.info(f"Timer expired for room {self.code}, auto-answering remaining players")
+        unanswered = [ch for ch in state['active_players'] if ch not in state['answers']]
+        for ch in unanswered:
+            state['answers'][ch] = None
+        await store.expire_answers(self.code, unanswered)
+
+        await self.process_answers()
+
+    async def send_next_question(self):
+        state = self.state
+        if state['question_num'] > MAX_QUESTIONS:
+            await self.finish()
+            return
+
+        deck = state['deck']
+        question_id = deck[state['question_num'] - 1] if state['question_num'] <= len(deck) else None
+        q = self.payloads.get(question_id)
+        if not q:
+            logger.info(f"No more questions for room {self.code}")
+            await self.finish()
+            return
+
+        state['question'] = {
+            'id': q['id'],
+            'correct': q['correct'],
+            'score': q['score'],
+            'explanation': q['explanation'] or '',
+        }
+        state['used_questions'].append(q['id'])
+        state['active_players'] = list(state['channel_to_user'].keys())
+
+        # Snapshot user_id và username
+        state['user_snapshot'] = {
+            str(user_id): {
+                'channel': ch,
+                'username': state['usernames'].get(str(user_id)),
+            }
+            for ch, user_id in state['channel_to_user'].items()
+        }
+
+        state['answers'] = {}
+        state['answer_times'] = {}
+        state['histogram'] = {}
+        state['processed'] = False
+        state['round_started_at'] = time.time()
+        self.round_started = time.monotonic()
+        await self.set_deadline(QUESTION_TIMER, 'round')
+        await store.start_round(
+            self.code, q['id'], state['user_snapshot'],
+            question=state['question'],
+            question_num=state['question_num'],
+            processed=False,
+            round_started_at=state['round_started_at'],
+            **self.deadline_meta(),
+        )
+
+        await self.group_send(
+            'start',
+            question_id=q['id'],
+            # Từ câu thứ 2 payload đã được gửi kèm round.transition trước đó
+            question=public_question(q) if state['question_num'] == 1 else None,
+            question_num=state['question_num'],
+            timer=QUESTION_TIMER,
+            # Client tính thời gian còn lại từ deadline tuyệt đối (epoch ms),
+            # bù lệch đồng hồ bằng server_time của frame 'joined'
+            deadline=int(state['deadline_at'] * 1000),
+        )
+        # Khán giả không thấy đáp án đúng trước khi round kết thúc
+        self.spectators.update(
+            phase='question',
+            question_num=state['question_num'],
+            question={key: q.get(key) for key in ('text', 'directive', 'a', 'b', 'c', 'd')},
+            deadline=int(state['deadline_at'] * 1000),
+            answered=[],
+            histogram={},
+            correct_answer=None,
+            results=None,
+        )
+
+    async def process_answers(self):
+        state = self.state
+        if state['processed']:
+            return
+        state['processed'] = True
+
+        q = state.get('question')
+        if not q:
+            await store.set_meta(self.code, processed=True)
+            return
+        correct = q.get('correct')
+        question_score = q.get('score', 0)
+        explanation = q.get('explanation', '')
+
+        results_by_user = {}
+        points = {}
+        round_answers = {}
+
+        for user_id_str, user_data in state['user_snapshot'].items():
+            ch = user_data.get('channel')
+
+            ans = state['answers'].get(ch)
+            timed_out = ans is None
+            is_correct = (ans == correct and not timed_out and correct is not None)
+            response_ms = None if timed_out else state['answer_times'].get(ch)
+
+            points_earned = 0
+            if is_correct:
+                # Trả lời càng nhanh càng nhiều điểm
+                points_earned = services.speed_points(question_score, response_ms, QUESTION_TIMER * 1000)
+                state['scores'][user_id_str] = state['scores'].get(user_id_str, 0) + points_earned
+            points[user_id_str] = points_earned
+            round_answers[user_id_str] = [ans, response_ms, points_earned]
+
+            res = {
+                'your_answer': ans,
+                'is_correct': is_correct,
+                'timed_out': timed_out,
+                'username': user_data.get('username'),
+                'points_earned': points_earned,
+                'response_ms': response_ms,
+                'explanation': explanation if not is_correct else None
+            }
+            results_by_user[user_id_str] = res
+
+        state['last_results_by_user'] = {
+            'results': results_by_user,
+            'correct_answer': correct,
+            'scores': dict(state['scores']),
+            'question_num': state['question_num'],
+            'explanation': explanation
+        }
+        round_log = {'q': q['id'], 'n': state['question_num'], 'c': correct, 'a': round_answers}
+        state['rounds'].append(round_log)
+        state['question_num'] += 1
+
+        # Wait for player to read explanation and results
+        await self.set_deadline(RESULT_DELAY, 'next')
+        await store.finish_round(
+            self.code, points, round_log,
+            processed=True,
+            question_num=state['question_num'],
+            last_results_by_user=state['last_results_by_user'],
+            **self.deadline_meta(),
+        )
+
+        # Một message cho cả chuyển round: kết quả + dừng timer + câu hỏi
+        # kế tiếp (consumer giữ lại, 'start' sau đó chỉ gửi question_id)
+        await self.group_send(
+            'round.transition',
+            results_by_user=results_by_user,
+            correct_answer=correct,
+            explanation=explanation,
+            scores=state['scores'],
+            question_num=state['question_num'] - 1,
+            histogram=state['histogram'],
+            next_question=public_question(self.next_question()),
+        )
+        self.spectators.update(
+            phase='result',
+            correct_answer=correct,
+            scores=dict(state['scores']),
+            results={uid: res['is_correct'] for uid, res in results_by_user.items()},
+            histogram=dict(state['histogram']),
+        )
+
+    def next_question(self):
+        state = self.state
+        question_num = state['question_num']
+        if question_num > min(MAX_QUESTIONS, len(state['deck'])):
+            return None
+        return self.payloads.get(state['deck'][question_num - 1])
+
+    async def finish(self):
+        state = self.state
+        user_ids = list(state['user_snapshot'].keys())
+        scores = state['scores']
+
+        logger.info(f"Quiz ended for room {self.code}. User IDs: {user_ids}, Scores: {scores}")
+
+        room_id = await database_sync_to_async(services.finish_room)(self.code)
+        await self.update_lobby()
+
+        if len(user_ids) >= 2 and room_id:
+            # ELO + GameHistory do match writer ghi sau, game loop không chờ DB
+            try:
+                match_id = await enqueue_match(
+                    room_id, self.code, {uid: scores.get(uid, 0) for uid in user_ids},
+                    rounds=state['rounds'],
+                )
+                logger.info(f"Queued match {match_id} for room {self.code}")
+            except Exception as e:
+                logger.error(f"Could not queue match result for room {self.code}: {e}")
+        else:
+            logger.warning(f"Not enough players for ELO update: {len(user_ids)} players")
+
+        scores_with_names = {
+            state['usernames'].get(user_id, f'User {user_id}'): score
+            for user_id, score in scores.items()
+        }
+        played = state['deck'][:MAX_QUESTIONS]
+        payloads = await load_question_payloads(list(set(played)))
+        total_max_score = sum(payloads.get(qid, {}).get('score', 0) for qid in played)
+
+        await self.group_send(
+            'finished',
+            scores=scores,
+            scores_with_names=scores_with_names,
+            total_max_score=total_max_score,
+        )
+        self.spectators.update(
+            phase='finished',
+            scores=dict(scores),
+            scores_with_names=scores_with_names,
+            total_max_score=total_max_score,
+        )
+        await store.delete(self.code)
+        self.closed = True
+
+
+class GameLoopRegistry:
+    """
+    Các game loop mà worker hiện tại đang drive. Một task pump đọc inbox
+    của worker (BLPOP trên một connection) và phân phối action vào queue
+    của từng room; một task heartbeat gia hạn lease cho tất cả room một lần.
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.deadlines = DeadlineScheduler(on_fire=self.fire_deadline, on_orphan=self.submit)
+        self._pump_task = None
+        self._heartbeat_task = None
+        self._writer_task = None
+        self._reaper_task = None
+        self._scripts = {}
+
+    def script(self, redis_conn, source):
+        """Script đăng ký một lần (gọi bằng EVALSHA, tự SCRIPT LOAD lại nếu Redis mất cache)."""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = redis_conn.register_script(source)
+        return script
+
+    async def submit(self, code, action):
+        self.ensure_running()
+        redis_conn = await get_redis()
+        await self.script(redis_conn, SUBMIT_SCRIPT)(
+            keys=[lease_key(code)],
+            args=[
+                WORKER_ID, LEASE_TTL_MS,
+                json.dumps({'code': code, 'submitted_at': time.time(), **action}), STATE_TTL,
+            ],
+            client=redis_conn,
+        )
+
+    def ensure_running(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self.deadlines.ensure_sweeper()
+        if getattr(settings, 'QUIZ_MATCH_WRITER_IN_PROCESS', True):
+            if self._writer_task is None or self._writer_task.done():
+                self._writer_task = asyncio.create_task(match_writer.run())
+        if getattr(settings, 'QUIZ_REAPER_IN_PROCESS', True):
+            if self._reaper_task is None or self._reaper_task.done():
+                self._reaper_task = asyncio.create_task(run_reaper())
+
+    def fire_deadline(self, code, action):
+        if code in self.rooms:
+            self.dispatch({'code': code, **action})
+        else:
+            # Room không còn chạy ở worker này: gửi tới driver hiện tại
+            asyncio.create_task(self.submit(code, action))
+
+    def dispatch(self, action):
+        code = action.pop('code', None)
+        if not code:
+            return
+        game_loop = self.rooms.get(code)
+        if game_loop is None:
+            game_loop = RoomGameLoop(self, code)
+            self.rooms[code] = game_loop
+            game_loop.start()
+        game_loop.queue.put_nowait(action)
+
+    async def loop_finished(self, game_loop):
+        if self.rooms.get(game_loop.code) is not game_loop:
+            return
+        del self.rooms[game_loop.code]
+
+        # Action tới sau khi game kết thúc: chạy tiếp bằng một loop mới
+        if not game_loop.queue.empty():
+            successor = RoomGameLoop(self, game_loop.code, queue=game_loop.queue)
+            self.rooms[game_loop.code] = successor
+            successor.start()
+            return
+
+        try:
+            redis_conn = await get_redis()
+            await self.script(redis_conn, RELEASE_SCRIPT)(
+                keys=[lease_key(game_loop.code)], args=[WORKER_ID], client=redis_conn,
+            )
+        except Exception as e:
+            logger.warning(f"Could not release lease for room {game_loop.code}: {e}")
+
+    async def _pump(self):
+        redis_conn = await get_redis()
+        key = inbox_key(WORKER_ID)
+        while True:
+            try:
+                item = await redis_conn.blpop(key, timeout=5)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Inbox pump error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not item:
+                continue
+            try:
+                self.dispatch(json.loads(item[1]))
+            except json.JSONDecodeError:
+                logger.warning(f"Dropped malformed action: {item[1]!r}")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(LEASE_TTL_MS / 3000)
+            codes = list(self.rooms)
+            if not codes:
+                continue
+            try:
+                redis_conn = await get_redis()
+                owned = await self.script(redis_conn, RENEW_SCRIPT)(
+                    keys=[lease_key(c) for c in codes], args=[WORKER_ID, LEASE_TTL_MS], client=redis_conn,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease heartbeat error: {e}")
+                continue
+            for code, still_owned in zip(codes, owned):
+                game_loop = self.rooms.get(code)
+                if not still_owned and game_loop:
+                    logger.warning(f"Lost driver lease for room {code}, stopping local loop")
+                    self.rooms.pop(code, None)
+                    self.deadlines.forget(code)
+                    game_loop.task.cancel()
+
+
+registry = GameLoopRegistry()
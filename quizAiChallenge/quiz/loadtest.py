@@ -0,0 +1,176 @@
+"""
+Load generator cho QuizConsumer: N người chơi giả lập chơi trọn trận qua
+ASGI app chạy trong cùng process (channels.testing.WebsocketCommunicator),
+với channel layer, Redis và DB thật như khi chạy Daphne.
+
+Số liệu thu được:
+- rounds/sec (tính theo room, không theo người chơi)
+- answer -> result: từ lúc gửi đáp án tới lúc nhận frame 'result'
+- action latency: từ lúc gửi đáp án tới lúc game loop broadcast
+  'player_answered' của chính mình (thời gian action nằm trong inbox / chờ
+  xử lý; room do một game loop drive nên không có lock để đo)
+- join latency: từ lúc mở socket tới 'joined'
+- Redis ops / round: chênh lệch total_commands_processed của Redis chia cho
+  số round (gồm cả traffic của channel layer nếu dùng Redis)
+
+Chạy bằng `manage.py loadtest_quiz`.
+"""
+import asyncio
+import random
+import time
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from common.redis_pool import get_redis
+from . import game_loop
+from .routing import websocket_urlpatterns
+
+ANSWERS = ['A', 'B', 'C', 'D']
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class LoadStats:
+    def __init__(self):
+        self.answer_to_result = []  # giây
+        self.action_latency = []
+        self.join_latency = []
+        self.rounds = 0
+        self.games = 0
+        self.errors = 0
+        self.redis_ops = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        def ms(values):
+            return {
+                f'p{pct}': round(percentile(values, pct) * 1000, 1) if values else None
+                for pct in (50, 95, 99)
+            }
+
+        return {
+            'games': self.games,
+            'rounds': self.rounds,
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 2),
+            'rounds_per_sec': round(self.rounds / self.elapsed, 2) if self.elapsed else 0,
+            'answer_to_result_ms': ms(self.answer_to_result),
+            'action_latency_ms': ms(self.action_latency),
+            'join_latency_ms': ms(self.join_latency),
+            'redis_ops_per_round': round(self.redis_ops / self.rounds, 1) if self.rounds else None,
+        }
+
+
+def with_user(application, user):
+    """Gắn user vào scope như AuthMiddlewareStack."""
+    async def app(scope, receive, send):
+        return await application({**scope, 'user': user}, receive, send)
+    return app
+
+
+class SimulatedPlayer:
+    def __init__(self, application, user, code, stats, think_time, accuracy, counts_rounds):
+        self.application = with_user(application, user)
+        self.user = user
+        self.code = code
+        self.stats = stats
+        self.think_time = think_time
+        self.accuracy = accuracy
+        # Chỉ một người chơi mỗi room đếm round / game
+        self.counts_rounds = counts_rounds
+        self.timeout = game_loop.QUESTION_TIMER + game_loop.RESULT_DELAY + 30
+
+    def choose_answer(self, question):
+        correct = question.get('correct')
+        if correct and random.random() < self.accuracy:
+            return correct
+        return random.choice(ANSWERS)
+
+    async def play(self):
+        stats = self.stats
+        communicator = WebsocketCommunicator(self.application, f'/ws/quiz/{self.code}/')
+        opened_at = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=self.timeout)
+        if not connected:
+            stats.errors += 1
+            return
+
+        answered_at = None
+        try:
+            while True:
+                message = await communicator.receive_json_from(timeout=self.timeout)
+                kind = message.get('type')
+                now = time.perf_counter()
+
+                if kind == 'joined':
+                    stats.join_latency.append(now - opened_at)
+                elif kind == 'start':
+                    # Think time ngẫu nhiên quanh giá trị cấu hình
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * self.think_time)
+                    answered_at = time.perf_counter()
+                    await communicator.send_json_to({
+                        'type': 'answer',
+                        'answer': self.choose_answer(message.get('question') or {}),
+                    })
+                elif kind == 'player_answered':
+                    if message.get('user_id') == self.user.id and answered_at is not None:
+                        stats.action_latency.append(now - answered_at)
+                elif kind == 'result':
+                    if answered_at is not None:
+                        stats.answer_to_result.append(now - answered_at)
+                        answered_at = None
+                    if self.counts_rounds:
+                        stats.rounds += 1
+                elif kind == 'finished':
+                    if self.counts_rounds:
+                        stats.games += 1
+                    break
+                elif kind in ('error', 'no_room'):
+                    stats.errors += 1
+                    break
+        except asyncio.TimeoutError:
+            stats.errors += 1
+        finally:
+            await communicator.disconnect()
+
+
+async def redis_commands_processed():
+    redis_conn = await get_redis()
+    info = await redis_conn.info('stats')
+    return info['total_commands_processed']
+
+
+async def run_load_test(rooms, think_time=1.0, accuracy=0.5, ramp=0.0, result_delay=None):
+    """
+    rooms: list (code, [user, ...]) đã tạo sẵn trong DB. Trả về LoadStats.
+    result_delay: ghi đè thời gian chờ giữa các round của game loop trong process.
+    """
+    if result_delay is not None:
+        game_loop.RESULT_DELAY = result_delay
+
+    application = URLRouter(websocket_urlpatterns)
+    stats = LoadStats()
+
+    async def start_room(index, code, users):
+        if ramp:
+            await asyncio.sleep(ramp * index / len(rooms))
+        await asyncio.gather(*[
+            SimulatedPlayer(
+                application, user, code, stats, think_time, accuracy, counts_rounds=i == 0
+            ).play()
+            for i, user in enumerate(users)
+        ])
+
+    ops_before = await redis_commands_processed()
+    started_at = time.perf_counter()
+    await asyncio.gather(*[
+        start_room(index, code, users) for index, (code, users) in enumerate(rooms)
+    ])
+    stats.elapsed = time.perf_counter() - started_at
+    stats.redis_ops = await redis_commands_processed() - ops_before
+    return stats
@@ -0,0 +1,107 @@
+"""
+Lobby realtime: danh sách phòng đang mở nằm trong Redis thay vì query bảng Room.
+
+    quiz:lobby        ZSET  code -> thời điểm tạo phòng (phòng mới nhất trước)
+    quiz:lobby:rooms  HASH  code -> JSON {code, player_count, max_players}
+
+Game loop (nơi nắm số người chơi thật) cập nhật lobby khi có người vào / ra
+và xoá phòng khỏi lobby khi phòng đầy hoặc bắt đầu; view create_room thêm
+phòng mới; reaper xoá phòng bỏ dở. Mỗi thay đổi được đẩy tới group
+quiz_lobby dưới dạng event add / remove để trang lobby tự cập nhật.
+"""
+import json
+import logging
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from common.redis_pool import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+LOBBY_KEY = 'quiz:lobby'
+ROOMS_KEY = 'quiz:lobby:rooms'
+LOBBY_GROUP = 'quiz_lobby'
+LOBBY_SIZE = 10
+
+
+def room_entry(code, player_count, max_players):
+    return {'code': code, 'player_count': player_count, 'max_players': max_players}
+
+
+def is_listed(player_count, max_players, started=False, matchmade=False):
+    return not started and not matchmade and player_count < max_players
+
+
+async def publish_room(code, player_count, max_players, listed=True):
+    """Thêm / cập nhật phòng trong lobby, hoặc xoá nếu listed=False."""
+    redis_conn = await get_redis()
+    entry = room_entry(code, player_count, max_players)
+    async with redis_conn.pipeline(transaction=True) as pipe:
+        if listed:
+            # NX: giữ thứ tự theo lúc phòng xuất hiện lần đầu
+            pipe.zadd(LOBBY_KEY, {code: time.time()}, nx=True)
+            pipe.hset(ROOMS_KEY, code, json.dumps(entry))
+        else:
+            pipe.zrem(LOBBY_KEY, code)
+            pipe.hdel(ROOMS_KEY, code)
+        changed = await pipe.execute()
+
+    # Xoá một phòng không có trong lobby thì không cần báo
+    if listed or changed[0]:
+        await get_channel_layer().group_send(LOBBY_GROUP, lobby_update('add' if listed else 'remove', entry))
+
+
+def lobby_update(action, room):
+    return {'type': 'lobby.update', 'action': action, 'room': room}
+
+
+def add_room_sync(code, player_count, max_players):
+    """
+    Dùng từ view (sync) khi tạo phòng. Ghi bằng client Redis sync: async_to_sync
+    chạy mỗi lần trên một event loop mới nên sẽ dựng một pool async mới mỗi request.
+    """
+    entry = room_entry(code, player_count, max_players)
+    try:
+        pipe = get_sync_redis().pipeline(transaction=True)
+        pipe.zadd(LOBBY_KEY, {code: time.time()}, nx=True)
+        pipe.hset(ROOMS_KEY, code, json.dumps(entry))
+        pipe.execute()
+        async_to_sync(get_channel_layer().group_send)(LOBBY_GROUP, lobby_update('add', entry))
+    except Exception as e:
+        logger.warning(f"Could not add room {code} to lobby: {e}")
+
+
+def remove_rooms_sync(codes):
+    """Dùng từ reaper (sync): xoá nhiều phòng khỏi lobby."""
+    if not codes:
+        return
+    redis_conn = get_sync_redis()
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.zrem(LOBBY_KEY, *codes)
+    pipe.hdel(ROOMS_KEY, *codes)
+    pipe.execute()
+
+    channel_layer = get_channel_layer()
+    for code in codes:
+        async_to_sync(channel_layer.group_send)(LOBBY_GROUP, lobby_update('remove', {'code': code}))
+
+
+def _entries(values):
+    return [json.loads(value) for value in values if value]
+
+
+def lobby_rooms(limit=LOBBY_SIZE):
+    """Các phòng mới nhất đang mở (sync, cho view)."""
+    redis_conn = get_sync_redis()
+    codes = redis_conn.zrevrange(LOBBY_KEY, 0, limit - 1)
+    if not codes:
+        return []
+    return _entries(redis_conn.hmget(ROOMS_KEY, codes))
+
+
+async def lobby_rooms_async(limit=LOBBY_SIZE):
+    redis_conn = await get_redis()
+    codes = await redis_conn.zrevrange(LOBBY_KEY, 0, limit - 1)
+    if not codes:
+        return []
+    return _entries(await redis_conn.hmget(ROOMS_KEY, codes))
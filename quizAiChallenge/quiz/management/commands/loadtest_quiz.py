@@ -0,0 +1,83 @@
+import asyncio
+import json
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from quiz.loadtest import run_load_test
+from quiz.models import Room, Question
+from quiz.room_codes import allocate_room_code
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate concurrent quiz rooms against the in-process ASGI app "
+        "(real channel layer, Redis and DB) and report throughput / latency. "
+        "Creates loadtest_* users and rooms: run against a local setup only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--players', type=int, default=2, help="Players per room")
+        parser.add_argument('--think-time', type=float, default=1.0, help="Mean seconds before answering")
+        parser.add_argument('--accuracy', type=float, default=0.5, help="Chance of answering correctly")
+        parser.add_argument('--ramp', type=float, default=0.0, help="Seconds over which rooms are started")
+        parser.add_argument('--result-delay', type=float, default=None,
+                            help="Override the pause between rounds (game_loop.RESULT_DELAY)")
+        parser.add_argument('--prefix', default='loadtest_', help="Username prefix for simulated players")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        players = options['players']
+        if not 2 <= players <= Room.MAX_PLAYERS:
+            raise CommandError(f"--players must be between 2 and {Room.MAX_PLAYERS}")
+        if not Question.objects.exists():
+            raise CommandError("No questions in the database, seed some first (seed_quiz)")
+
+        users = self.get_users(options['prefix'], options['rooms'] * players)
+        rooms = []
+        for i in range(options['rooms']):
+            members = users[i * players:(i + 1) * players]
+            room = Room.objects.create(
+                code=allocate_room_code(),
+                created_by=members[0],
+                max_players=players,
+            )
+            rooms.append((room.code, members))
+
+        self.stdout.write(
+            f"🏋️ Simulating {len(rooms)} rooms x {players} players "
+            f"({len(rooms) * players} sockets)..."
+        )
+        stats = asyncio.run(run_load_test(
+            rooms,
+            think_time=options['think_time'],
+            accuracy=options['accuracy'],
+            ramp=options['ramp'],
+            result_delay=options['result_delay'],
+        ))
+        summary = stats.summary()
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Games: {summary['games']}, rounds: {summary['rounds']}, errors: {summary['errors']} "
+            f"in {summary['elapsed']}s"
+        ))
+        self.stdout.write(f"   Rounds/sec: {summary['rounds_per_sec']}")
+        self.stdout.write(f"   Answer -> result (ms): {summary['answer_to_result_ms']}")
+        self.stdout.write(f"   Action latency (ms): {summary['action_latency_ms']}")
+        self.stdout.write(f"   Join latency (ms): {summary['join_latency_ms']}")
+        self.stdout.write(f"   Redis ops / round: {summary['redis_ops_per_round']}")
+
+    def get_users(self, prefix, count):
+        usernames = [f'{prefix}{i}' for i in range(count)]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(username=username, password=make_password(None))
+            for username in usernames if username not in existing
+        ])
+        by_name = User.objects.in_bulk(usernames, field_name='username')
+        return [by_name[username] for username in usernames]
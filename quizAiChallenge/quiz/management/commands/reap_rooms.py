@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from quiz.reaper import reap, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Reconcile Room rows with Redis room state, finish abandoned rooms and purge old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        summary = reap(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"🧹 Abandoned: {summary['abandoned']}, player_count fixed: {summary['fixed']}, "
+            f"Redis state purged: {summary['purged']}, lobby pruned: {summary['pruned']}, "
+            f"archived: {summary['archived']}"
+        ))
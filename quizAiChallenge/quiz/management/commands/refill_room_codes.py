@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from quiz.room_codes import refill, POOL_SIZE
+
+
+class Command(BaseCommand):
+    help = "Refill the Redis pool of free room codes (and recycle cooled-down codes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=POOL_SIZE)
+
+    def handle(self, *args, **options):
+        added = refill(options['size'])
+        self.stdout.write(self.style.SUCCESS(f"🎉 Added {added} room codes to the pool"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from quiz.match_writer import replay_dead_letters, BATCH_SIZE, DEAD_LETTER_KEY
+
+
+class Command(BaseCommand):
+    help = f"Re-apply match records that the match writer moved to {DEAD_LETTER_KEY}"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=BATCH_SIZE, help="Max records to replay")
+
+    def handle(self, *args, **options):
+        replayed, failed = replay_dead_letters(options['count'])
+        for entry_id, error in failed:
+            self.stderr.write(f"❌ {entry_id}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"🔁 Replayed {replayed} match records, {len(failed)} still failing"))
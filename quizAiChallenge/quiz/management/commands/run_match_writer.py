@@ -0,0 +1,17 @@
+import asyncio
+from django.core.management.base import BaseCommand
+from quiz.match_writer import MatchWriter, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Run the realtime match writer (applies ELO + GameHistory from the quiz:matches stream)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.stdout.write("✍️ Match writer running...")
+        try:
+            asyncio.run(MatchWriter(batch_size=options['batch_size']).run())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("👋 Match writer stopped"))
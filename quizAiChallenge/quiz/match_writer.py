@@ -0,0 +1,185 @@
+"""
+Ghi kết quả trận realtime (ELO, EloHistory, GameHistory) ngoài game loop.
+
+Khi game kết thúc, game loop chỉ XADD một record "match finished" vào Redis
+stream quiz:matches. MatchWriter đọc stream theo consumer group, ghi nhiều
+trận trong một transaction (quiz.services.apply_match_results) rồi XACK.
+Record chưa được ACK (writer chết giữa chừng) sẽ được writer khác claim lại;
+apply_match_results bỏ qua match_id đã ghi nên xử lý lại không bị cộng ELO
+hai lần.
+
+Lỗi kết nối DB (OperationalError / InterfaceError, vd. DB đang restart) không
+ACK gì: record nằm lại trong pending và được claim lại sau CLAIM_IDLE_MS. Lỗi
+khác thì ghi lại từng record; record vẫn lỗi sau MAX_DELIVERIES lần nhận được
+chuyển sang stream quiz:matches:dead rồi ACK để không chặn các record khác.
+`manage.py replay_dead_matches` ghi lại các record trong dead stream.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from channels.db import database_sync_to_async
+from django.db import InterfaceError, OperationalError
+from redis.exceptions import ResponseError
+from common.redis_pool import get_redis, get_sync_redis
+from . import services
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'quiz:matches'
+DEAD_LETTER_KEY = 'quiz:matches:dead'
+GROUP = 'match-writer'
+STREAM_MAXLEN = 100000
+BATCH_SIZE = 100
+BLOCK_MS = 5000
+# Record pending lâu hơn khoảng này thì coi như writer cũ đã chết
+CLAIM_IDLE_MS = 60000
+# Record lỗi (không phải lỗi kết nối DB) bị chuyển sang dead stream sau số lần nhận này
+MAX_DELIVERIES = 5
+# DB tạm thời không dùng được: giữ record trong pending để thử lại
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+async def enqueue_match(room_id, code, scores, rounds=()):
+    """
+    scores: user_id -> score; rounds: log gọn của từng round (quiz.game_loop),
+    được ghi thành RoundAnswer. Trả về match_id.
+    """
+    match_id = uuid.uuid4().hex
+    record = {
+        'match_id': match_id,
+        'room_id': room_id,
+        'room_code': code,
+        'players': [{'user_id': int(uid), 'score': int(score)} for uid, score in scores.items()],
+        'rounds': list(rounds),
+        'finished_at': time.time(),
+    }
+    redis_conn = await get_redis()
+    await redis_conn.xadd(
+        STREAM_KEY, {'record': json.dumps(record)},
+        maxlen=STREAM_MAXLEN, approximate=True,
+    )
+    return match_id
+
+
+class MatchWriter:
+    def __init__(self, consumer=None, batch_size=BATCH_SIZE, max_deliveries=MAX_DELIVERIES):
+        self.consumer = consumer or f'{socket.gethostname()}:{os.getpid()}'
+        self.batch_size = batch_size
+        self.max_deliveries = max_deliveries
+
+    async def ensure_group(self, redis_conn):
+        try:
+            await redis_conn.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def run(self):
+        redis_conn = await get_redis()
+        await self.ensure_group(redis_conn)
+        logger.info(f"Match writer {self.consumer} started")
+        while True:
+            try:
+                entries = await self.claim_stale(redis_conn)
+                if not entries:
+                    response = await redis_conn.xreadgroup(
+                        GROUP, self.consumer, {STREAM_KEY: '>'},
+                        count=self.batch_size, block=BLOCK_MS,
+                    )
+                    entries = response[0][1] if response else []
+                if entries:
+                    await self.write(redis_conn, entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Match writer error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def claim_stale(self, redis_conn):
+        _, entries, *_ = await redis_conn.xautoclaim(
+            STREAM_KEY, GROUP, self.consumer, CLAIM_IDLE_MS,
+            start_id='0-0', count=self.batch_size,
+        )
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    async def write(self, redis_conn, entries):
+        records = []
+        done = []  # entry id được ACK
+        for entry_id, fields in entries:
+            try:
+                records.append((entry_id, json.loads(fields['record'])))
+            except (KeyError, json.JSONDecodeError):
+                logger.warning(f"Dropped malformed match record {entry_id}: {fields!r}")
+                done.append(entry_id)
+
+        if records:
+            apply = database_sync_to_async(services.apply_match_results)
+            try:
+                written = await apply([record for _, record in records])
+                logger.info(f"Match writer applied {written}/{len(records)} records")
+                done += [entry_id for entry_id, _ in records]
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"Database unavailable ({e}), {len(records)} match records left pending")
+            except Exception as e:
+                logger.error(f"Match batch failed ({e}), retrying {len(records)} records one by one")
+                done += await self.write_one_by_one(redis_conn, apply, records)
+        if done:
+            await redis_conn.xack(STREAM_KEY, GROUP, *done)
+
+    async def write_one_by_one(self, redis_conn, apply, records):
+        done = []
+        for entry_id, record in records:
+            try:
+                await apply([record])
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"Database unavailable ({e}), remaining match records left pending")
+                break
+            except Exception as e:
+                deliveries = await self.delivery_count(redis_conn, entry_id)
+                if deliveries < self.max_deliveries:
+                    logger.warning(
+                        f"Match record {entry_id} failed ({e}), "
+                        f"delivery {deliveries}/{self.max_deliveries}, will retry"
+                    )
+                    continue
+                await self.dead_letter(redis_conn, entry_id, record, e)
+            done.append(entry_id)
+        return done
+
+    async def delivery_count(self, redis_conn, entry_id):
+        pending = await redis_conn.xpending_range(STREAM_KEY, GROUP, min=entry_id, max=entry_id, count=1)
+        return pending[0]['times_delivered'] if pending else 1
+
+    async def dead_letter(self, redis_conn, entry_id, record, error):
+        logger.error(f"Match record {entry_id} (match {record.get('match_id')}) failed: {error}", exc_info=error)
+        await redis_conn.xadd(
+            DEAD_LETTER_KEY,
+            {'record': json.dumps(record), 'entry_id': entry_id, 'error': str(error)},
+            maxlen=STREAM_MAXLEN, approximate=True,
+        )
+
+
+def replay_dead_letters(count=BATCH_SIZE):
+    """
+    Ghi lại các record trong quiz:matches:dead (sync, cho management command).
+    Record ghi được thì bị xoá khỏi dead stream; trận đã ghi rồi được bỏ qua.
+    Trả về (số record đã ghi lại, [(entry id, lỗi), ...]).
+    """
+    redis_conn = get_sync_redis()
+    replayed, failed = 0, []
+    for entry_id, fields in redis_conn.xrange(DEAD_LETTER_KEY, count=count):
+        try:
+            services.apply_match_results([json.loads(fields['record'])])
+        except Exception as e:
+            failed.append((entry_id, e))
+            continue
+        redis_conn.xdel(DEAD_LETTER_KEY, entry_id)
+        replayed += 1
+    return replayed, failed
+
+
+match_writer = MatchWriter()
@@ -0,0 +1,188 @@
+"""
+Matchmaking theo ELO cho quiz 1v1.
+
+Hàng chờ chung cho mọi worker nằm trong Redis:
+
+    quiz:mm:queue     ZSET  user_id -> elo_rating
+    quiz:mm:channels  HASH  user_id -> channel name của MatchmakingConsumer
+    quiz:mm:seen      HASH  user_id -> lần cuối worker của user còn thử ghép (epoch ms)
+
+Ghép cặp là một Lua script: lấy người gần ELO nhất ở hai phía (ZRANGEBYSCORE /
+ZREVRANGEBYSCORE với LIMIT, O(log n)) trong cửa sổ ELO hiện tại rồi ZREM cả
+hai, nên một người chơi không bao giờ bị ghép hai lần dù nhiều worker cùng
+tìm. Mỗi worker thử lại định kỳ cho những người chơi đang kết nối với nó, với
+cửa sổ ELO nới rộng dần theo thời gian chờ; mỗi lần thử cũng làm mới
+quiz:mm:seen của người đó. Entry không được làm mới quá STALE_AFTER_MS (worker
+đã chết) bị script bỏ qua và xoá khỏi hàng chờ. Khi ghép được, phòng và deck
+câu hỏi được tạo sẵn rồi cả hai người chơi nhận 'match.found'.
+"""
+import asyncio
+import logging
+import time
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from common.redis_pool import get_redis
+from . import services
+from .room_state import store
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'quiz:mm:queue'
+CHANNELS_KEY = 'quiz:mm:channels'
+SEEN_KEY = 'quiz:mm:seen'
+
+BASE_WINDOW = 50
+WINDOW_GROWTH = 25  # ELO / giây chờ
+MAX_WINDOW = 500
+MATCH_INTERVAL = 0.5
+MATCH_QUESTIONS = 10
+# Entry không được worker làm mới trong khoảng này thì coi như worker đã chết
+STALE_AFTER_MS = 15000
+
+# KEYS = [queue, channels, seen], ARGV = [user_id, elo, window, now ms, stale after ms]
+# Trả về {opponent_id, opponent_channel}, nil nếu chưa có đối thủ,
+# -1 nếu user không còn trong hàng chờ (đã bị ghép hoặc đã huỷ).
+PAIR_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return -1
+end
+local now = tonumber(ARGV[4])
+redis.call('HSET', KEYS[3], ARGV[1], now)
+local elo = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local best, best_diff
+-- Entry cũ bị xoá thì tìm lại (tối đa 3 lần) để người kế tiếp trong cửa sổ được xét
+for attempt = 1, 3 do
+    local removed = 0
+    local above = redis.call('ZRANGEBYSCORE', KEYS[1], elo, elo + window, 'WITHSCORES', 'LIMIT', 0, 2)
+    local below = redis.call('ZREVRANGEBYSCORE', KEYS[1], elo, elo - window, 'WITHSCORES', 'LIMIT', 0, 2)
+    for _, candidates in ipairs({above, below}) do
+        for i = 1, #candidates, 2 do
+            local candidate = candidates[i]
+            if candidate ~= ARGV[1] then
+                local seen = tonumber(redis.call('HGET', KEYS[3], candidate))
+                if not seen or now - seen > tonumber(ARGV[5]) then
+                    -- Worker của người này đã chết: bỏ khỏi hàng chờ
+                    redis.call('ZREM', KEYS[1], candidate)
+                    redis.call('HDEL', KEYS[2], candidate)
+                    redis.call('HDEL', KEYS[3], candidate)
+                    removed = removed + 1
+                else
+                    local diff = math.abs(tonumber(candidates[i + 1]) - elo)
+                    if not best or diff < best_diff then
+                        best, best_diff = candidate, diff
+                    end
+                end
+            end
+        end
+    end
+    if best or removed == 0 then
+        break
+    end
+end
+if not best then
+    return nil
+end
+redis.call('ZREM', KEYS[1], ARGV[1], best)
+local channel = redis.call('HGET', KEYS[2], best)
+redis.call('HDEL', KEYS[2], ARGV[1], best)
+redis.call('HDEL', KEYS[3], ARGV[1], best)
+return {best, channel}
+"""
+
+# Chỉ rời hàng chờ nếu entry vẫn thuộc channel này (user có thể đã xếp hàng
+# lại từ tab khác). KEYS = [queue, channels, seen], ARGV = [user_id, channel]
+CANCEL_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def match_window(waited):
+    """Cửa sổ ELO (±) sau `waited` giây chờ."""
+    return min(MAX_WINDOW, BASE_WINDOW + int(WINDOW_GROWTH * waited))
+
+
+class Matchmaker:
+    def __init__(self):
+        self.waiting = {}  # user_id -> {'elo', 'channel', 'since'} của người chơi kết nối tới worker này
+        self._task = None
+
+    async def enqueue(self, user_id, elo, channel):
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=True) as pipe:
+            pipe.zadd(QUEUE_KEY, {user_id: elo})
+            pipe.hset(CHANNELS_KEY, user_id, channel)
+            pipe.hset(SEEN_KEY, user_id, int(time.time() * 1000))
+            await pipe.execute()
+
+        self.waiting[user_id] = {'elo': elo, 'channel': channel, 'since': time.monotonic()}
+        self.ensure_running()
+        await self.try_match(user_id)
+
+    async def cancel(self, user_id, channel):
+        entry = self.waiting.get(user_id)
+        if entry and entry['channel'] == channel:
+            del self.waiting[user_id]
+        redis_conn = await get_redis()
+        await redis_conn.eval(CANCEL_SCRIPT, 3, QUEUE_KEY, CHANNELS_KEY, SEEN_KEY, user_id, channel)
+
+    async def try_match(self, user_id):
+        entry = self.waiting.get(user_id)
+        if entry is None:
+            return False
+
+        redis_conn = await get_redis()
+        result = await redis_conn.eval(
+            PAIR_SCRIPT, 3, QUEUE_KEY, CHANNELS_KEY, SEEN_KEY,
+            user_id, entry['elo'], match_window(time.monotonic() - entry['since']),
+            int(time.time() * 1000), STALE_AFTER_MS,
+        )
+        if result == -1:
+            # Đã bị worker khác ghép cặp
+            self.waiting.pop(user_id, None)
+            return False
+        if not result:
+            return False
+
+        opponent_id, opponent_channel = int(result[0]), result[1]
+        self.waiting.pop(user_id, None)
+        self.waiting.pop(opponent_id, None)
+        await self.create_match([user_id, opponent_id], [entry['channel'], opponent_channel])
+        return True
+
+    async def create_match(self, user_ids, channels):
+        code, deck = await database_sync_to_async(services.create_match_room)(MATCH_QUESTIONS)
+        # Deck và người chơi được giữ sẵn trong state của room; game loop
+        # chỉ nhận đúng hai người này
+        await store.set_meta(code, deck=deck, reserved=user_ids)
+        logger.info(f"Matched users {user_ids} into room {code}")
+
+        channel_layer = get_channel_layer()
+        for channel in channels:
+            if channel:
+                await channel_layer.send(channel, {'type': 'match.found', 'code': code})
+
+    def ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self.waiting:
+            await asyncio.sleep(MATCH_INTERVAL)
+            # Người chờ lâu nhất (cửa sổ rộng nhất) được thử trước
+            for user_id in sorted(self.waiting, key=lambda uid: self.waiting[uid]['since']):
+                try:
+                    await self.try_match(user_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Matchmaking failed for user {user_id}: {e}", exc_info=True)
+
+
+matchmaker = Matchmaker()
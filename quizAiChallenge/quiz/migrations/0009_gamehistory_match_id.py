@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_room_difficulty_room_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamehistory',
+            name='match_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_gamehistory_match_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='matchmade',
+            field=models.BooleanField(default=False),
+        ),
+    ]
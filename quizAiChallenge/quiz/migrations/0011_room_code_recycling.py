@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-17 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_room_matchmade'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='room',
+            name='code',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='room',
+            constraint=models.UniqueConstraint(condition=models.Q(('finished', False)), fields=('code',), name='unique_active_room_code'),
+        ),
+    ]
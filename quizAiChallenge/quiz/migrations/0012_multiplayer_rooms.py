@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-17 11:50
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_room_code_recycling'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='max_players',
+            field=models.PositiveSmallIntegerField(default=2, validators=[django.core.validators.MinValueValidator(2), django.core.validators.MaxValueValidator(50)]),
+        ),
+        migrations.AddField(
+            model_name='gamehistory',
+            name='player_count',
+            field=models.PositiveSmallIntegerField(default=2),
+        ),
+        migrations.CreateModel(
+            name='GameParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('rank', models.PositiveSmallIntegerField(default=1)),
+                ('elo_before', models.IntegerField()),
+                ('elo_after', models.IntegerField()),
+                ('elo_change', models.IntegerField(default=0)),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='quiz.gamehistory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_participations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['rank'],
+                'unique_together': {('history', 'user')},
+            },
+        ),
+    ]
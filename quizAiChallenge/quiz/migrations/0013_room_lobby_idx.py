@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_multiplayer_rooms'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('finished', False), ('matchmade', False), ('started', False)), fields=['-id'], name='room_lobby_idx'),
+        ),
+    ]
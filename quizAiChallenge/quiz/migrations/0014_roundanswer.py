@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_room_lobby_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_num', models.PositiveSmallIntegerField()),
+                ('answer', models.CharField(blank=True, max_length=1, null=True)),
+                ('is_correct', models.BooleanField(default=False)),
+                ('response_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('points', models.IntegerField(default=0)),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='round_answers', to='quiz.gamehistory')),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='quiz.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='round_answers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['question_num'],
+                'unique_together': {('history', 'user', 'question_num')},
+            },
+        ),
+    ]
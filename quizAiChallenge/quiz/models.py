@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.validators import MinValueValidator, MaxValueValidator
 import random
 import string
 from common.constants import SkillCode, SkillLevel
@@ -70,7 +71,12 @@ class Question(models.Model):
 
 
 class Room(models.Model):
-    code = models.CharField(max_length=10, unique=True, db_index=True)
+    CODE_ALPHABET = string.ascii_uppercase + string.digits
+    CODE_LENGTH = 6
+    MAX_PLAYERS = 50
+
+    # Unique trong các phòng chưa kết thúc; code của phòng đã kết thúc được dùng lại (quiz.room_codes)
+    code = models.CharField(max_length=10, db_index=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -80,26 +86,55 @@ class Room(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     player_count = models.IntegerField(default=0)
+    max_players = models.PositiveSmallIntegerField(
+        default=2,
+        validators=[MinValueValidator(2), MaxValueValidator(MAX_PLAYERS)],
+    )
     started = models.BooleanField(default=False)
     finished = models.BooleanField(default=False)
+    # Bộ lọc câu hỏi cho deck của phòng (để trống = lấy từ toàn bộ ngân hàng câu hỏi)
+    difficulty = models.CharField(
+        max_length=20,
+        choices=Question.DIFFICULTY_CHOICES,
+        blank=True,
+        null=True
+    )
+    category = models.CharField(max_length=100, blank=True, null=True)
+    # Phòng do matchmaking tạo cho hai người chơi đã ghép cặp (không hiện ở lobby)
+    matchmade = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['code'],
+                condition=models.Q(finished=False),
+                name='unique_active_room_code',
+            ),
+        ]
+        indexes = [
+            # Query của lobby: phòng đang mở, mới nhất trước
+            models.Index(
+                fields=['-id'],
+                condition=models.Q(started=False, finished=False, matchmade=False),
+                name='room_lobby_idx',
+            ),
+        ]
 
     def __str__(self):
-        return f"Room {self.code} ({self.player_count}/2)"
+        return f"Room {self.code} ({self.player_count}/{self.max_players})"
 
     @property
     def is_full(self):
-        return self.player_count >= 2
+        return self.player_count >= self.max_players
 
     @property
     def is_available(self):
         return not self.started and not self.is_full
 
-    @staticmethod
-    def generate_code():
-        return ''.join(random.choices(string.ascii_uppercase, k=6))
+    @classmethod
+    def generate_code(cls):
+        return ''.join(random.choices(cls.CODE_ALPHABET, k=cls.CODE_LENGTH))
 
 class Quiz(models.Model):
     QUIZ_TYPE_CHOICES = [
@@ -209,6 +244,11 @@ class GameHistory(models.Model):
     
     # Elo updated flag
     elo_updated = models.BooleanField(default=False, help_text="Whether ELO has been calculated and applied")
+
+    # Id của bản ghi trong stream quiz:matches, để writer không ghi một trận hai lần
+    match_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # Trận nhiều người: player1/player2 là hai người điểm cao nhất, đủ danh sách ở participants
+    player_count = models.PositiveSmallIntegerField(default=2)
     
     played_at = models.DateTimeField(auto_now_add=True)
 
@@ -238,3 +278,54 @@ class GameHistory(models.Model):
             return 'loss'
         else:
             return 'draw'
+
+
+class GameParticipant(models.Model):
+    """
+    Kết quả của từng người chơi trong một trận realtime (kể cả trận 1v1)
+    """
+    history = models.ForeignKey(GameHistory, on_delete=models.CASCADE, related_name='participants')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='game_participations'
+    )
+    score = models.IntegerField(default=0)
+    rank = models.PositiveSmallIntegerField(default=1)
+    elo_before = models.IntegerField()
+    elo_after = models.IntegerField()
+    elo_change = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('history', 'user')
+
+    def __str__(self):
+        return f"{self.user.username} #{self.rank} ({self.score})"
+
+
+class RoundAnswer(models.Model):
+    """
+    Câu trả lời của một người chơi trong một round của trận realtime, kèm
+    thời gian trả lời đo ở server (ghi một lần khi trận kết thúc)
+    """
+    history = models.ForeignKey(GameHistory, on_delete=models.CASCADE, related_name='round_answers')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='round_answers'
+    )
+    question = models.ForeignKey(Question, on_delete=models.SET_NULL, null=True, blank=True)
+    question_num = models.PositiveSmallIntegerField()
+    answer = models.CharField(max_length=1, null=True, blank=True)
+    is_correct = models.BooleanField(default=False)
+    # Từ lúc câu hỏi được broadcast tới lúc server nhận đáp án; null = hết giờ
+    response_ms = models.PositiveIntegerField(null=True, blank=True)
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['question_num']
+        unique_together = ('history', 'user', 'question_num')
+
+    def __str__(self):
+        return f"{self.user.username} Q{self.question_num}: {self.answer} ({self.response_ms} ms)"
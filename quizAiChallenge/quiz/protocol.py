@@ -0,0 +1,180 @@
+"""
+Định dạng message websocket của QuizConsumer.
+
+Mặc định là JSON như trước. Client (vd. app mobile) có thể xin giao thức gọn
+bằng websocket subprotocol `quiz.msgpack.v1`:
+
+- frame nhị phân msgpack, key rút gọn (COMPACT_KEYS), type là số (COMPACT_TYPES)
+- payload câu hỏi chỉ gửi một lần: câu hỏi kế tiếp đi kèm frame 'result'
+  (key 'nq'), frame 'start' sau đó chỉ còn id câu hỏi ('qi')
+- 'scores' chỉ gửi phần thay đổi so với frame trước ('sd'); frame đầu tiên
+  có scores là bản đầy đủ ('s')
+- bỏ các chuỗi hiển thị dựng được ở client ('message')
+
+Payload câu hỏi gửi cho client (JSON lẫn gọn) không bao giờ có đáp án và giải
+thích (public_question); hai trường này chỉ có trong frame 'result' của chính
+câu đó.
+
+Frame client gửi lên cũng là msgpack với cùng bảng key. Nếu server không cài
+msgpack thì subprotocol này không được nhận và client dùng JSON.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+COMPACT_SUBPROTOCOL = 'quiz.msgpack.v1'
+
+COMPACT_KEYS = {
+    'type': 't',
+    'question': 'q',
+    'question_id': 'qi',
+    'next_question': 'nq',
+    'question_num': 'n',
+    'timer': 'tm',
+    'deadline': 'dl',
+    'server_time': 'st',
+    'scores': 's',
+    'scores_with_names': 'sn',
+    'total_max_score': 'mx',
+    'correct_answer': 'c',
+    'explanation': 'e',
+    'histogram': 'h',
+    'result': 'r',
+    'user_id': 'u',
+    'username': 'un',
+    'player_count': 'pc',
+    'max_players': 'mp',
+    'is_owner': 'o',
+    'other_players': 'op',
+    'answered_count': 'ac',
+    'active_count': 'nc',
+    'reason': 'rs',
+    'answer': 'a',
+    'seq': 'sq',
+    'resumed': 'rm',
+}
+# Id đã phát hành không được đổi / dùng lại. 5 là 'stop_timer' cũ (đã bỏ,
+# client dừng timer khi nhận 'result'), giữ trống để client cũ không hiểu nhầm.
+COMPACT_TYPES = {
+    'joined': 1,
+    'player_joined': 2,
+    'start': 3,
+    'player_answered': 4,
+    'result': 6,
+    'finished': 7,
+    'error': 8,
+    'no_room': 9,
+    'answer': 10,
+    'start_game': 11,
+}
+COMPACT_RESULT_KEYS = {
+    'your_answer': 'ya',
+    'is_correct': 'ok',
+    'timed_out': 'to',
+    'points_earned': 'p',
+    'response_ms': 'ms',
+    'explanation': 'e',
+}
+DROPPED_KEYS = {'message'}
+# Chỉ được lộ ra trong 'result' (correct_answer / explanation)
+HIDDEN_QUESTION_KEYS = {'correct', 'explanation'}
+
+_EXPANDED_KEYS = {short: key for key, short in COMPACT_KEYS.items()}
+_EXPANDED_TYPES = {code: name for name, code in COMPACT_TYPES.items()}
+# Client gửi 'start' để chủ phòng bắt đầu sớm; 'start' từ server là câu hỏi mới
+_EXPANDED_TYPES[COMPACT_TYPES['start_game']] = 'start'
+
+
+def public_question(question):
+    """Bản câu hỏi gửi cho client: bỏ đáp án và giải thích."""
+    if not question:
+        return question
+    return {k: v for k, v in question.items() if k not in HIDDEN_QUESTION_KEYS}
+
+
+class JsonCodec:
+    subprotocol = None
+    # Client JSON nhận câu hỏi đầy đủ trong frame 'start'
+    prefetch_questions = False
+
+    def encode(self, message):
+        return {'text_data': json.dumps(message)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return None
+        try:
+            return json.loads(text_data)
+        except json.JSONDecodeError:
+            return None
+
+
+class CompactCodec:
+    subprotocol = COMPACT_SUBPROTOCOL
+    prefetch_questions = True
+
+    def __init__(self):
+        self.sent_questions = set()
+        self.scores = None
+
+    def compact(self, message):
+        """Chuyển message (dạng JSON) sang dạng gọn; cập nhật state của kết nối."""
+        message = {k: v for k, v in message.items() if k not in DROPPED_KEYS and v is not None}
+
+        question = message.pop('question', None)
+        if question:
+            message['question_id'] = question['id']
+            if question['id'] not in self.sent_questions:
+                self.sent_questions.add(question['id'])
+                message['question'] = question
+
+        next_question = message.pop('next_question', None)
+        if next_question and next_question['id'] not in self.sent_questions:
+            self.sent_questions.add(next_question['id'])
+            message['next_question'] = next_question
+
+        scores = message.pop('scores', None)
+        if scores is not None:
+            if self.scores is None:
+                message['scores'] = scores
+            else:
+                changed = {uid: score for uid, score in scores.items() if self.scores.get(uid) != score}
+                if changed:
+                    message['sd'] = changed
+            self.scores = dict(scores)
+
+        result = message.get('result')
+        if result:
+            message['result'] = {
+                COMPACT_RESULT_KEYS[k]: v for k, v in result.items()
+                if k in COMPACT_RESULT_KEYS and v is not None
+            }
+
+        message['type'] = COMPACT_TYPES.get(message['type'], message['type'])
+        return {COMPACT_KEYS.get(k, k): v for k, v in message.items()}
+
+    def encode(self, message):
+        return {'bytes_data': msgpack.packb(self.compact(message))}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            return None
+        try:
+            frame = msgpack.unpackb(bytes_data)
+        except Exception:
+            return None
+        if not isinstance(frame, dict):
+            return None
+        message = {_EXPANDED_KEYS.get(k, k): v for k, v in frame.items()}
+        message['type'] = _EXPANDED_TYPES.get(message.get('type'), message.get('type'))
+        return message
+
+
+def negotiate(subprotocols):
+    """Chọn codec theo danh sách subprotocol client đề nghị."""
+    if msgpack is not None and COMPACT_SUBPROTOCOL in (subprotocols or ()):
+        return CompactCodec()
+    return JsonCodec()
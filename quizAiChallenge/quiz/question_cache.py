@@ -0,0 +1,69 @@
+"""
+Cache in-process cho payload Question.as_dict() dùng trong realtime rounds.
+
+Một instance dùng chung cho mọi game loop / consumer trong cùng process
+Daphne. Cache có giới hạn kích thước (LRU) và TTL, và được invalidate qua
+signal post_save / post_delete của Question (quiz.signals). Signal chỉ
+invalidate process hiện tại, các process khác dựa vào TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class QuestionPayloadCache:
+    def __init__(self, maxsize=2048, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # question id -> (expires_at, payload)
+        # Được gọi từ cả event loop lẫn thread pool của database_sync_to_async
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, question_ids):
+        """Trả về (payloads đã có trong cache, danh sách id còn thiếu)."""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for qid in question_ids:
+                entry = self._data.get(qid)
+                if entry and entry[0] > now:
+                    self._data.move_to_end(qid)
+                    found[qid] = entry[1]
+                else:
+                    if entry:
+                        del self._data[qid]
+                    if qid not in missing:
+                        missing.append(qid)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, payloads):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for qid, payload in payloads.items():
+                self._data[qid] = (expires_at, payload)
+                self._data.move_to_end(qid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, question_id):
+        with self._lock:
+            self._data.pop(question_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+question_cache = QuestionPayloadCache(
+    maxsize=getattr(settings, 'QUIZ_QUESTION_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'QUIZ_QUESTION_CACHE_TTL', 300),
+)
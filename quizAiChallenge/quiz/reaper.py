@@ -0,0 +1,184 @@
+"""
+Dọn dẹp vòng đời của room: đối chiếu Room trong DB với state trong Redis.
+
+Mỗi lần chạy (theo lô, để không khoá bảng Room lâu):
+
+1. Room chưa kết thúc: nếu Redis còn state thì sửa player_count theo số
+   người chơi thật (HLEN players); nếu không còn state và phòng đã tạo quá
+   ABANDON_AFTER thì đánh dấu finished và trả code về pool.
+2. State trong Redis của room không còn mở trong DB (vd. worker chết giữa
+   lúc kết thúc trận) bị xoá.
+3. Phòng trong lobby Redis không còn mở (chưa bắt đầu) trong DB bị gỡ khỏi lobby.
+4. Room đã kết thúc, quá ARCHIVE_AFTER và không có GameHistory bị xoá; room
+   có lịch sử trận được giữ lại vì GameHistory trỏ tới nó.
+
+Chạy bằng `manage.py reap_rooms` hoặc task định kỳ trong process Daphne
+(QUIZ_REAPER_IN_PROCESS), mỗi chu kỳ chỉ một worker chạy nhờ Redis lock.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from channels.db import database_sync_to_async
+from django.db.models import Case, When, Value
+from django.utils import timezone
+from common.redis_pool import get_redis, get_sync_redis
+from .lobby import LOBBY_KEY, remove_rooms_sync
+from .models import Room
+from .room_codes import release_room_code
+from .room_state import store, FIELDS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+ABANDON_AFTER = timedelta(minutes=10)
+ARCHIVE_AFTER = timedelta(days=7)
+REAPER_INTERVAL = 60  # giây
+LOCK_KEY = 'quiz:reaper:lock'
+
+
+def reconcile_open_rooms(batch_size=BATCH_SIZE):
+    """Trả về (số room bị đánh dấu bỏ dở, số room được sửa player_count)."""
+    redis_conn = get_sync_redis()
+    abandon_before = timezone.now() - ABANDON_AFTER
+    abandoned = fixed = 0
+    last_id = 0
+
+    while True:
+        rooms = list(
+            Room.objects.filter(finished=False, id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'code', 'player_count', 'created_at')[:batch_size]
+        )
+        if not rooms:
+            break
+        last_id = rooms[-1][0]
+
+        pipe = redis_conn.pipeline(transaction=False)
+        for _, code, _, _ in rooms:
+            pipe.exists(store.key(code, 'meta'), store.key(code, 'players'))
+            pipe.hlen(store.key(code, 'players'))
+        results = pipe.execute()
+
+        dead = []
+        counts = {}
+        for (room_id, code, player_count, created_at), has_state, players in zip(
+            rooms, results[0::2], results[1::2]
+        ):
+            if not has_state:
+                if created_at < abandon_before:
+                    dead.append((room_id, code))
+                elif player_count:
+                    counts[room_id] = 0
+            elif players != player_count:
+                counts[room_id] = players
+
+        if dead:
+            Room.objects.filter(id__in=[room_id for room_id, _ in dead]).update(
+                finished=True, started=False, player_count=0
+            )
+            for _, code in dead:
+                release_room_code(code)
+            remove_rooms_sync([code for _, code in dead])
+            abandoned += len(dead)
+        if counts:
+            Room.objects.filter(id__in=counts).update(player_count=Case(
+                *[When(id=room_id, then=Value(count)) for room_id, count in counts.items()],
+            ))
+            fixed += len(counts)
+
+    return abandoned, fixed
+
+
+def purge_orphan_state(batch_size=BATCH_SIZE):
+    """Xoá state trong Redis của các room không còn mở trong DB. Trả về số room bị xoá."""
+    redis_conn = get_sync_redis()
+    purged = 0
+    codes = []
+
+    def flush():
+        nonlocal purged
+        alive = set(
+            Room.objects.filter(code__in=codes, finished=False).values_list('code', flat=True)
+        )
+        orphans = [code for code in codes if code not in alive]
+        if orphans:
+            redis_conn.delete(*[store.key(code, field) for code in orphans for field in FIELDS])
+            purged += len(orphans)
+        codes.clear()
+
+    for key in redis_conn.scan_iter(match='quiz:room:*:meta', count=batch_size):
+        codes.append(key.split(':')[2])
+        if len(codes) >= batch_size:
+            flush()
+    if codes:
+        flush()
+    return purged
+
+
+def prune_lobby(batch_size=BATCH_SIZE):
+    """Gỡ khỏi lobby các phòng đã bắt đầu / kết thúc mà game loop chưa kịp gỡ."""
+    redis_conn = get_sync_redis()
+    pruned = 0
+    codes = []
+
+    def flush():
+        nonlocal pruned
+        open_codes = set(
+            Room.objects.filter(code__in=codes, started=False, finished=False)
+            .values_list('code', flat=True)
+        )
+        stale = [code for code in codes if code not in open_codes]
+        remove_rooms_sync(stale)
+        pruned += len(stale)
+        codes.clear()
+
+    for code, _ in redis_conn.zscan_iter(LOBBY_KEY, count=batch_size):
+        codes.append(code)
+        if len(codes) >= batch_size:
+            flush()
+    if codes:
+        flush()
+    return pruned
+
+
+def archive_finished_rooms(batch_size=BATCH_SIZE):
+    """Xoá room đã kết thúc từ lâu không có lịch sử trận. Trả về số room bị xoá."""
+    cutoff = timezone.now() - ARCHIVE_AFTER
+    deleted = 0
+    while True:
+        ids = list(
+            Room.objects.filter(finished=True, created_at__lt=cutoff, histories__isnull=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        Room.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    return deleted
+
+
+def reap(batch_size=BATCH_SIZE):
+    abandoned, fixed = reconcile_open_rooms(batch_size)
+    purged = purge_orphan_state(batch_size)
+    pruned = prune_lobby(batch_size)
+    archived = archive_finished_rooms(batch_size)
+    summary = {
+        'abandoned': abandoned, 'fixed': fixed, 'purged': purged,
+        'pruned': pruned, 'archived': archived,
+    }
+    logger.info(f"Room reaper: {summary}")
+    return summary
+
+
+async def run_reaper(interval=REAPER_INTERVAL):
+    """Task định kỳ trong process Daphne; lock để chỉ một worker chạy mỗi chu kỳ."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            redis_conn = await get_redis()
+            if await redis_conn.set(LOCK_KEY, 1, nx=True, ex=max(1, int(interval) - 1)):
+                await database_sync_to_async(reap)()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Room reaper failed: {e}", exc_info=True)
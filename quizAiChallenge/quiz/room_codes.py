@@ -0,0 +1,143 @@
+"""
+Cấp room code từ một pool code đã sinh sẵn trong Redis.
+
+    quiz:room_codes:free      SET   code chưa dùng
+    quiz:room_codes:cooling   ZSET  code của phòng đã kết thúc -> thời điểm được dùng lại (epoch ms)
+    quiz:room_codes:reserved  ZSET  code vừa cấp, Room có thể chưa được lưu -> hết hạn (epoch ms)
+
+Cấp code là một SPOP (một round-trip, không retry vì trùng), code được giữ
+trong reserved tới khi Room chắc chắn đã có trong DB. Pool được refill theo lô
+ở background khi xuống dưới LOW_WATERMARK: code mới được lọc với các phòng
+đang mở bằng một query code__in và bỏ qua code đang reserved / cooling (phòng
+chưa kịp lưu thì query không thấy), code đã hết thời gian chờ được chuyển từ
+cooling về free. Code của phòng đã kết thúc phải chờ COOLDOWN để
+client cũ còn trong group quiz_{code} không nhận nhầm event của phòng mới.
+"""
+import logging
+import threading
+import time
+from django.db import connection
+from common.redis_pool import get_sync_redis
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+FREE_KEY = 'quiz:room_codes:free'
+COOLING_KEY = 'quiz:room_codes:cooling'
+RESERVED_KEY = 'quiz:room_codes:reserved'
+
+POOL_SIZE = 2000
+LOW_WATERMARK = 500
+COOLDOWN = 3600  # giây, bằng STATE_TTL của room state
+RESERVE_TTL = 60  # giây, đủ để view lưu Room sau khi cấp code
+
+# SPOP một code và giữ nó trong reserved.
+# KEYS = [free, reserved], ARGV = [reserved tới (epoch ms)]. Trả về {code hoặc nil, số code còn lại}
+ALLOCATE_SCRIPT = """
+local code = redis.call('SPOP', KEYS[1])
+if code then
+    redis.call('ZADD', KEYS[2], ARGV[1], code)
+end
+return {code, redis.call('SCARD', KEYS[1])}
+"""
+
+# Thêm code mới vào pool, trừ code đang reserved hoặc cooling.
+# KEYS = [free, reserved, cooling], ARGV = [now ms, code...]
+ADD_FRESH_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local added = 0
+for i = 2, #ARGV do
+    if not redis.call('ZSCORE', KEYS[2], ARGV[i]) and not redis.call('ZSCORE', KEYS[3], ARGV[i]) then
+        added = added + redis.call('SADD', KEYS[1], ARGV[i])
+    end
+end
+return added
+"""
+
+# Chuyển các code đã hết thời gian chờ về pool.
+# KEYS = [cooling, free], ARGV = [now ms, limit]
+RECYCLE_SCRIPT = """
+local codes = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #codes > 0 then
+    redis.call('ZREM', KEYS[1], unpack(codes))
+    redis.call('SADD', KEYS[2], unpack(codes))
+end
+return #codes
+"""
+
+_refill_lock = threading.Lock()
+
+
+def allocate_room_code():
+    redis_conn = get_sync_redis()
+
+    def pop():
+        reserved_until = int((time.time() + RESERVE_TTL) * 1000)
+        return redis_conn.eval(ALLOCATE_SCRIPT, 2, FREE_KEY, RESERVED_KEY, reserved_until)
+
+    try:
+        code, remaining = pop()
+        if code is None:
+            refill()
+            code, _ = pop()
+        elif remaining < LOW_WATERMARK:
+            refill_in_background()
+    except Exception as e:
+        logger.error(f"Room code pool unavailable: {e}")
+        code = None
+
+    if code is None:
+        # Redis lỗi: sinh code và kiểm tra trùng trực tiếp trên DB
+        code = Room.generate_code()
+        while Room.objects.filter(code=code, finished=False).exists():
+            code = Room.generate_code()
+    return code
+
+
+def release_room_code(code):
+    """Trả code của phòng đã kết thúc về pool sau COOLDOWN."""
+    try:
+        get_sync_redis().zadd(COOLING_KEY, {code: int((time.time() + COOLDOWN) * 1000)})
+    except Exception as e:
+        logger.warning(f"Could not release room code {code}: {e}")
+
+
+def refill(size=POOL_SIZE):
+    """Đưa pool về `size` code. Trả về số code đã thêm."""
+    redis_conn = get_sync_redis()
+    added = redis_conn.eval(RECYCLE_SCRIPT, 2, COOLING_KEY, FREE_KEY, int(time.time() * 1000), size)
+
+    missing = size - redis_conn.scard(FREE_KEY)
+    if missing <= 0:
+        return added
+
+    candidates = set()
+    while len(candidates) < missing:
+        candidates.add(Room.generate_code())
+    taken = set(
+        Room.objects.filter(code__in=candidates, finished=False).values_list('code', flat=True)
+    )
+    fresh = candidates - taken
+    if fresh:
+        added += redis_conn.eval(
+            ADD_FRESH_SCRIPT, 3, FREE_KEY, RESERVED_KEY, COOLING_KEY, int(time.time() * 1000), *fresh,
+        )
+    return added
+
+
+def refill_in_background():
+    # Chỉ một thread refill mỗi process
+    if not _refill_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            added = refill()
+            logger.info(f"Refilled room code pool with {added} codes")
+        except Exception as e:
+            logger.error(f"Room code refill failed: {e}")
+        finally:
+            connection.close()
+            _refill_lock.release()
+
+    threading.Thread(target=run, name='room-code-refill', daemon=True).start()
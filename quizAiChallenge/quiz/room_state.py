@@ -0,0 +1,285 @@
+"""
+Field-level Redis storage cho state của quiz room.
+
+Mỗi phần của state nằm trong key riêng thay vì một JSON blob:
+
+    quiz:room:{code}:meta      HASH  question_num, question, started, ... (giá trị JSON)
+    quiz:room:{code}:players   HASH  channel -> user_id
+    quiz:room:{code}:names     HASH  user_id -> username
+    quiz:room:{code}:scores    HASH  user_id -> score
+    quiz:room:{code}:snapshot  HASH  user_id -> channel (người chơi của round hiện tại)
+    quiz:room:{code}:roster    SET   user_id tham gia trận (chỉ thêm, giữ suốt trận)
+    quiz:room:{code}:active    SET   channel đang chơi round hiện tại
+    quiz:room:{code}:answers   HASH  channel -> answer ('' = hết giờ)
+    quiz:room:{code}:times     HASH  channel -> ms từ lúc broadcast câu hỏi tới lúc nhận đáp án
+    quiz:room:{code}:histogram HASH  answer -> số người chọn (round hiện tại)
+    quiz:room:{code}:used      SET   question id đã dùng
+    quiz:room:{code}:acks      SET   user_id đã nhận kết quả round trước (consumer ghi trực tiếp)
+    quiz:room:{code}:rounds    LIST  kết quả từng round đã xong (JSON gọn, ghi DB khi trận kết thúc)
+    quiz:room:{code}:events    STREAM event đã broadcast, id = {seq}-0 (giới hạn EVENT_LOG_SIZE)
+
+Mỗi thao tác chỉ ghi phần thay đổi (một pipeline = một round-trip), và ghi
+câu trả lời là một Lua script nguyên tử nên không cần distributed lock.
+"""
+import json
+from common.metrics import Histogram, timed
+from common.redis_pool import get_redis
+
+STATE_TTL = 3600
+EVENT_LOG_SIZE = 200
+
+STATE_OP_SECONDS = Histogram(
+    'quiz_state_op_seconds', 'Redis round-trip of room state operations', ['op'],
+)
+STATE_SIZE_BYTES = Histogram(
+    'quiz_state_size_bytes', 'Size of the room state read when a game loop starts',
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+
+FIELDS = (
+    'meta', 'players', 'names', 'scores', 'snapshot', 'roster', 'active', 'answers', 'times',
+    'histogram', 'used', 'acks', 'rounds', 'events',
+)
+
+# Ghi câu trả lời (kèm thời gian trả lời) nếu channel đang chơi và chưa trả
+# lời, và cộng vào histogram của round - số đếm tăng dần nên không phải duyệt
+# người chơi.
+# KEYS = [active, answers, histogram, times], ARGV = [channel, answer, ttl, response ms]
+# Trả về {answered_count, active_count}, hoặc {-1, active_count} nếu bị bỏ qua.
+RECORD_ANSWER_SCRIPT = """
+local active = redis.call('SCARD', KEYS[1])
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 0 then
+    return {-1, active}
+end
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then
+    return {-1, active}
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[4])
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+if ARGV[2] ~= '' then
+    redis.call('HINCRBY', KEYS[3], ARGV[2], 1)
+    redis.call('EXPIRE', KEYS[3], ARGV[3])
+end
+return {redis.call('HLEN', KEYS[2]), active}
+"""
+
+
+class RoomStateStore:
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._record_answer = None
+
+    def key(self, code, field):
+        return f'quiz:room:{code}:{field}'
+
+    def _expire(self, pipe, code, *fields):
+        for field in fields:
+            pipe.expire(self.key(code, field), self.ttl)
+
+    @timed(STATE_OP_SECONDS, op='load')
+    async def load(self, code):
+        """Đọc toàn bộ state (chỉ dùng khi driver khởi động lại), None nếu room chưa có state."""
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for field in ('meta', 'players', 'names', 'scores', 'snapshot', 'answers', 'times', 'histogram'):
+                pipe.hgetall(self.key(code, field))
+            for field in ('active', 'used', 'roster'):
+                pipe.smembers(self.key(code, field))
+            pipe.lrange(self.key(code, 'rounds'), 0, -1)
+            pipe.xrevrange(self.key(code, 'events'), count=1)
+            (meta, players, names, scores, snapshot, answers, times, histogram,
+             active, used, roster, rounds, last_event) = await pipe.execute()
+
+        if not meta and not players:
+            return None
+        STATE_SIZE_BYTES.observe(sum(
+            len(k) + len(v) for mapping in (meta, players, names, scores, snapshot, answers, times, histogram)
+            for k, v in mapping.items()
+        ) + sum(len(v) for values in (active, used, roster, rounds) for v in values))
+
+        state = {field: json.loads(value) for field, value in meta.items()}
+        state['channel_to_user'] = {ch: int(uid) for ch, uid in players.items()}
+        state['usernames'] = names
+        state['scores'] = {uid: int(score) for uid, score in scores.items()}
+        state['user_snapshot'] = {
+            uid: {'channel': ch, 'username': names.get(uid)}
+            for uid, ch in snapshot.items()
+        }
+        state['roster'] = sorted(roster)
+        state['active_players'] = list(active)
+        state['answers'] = {ch: (ans or None) for ch, ans in answers.items()}
+        state['answer_times'] = {ch: int(ms) for ch, ms in times.items()}
+        state['histogram'] = {ans: int(count) for ans, count in histogram.items()}
+        state['rounds'] = [json.loads(entry) for entry in rounds]
+        state['used_questions'] = [int(qid) for qid in used]
+        state['seq'] = int(last_event[0][0].split('-')[0]) if last_event else 0
+        return state
+
+    @timed(STATE_OP_SECONDS, op='set_meta')
+    async def set_meta(self, code, **fields):
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.hset(self.key(code, 'meta'), mapping={k: json.dumps(v) for k, v in fields.items()})
+            self._expire(pipe, code, 'meta')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='add_player')
+    async def add_player(self, code, channel, user_id, username):
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.hset(self.key(code, 'players'), channel, user_id)
+            pipe.hset(self.key(code, 'names'), user_id, username)
+            pipe.hsetnx(self.key(code, 'scores'), user_id, 0)
+            self._expire(pipe, code, 'players', 'names', 'scores')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='add_roster')
+    async def add_roster(self, code, user_ids):
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.key(code, 'roster'), *user_ids)
+            self._expire(pipe, code, 'roster')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='rebind_player')
+    async def rebind_player(self, code, user_id, old_channel, new_channel, active, answer=None, response_ms=None):
+        """
+        Chuyển người chơi đang trong trận sang channel mới (reconnect).
+        old_channel None: người chơi không có trong round hiện tại (rời trước
+        khi round bắt đầu), chỉ thêm lại vào danh sách người chơi.
+        """
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            if old_channel is not None:
+                pipe.hdel(self.key(code, 'players'), old_channel)
+                pipe.hset(self.key(code, 'snapshot'), user_id, new_channel)
+            pipe.hset(self.key(code, 'players'), new_channel, user_id)
+            if active:
+                pipe.srem(self.key(code, 'active'), old_channel)
+                pipe.sadd(self.key(code, 'active'), new_channel)
+            if answer is not None:
+                pipe.hdel(self.key(code, 'answers'), old_channel)
+                pipe.hset(self.key(code, 'answers'), new_channel, answer)
+            if response_ms is not None:
+                pipe.hdel(self.key(code, 'times'), old_channel)
+                pipe.hset(self.key(code, 'times'), new_channel, response_ms)
+            self._expire(pipe, code, 'players', 'snapshot', 'active', 'answers', 'times')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='remove_player')
+    async def remove_player(self, code, channel, active=False):
+        """active=True: bỏ channel khỏi round hiện tại (rời phòng khi chưa trả lời)."""
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.hdel(self.key(code, 'players'), channel)
+            if active:
+                pipe.srem(self.key(code, 'active'), channel)
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='record_answer')
+    async def record_answer(self, code, channel, answer, response_ms):
+        """Trả về (answered_count, active_count); answered_count = -1 nếu câu trả lời bị bỏ qua."""
+        redis_conn = await get_redis()
+        if self._record_answer is None:
+            self._record_answer = redis_conn.register_script(RECORD_ANSWER_SCRIPT)
+        answered, active = await self._record_answer(
+            keys=[
+                self.key(code, 'active'), self.key(code, 'answers'),
+                self.key(code, 'histogram'), self.key(code, 'times'),
+            ],
+            args=[channel, answer or '', self.ttl, response_ms],
+            client=redis_conn,
+        )
+        return int(answered), int(active)
+
+    @timed(STATE_OP_SECONDS, op='expire_answers')
+    async def expire_answers(self, code, channels):
+        """Đánh dấu hết giờ cho các channel chưa trả lời."""
+        if not channels:
+            return
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for channel in channels:
+                pipe.hsetnx(self.key(code, 'answers'), channel, '')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='start_round')
+    async def start_round(self, code, question_id, snapshot, **meta):
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.hset(self.key(code, 'meta'), mapping={k: json.dumps(v) for k, v in meta.items()})
+            pipe.sadd(self.key(code, 'used'), question_id)
+            pipe.delete(
+                self.key(code, 'answers'), self.key(code, 'times'), self.key(code, 'histogram'),
+                self.key(code, 'active'), self.key(code, 'snapshot'),
+            )
+            if snapshot:
+                pipe.sadd(self.key(code, 'active'), *[data['channel'] for data in snapshot.values()])
+                pipe.hset(self.key(code, 'snapshot'), mapping={
+                    uid: data['channel'] for uid, data in snapshot.items()
+                })
+            self._expire(pipe, code, 'meta', 'used', 'active', 'snapshot')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='finish_round')
+    async def finish_round(self, code, points, round_log, **meta):
+        """
+        Cộng điểm của round (user_id -> points), thêm round_log vào danh sách
+        round đã xong và lưu kết quả round vào meta.
+        """
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for user_id, earned in points.items():
+                if earned:
+                    pipe.hincrby(self.key(code, 'scores'), user_id, earned)
+            pipe.rpush(self.key(code, 'rounds'), json.dumps(round_log, separators=(',', ':')))
+            pipe.hset(self.key(code, 'meta'), mapping={k: json.dumps(v) for k, v in meta.items()})
+            pipe.delete(self.key(code, 'acks'))
+            self._expire(pipe, code, 'meta', 'scores', 'rounds')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='ack_result')
+    async def ack_result(self, code, user_id):
+        """SADD không cần lock: consumer ghi ack trực tiếp, không qua game loop."""
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.key(code, 'acks'), user_id)
+            self._expire(pipe, code, 'acks')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='has_acked')
+    async def has_acked(self, code, user_id):
+        redis_conn = await get_redis()
+        return bool(await redis_conn.sismember(self.key(code, 'acks'), user_id))
+
+    @timed(STATE_OP_SECONDS, op='append_event')
+    async def append_event(self, code, event):
+        """Ghi event (đã có 'seq') vào log của room để client reconnect phát lại."""
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                self.key(code, 'events'), {'event': json.dumps(event)},
+                id=f"{event['seq']}-0", maxlen=EVENT_LOG_SIZE, approximate=True,
+            )
+            self._expire(pipe, code, 'events')
+            await pipe.execute()
+
+    @timed(STATE_OP_SECONDS, op='read_events')
+    async def read_events(self, code, after_seq, until_seq=None):
+        """Các event có seq trong (after_seq, until_seq]. Event cũ đã bị cắt khỏi log thì không còn."""
+        redis_conn = await get_redis()
+        entries = await redis_conn.xrange(
+            self.key(code, 'events'),
+            min=f'{after_seq + 1}-0',
+            max=f'{until_seq}-0' if until_seq is not None else '+',
+        )
+        return [json.loads(fields['event']) for _, fields in entries]
+
+    @timed(STATE_OP_SECONDS, op='delete')
+    async def delete(self, code):
+        redis_conn = await get_redis()
+        await redis_conn.delete(*[self.key(code, field) for field in FIELDS])
+
+
+store = RoomStateStore()
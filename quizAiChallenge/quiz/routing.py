@@ -1,6 +1,10 @@
 from django.urls import re_path
-from .consumers import QuizConsumer
+from .consumers import QuizConsumer, MatchmakingConsumer, SpectatorConsumer, LobbyConsumer
 
 websocket_urlpatterns = [
+    # Đặt trước route của room vì "matchmaking" / "lobby" cũng khớp (?P<code>\w+)
+    re_path(r"ws/quiz/matchmaking/$", MatchmakingConsumer.as_asgi()),
+    re_path(r"ws/quiz/lobby/$", LobbyConsumer.as_asgi()),
+    re_path(r"ws/quiz/(?P<code>\w+)/spectate/$", SpectatorConsumer.as_asgi()),
     re_path(r"ws/quiz/(?P<code>\w+)/$", QuizConsumer.as_asgi()),
 ]
\ No newline at end of file
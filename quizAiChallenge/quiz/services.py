@@ -0,0 +1,273 @@
+import logging
+import random
+from collections import defaultdict
+from django.db import transaction
+from accounts.models import User
+from leaderboard.models import EloHistory, UserMatchStats
+from leaderboard.rating import EloEngine
+from leaderboard.services import apply_elo_deltas, pvp_outcome, record_match_results
+from .models import Room, Question, GameHistory, GameParticipant, RoundAnswer
+from .question_cache import question_cache
+from .room_codes import allocate_room_code, release_room_code
+
+logger = logging.getLogger(__name__)
+
+
+def active_rooms(code):
+    """Phòng đang dùng `code` (code của phòng đã kết thúc có thể được cấp lại)."""
+    return Room.objects.filter(code=code, finished=False)
+
+
+def get_room(code):
+    return active_rooms(code).get()
+
+
+def get_room_settings(code):
+    """Số người chơi tối đa và chủ phòng, đọc một lần khi game loop khởi tạo room."""
+    room = active_rooms(code).values('max_players', 'created_by_id').first()
+    if room is None:
+        return {}
+    return {'expected_players': room['max_players'], 'owner_id': room['created_by_id']}
+
+
+def set_player_count(code, count):
+    """
+    Ghi số người chơi thực tế (do game loop nắm giữ) thay vì +1/-1,
+    nên player_count không bị lệch khi consumer crash giữa chừng.
+    """
+    fields = {'player_count': count}
+    if count == 0:
+        fields['started'] = False
+    active_rooms(code).update(**fields)
+
+
+def mark_room_started(code):
+    active_rooms(code).update(started=True)
+
+
+def mark_room_stopped(code):
+    """Mở lại phòng chưa kết thúc; False nếu phòng không còn (đã kết thúc / bị xoá)."""
+    return active_rooms(code).update(started=False) > 0
+
+
+def finish_room(code):
+    """Đánh dấu phòng đã kết thúc và trả code về pool. Trả về id của phòng (None nếu không có)."""
+    room_id = active_rooms(code).values_list('id', flat=True).first()
+    if room_id is None:
+        return None
+    Room.objects.filter(id=room_id).update(started=False, finished=True)
+    release_room_code(code)
+    return room_id
+
+
+def create_match_room(size):
+    """
+    Tạo phòng cho hai người chơi vừa được matchmaking ghép cặp, kèm deck câu
+    hỏi để game loop bắt đầu ngay khi cả hai vào phòng.
+    Trả về (code, deck).
+    """
+    code = allocate_room_code()
+    Room.objects.create(code=code, player_count=0, started=False, matchmade=True)
+    deck, _ = draw_question_deck(code, size)
+    return code, deck
+
+
+def draw_question_deck(code, size):
+    """
+    Rút một deck câu hỏi đã xáo trộn cho cả trận (theo difficulty/category
+    của phòng) và prefetch payload trong một query, để mỗi round không phải
+    chạy order_by('?') trên toàn bảng.
+
+    Trả về (question_ids, payloads) với payloads = {id: Question.as_dict()}.
+    """
+    room = active_rooms(code).only('difficulty', 'category').first()
+
+    qs = Question.objects.all()
+    if room and room.difficulty:
+        qs = qs.filter(difficulty=room.difficulty)
+    if room and room.category:
+        qs = qs.filter(category=room.category)
+
+    ids = list(qs.values_list('id', flat=True))
+    if not ids and room and (room.difficulty or room.category):
+        # Bộ lọc không có câu hỏi nào: dùng toàn bộ ngân hàng câu hỏi
+        ids = list(Question.objects.values_list('id', flat=True))
+    if not ids:
+        return [], {}
+
+    deck = random.sample(ids, min(size, len(ids)))
+    # Ngân hàng câu hỏi nhỏ hơn số round: lặp lại câu hỏi như trước đây
+    while len(deck) < size:
+        deck.extend(random.sample(ids, min(size - len(deck), len(ids))))
+
+    return deck, get_question_payloads(deck)
+
+
+def get_question_payloads(question_ids):
+    """Payload của các câu hỏi, ưu tiên lấy từ question_cache; chỉ query các id còn thiếu."""
+    payloads, missing = question_cache.get_many(question_ids)
+    if missing:
+        fetched = {q.id: q.as_dict() for q in Question.objects.filter(id__in=missing)}
+        question_cache.set_many(fetched)
+        payloads.update(fetched)
+    return payloads
+
+
+SPEED_SCORE_FLOOR = 0.5  # phần điểm còn lại khi trả lời đúng sát giờ
+
+
+def speed_points(score, response_ms, limit_ms):
+    """
+    Điểm cho câu trả lời đúng theo tốc độ: trả lời ngay được đủ `score`,
+    giảm tuyến tính còn SPEED_SCORE_FLOOR * score khi hết giờ.
+    """
+    if response_ms is None or limit_ms <= 0:
+        return score
+    remaining = min(1.0, max(0.0, 1 - response_ms / limit_ms))
+    return round(score * (SPEED_SCORE_FLOOR + (1 - SPEED_SCORE_FLOOR) * remaining))
+
+
+def calculate_multiplayer_elo_deltas(ratings, scores):
+    """
+    ELO delta cho trận N người: mỗi người được so với từng đối thủ như một
+    trận 1v1, tổng chia cho N - 1 (leaderboard.rating.EloEngine).
+    """
+    return EloEngine().match_deltas(ratings, scores)
+
+
+@transaction.atomic
+def apply_match_results(records):
+    """
+    Ghi kết quả của nhiều trận realtime trong một transaction: ELO được cộng
+    bằng một UPDATE ... RETURNING cho tất cả user (apply_elo_deltas),
+    EloHistory, GameHistory và GameParticipant được bulk_create, UserMatchStats
+    được cộng dồn. Trận đã ghi rồi (match_id đã có trong GameHistory) bị bỏ qua
+    nên writer có thể xử lý lại một batch sau khi crash.
+
+    records: [{'match_id', 'room_id', 'room_code', 'players': [{'user_id', 'score'}, ...],
+               'rounds': [{'q', 'n', 'c', 'a': {user_id: [answer, response_ms, points]}}, ...]}]
+    Trả về số trận đã ghi.
+    """
+    done = set(
+        GameHistory.objects
+        .filter(match_id__in=[r['match_id'] for r in records])
+        .values_list('match_id', flat=True)
+    )
+    records = [r for r in records if r['match_id'] not in done]
+    if not records:
+        return 0
+
+    rooms = Room.objects.in_bulk({r['room_id'] for r in records})
+    user_ids = {p['user_id'] for r in records for p in r['players']}
+    users = User.objects.select_for_update().in_bulk(user_ids)
+    # ELO chạy theo thứ tự các trận trong batch (một user có thể đánh nhiều trận)
+    ratings = {uid: user.elo_rating for uid, user in users.items()}
+    deltas = defaultdict(int)
+
+    histories = []
+    participants = []
+    round_answers = []
+    elo_histories = []
+    match_results = []
+    for record in records:
+        players = [(users.get(p['user_id']), p['score']) for p in record['players']]
+        room = rooms.get(record['room_id'])
+        if len(players) < 2 or room is None or not all(user for user, _ in players):
+            logger.warning(f"Skip match {record['match_id']}: missing room or players")
+            continue
+
+        befores = [ratings[user.id] for user, _ in players]
+        match_deltas = calculate_multiplayer_elo_deltas(befores, [score for _, score in players])
+
+        entries = []
+        for (user, score), before, delta in zip(players, befores, match_deltas):
+            ratings[user.id] = before + delta
+            deltas[user.id] += delta
+            if delta:
+                elo_histories.append(EloHistory(
+                    user=user, elo_before=before, elo_after=before + delta, change=delta
+                ))
+            entries.append({'user': user, 'score': score, 'before': before, 'delta': delta})
+
+        scores = [entry['score'] for entry in entries]
+        match_results.extend(
+            (entry['user'].id, UserMatchStats.MODE_PVP, pvp_outcome(entry['score'], scores))
+            for entry in entries
+        )
+
+        ranked = sorted(entries, key=lambda e: -e['score'])
+        for entry in entries:
+            # Hạng = 1 + số người có điểm cao hơn (đồng điểm thì đồng hạng)
+            entry['rank'] = 1 + sum(1 for other in entries if other['score'] > entry['score'])
+
+        # Trận 1v1 giữ thứ tự người chơi; trận nhiều người lấy hai người điểm cao nhất
+        first, second = entries if len(entries) == 2 else ranked[:2]
+        winner = ranked[0]['user'] if ranked[0]['score'] > ranked[1]['score'] else None
+
+        history = GameHistory(
+            room=room,
+            player1=first['user'],
+            player2=second['user'],
+            player1_score=first['score'],
+            player2_score=second['score'],
+            winner=winner,
+            # ELO tracking
+            player1_elo_before=first['before'],
+            player1_elo_after=first['before'] + first['delta'],
+            player1_elo_change=first['delta'],
+            player2_elo_before=second['before'],
+            player2_elo_after=second['before'] + second['delta'],
+            player2_elo_change=second['delta'],
+            elo_updated=True,
+            match_id=record['match_id'],
+            player_count=len(entries),
+        )
+        histories.append(history)
+        # history chưa có pk: bulk_create gán history_id sau khi GameHistory được tạo
+        participants.extend(
+            GameParticipant(
+                history=history,
+                user=entry['user'],
+                score=entry['score'],
+                rank=entry['rank'],
+                elo_before=entry['before'],
+                elo_after=entry['before'] + entry['delta'],
+                elo_change=entry['delta'],
+            )
+            for entry in entries
+        )
+        for round_log in record.get('rounds', ()):
+            round_answers.extend(
+                RoundAnswer(
+                    history=history,
+                    user=users[int(uid)],
+                    question_id=round_log['q'],
+                    question_num=round_log['n'],
+                    answer=answer,
+                    is_correct=answer is not None and answer == round_log.get('c'),
+                    response_ms=response_ms,
+                    points=points,
+                )
+                for uid, (answer, response_ms, points) in round_log['a'].items()
+                if int(uid) in users
+            )
+
+    # Một UPDATE ... RETURNING cho cả batch, UserElo và chỉ mục Redis đi theo;
+    # EloHistory theo từng trận được ghi bên dưới
+    apply_elo_deltas(deltas, record_history=False)
+
+    EloHistory.objects.bulk_create(elo_histories)
+    GameHistory.objects.bulk_create(histories)
+    GameParticipant.objects.bulk_create(participants)
+    # Câu hỏi có thể đã bị xoá trong lúc trận diễn ra
+    question_ids = set(
+        Question.objects.filter(id__in={a.question_id for a in round_answers}).values_list('id', flat=True)
+    )
+    for round_answer in round_answers:
+        if round_answer.question_id not in question_ids:
+            round_answer.question_id = None
+    RoundAnswer.objects.bulk_create(round_answers, batch_size=1000)
+    record_match_results(match_results)
+
+    logger.info(f"Applied {len(histories)} realtime matches, {len(elo_histories)} ELO changes")
+    return len(histories)
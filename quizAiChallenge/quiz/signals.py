@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Question
+from .question_cache import question_cache
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_payload(sender, instance, **kwargs):
+    question_cache.invalidate(instance.id)
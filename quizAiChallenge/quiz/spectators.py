@@ -0,0 +1,154 @@
+"""
+Spectator mode: luồng broadcast chỉ-đọc, tách khỏi group quiz_{code} của
+người chơi.
+
+- SpectatorFeed (phía game loop): gom các thay đổi của view khán giả và
+  PUBLISH lên Redis channel quiz:spectate:{code} tối đa SPECTATOR_RATE lần /
+  giây dưới dạng diff, kèm keyframe (toàn bộ view) mỗi KEYFRAME_INTERVAL để
+  khán giả mới vào bắt kịp mà không phải đọc state của room. Room không có
+  khán giả (PUBSUB NUMSUB = 0) thì không publish gì.
+- SpectatorHub (mỗi process): một kết nối pub/sub cho cả process, mỗi room chỉ
+  subscribe một lần dù có bao nhiêu khán giả; message được serialize một lần
+  và gửi thẳng tới các SpectatorConsumer local, không qua channel layer.
+"""
+import asyncio
+import json
+import logging
+import time
+from common.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+SPECTATOR_RATE = 2  # số lần publish diff tối đa / giây
+KEYFRAME_INTERVAL = 5  # giây
+
+
+def spectate_channel(code):
+    return f'quiz:spectate:{code}'
+
+
+class SpectatorFeed:
+    def __init__(self, code, rate=SPECTATOR_RATE):
+        self.code = code
+        self.interval = 1 / rate
+        self.view = {}
+        self.pending = {}
+        self.seq = 0
+        # PUBLISH trả về số subscriber: khi không có ai xem thì chỉ gửi keyframe
+        self.watched = True
+        self._last_keyframe = 0
+        self._task = None
+
+    def update(self, **fields):
+        self.view.update(fields)
+        self.pending.update(fields)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Spectator publish failed for room {self.code}: {e}")
+
+    async def tick(self):
+        if time.monotonic() - self._last_keyframe >= KEYFRAME_INTERVAL:
+            if self.watched or await self.has_spectators():
+                await self.publish_keyframe()
+            else:
+                # Room không có khán giả: không publish gì cả
+                self.pending = {}
+                self._last_keyframe = time.monotonic()
+        elif self.pending and self.watched:
+            pending, self.pending = self.pending, {}
+            await self.publish('diff', pending)
+        else:
+            # Không ai xem: keyframe kế tiếp sẽ mang các thay đổi này
+            self.pending = {}
+
+    async def has_spectators(self):
+        redis_conn = await get_redis()
+        [(_, count)] = await redis_conn.pubsub_numsub(spectate_channel(self.code))
+        return count > 0
+
+    async def publish_keyframe(self):
+        self.pending = {}
+        self._last_keyframe = time.monotonic()
+        await self.publish('keyframe', self.view)
+
+    async def publish(self, kind, state):
+        self.seq += 1
+        message = json.dumps({'type': 'spectate', 'kind': kind, 'seq': self.seq, 'state': state})
+        redis_conn = await get_redis()
+        self.watched = await redis_conn.publish(spectate_channel(self.code), message) > 0
+
+    async def close(self):
+        """Gửi view cuối cùng (vd. kết quả trận) rồi dừng."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        try:
+            await self.publish_keyframe()
+        except Exception as e:
+            logger.warning(f"Could not publish final spectator frame for room {self.code}: {e}")
+
+
+class SpectatorHub:
+    def __init__(self):
+        self.consumers = {}  # code -> set(SpectatorConsumer)
+        self._pubsub = None
+        self._reader = None
+
+    async def add(self, code, consumer):
+        consumers = self.consumers.setdefault(code, set())
+        consumers.add(consumer)
+        if len(consumers) == 1:
+            pubsub = await self.get_pubsub()
+            await pubsub.subscribe(spectate_channel(code))
+
+    async def remove(self, code, consumer):
+        consumers = self.consumers.get(code)
+        if not consumers:
+            return
+        consumers.discard(consumer)
+        if not consumers:
+            del self.consumers[code]
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(spectate_channel(code))
+
+    async def get_pubsub(self):
+        if self._pubsub is None:
+            redis_conn = await get_redis()
+            self._pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        return self._pubsub
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Spectator pub/sub error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                if not self.consumers:
+                    await asyncio.sleep(1)
+                continue
+            code = message['channel'].rsplit(':', 1)[-1]
+            for consumer in list(self.consumers.get(code, ())):
+                try:
+                    await consumer.send(text_data=message['data'])
+                except Exception as e:
+                    logger.warning(f"Dropped spectator frame for room {code}: {e}")
+
+
+hub = SpectatorHub()
@@ -1,3 +1,787 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from unittest import mock
+import fakeredis
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.utils import timezone
+from accounts.models import User
+from common.hashring import HashRing
+from common.metrics import REGISTRY, Histogram, render
+from common.redis_pool import get_async_pool, get_redis
+from leaderboard.models import EloHistory
+from quiz.game_loop import (
+    LEASE_TTL_MS, RELEASE_SCRIPT, RENEW_SCRIPT, WORKER_ID, GameLoopRegistry, RoomGameLoop,
+    inbox_key, lease_key, new_state,
+)
+from quiz.lobby import LOBBY_GROUP, LOBBY_KEY, add_room_sync
+from quiz.match_writer import DEAD_LETTER_KEY, GROUP, STREAM_KEY, MatchWriter, replay_dead_letters
+from quiz.matchmaking import CHANNELS_KEY, QUEUE_KEY, SEEN_KEY, STALE_AFTER_MS, Matchmaker
+from quiz.models import GameHistory, GameParticipant, Question, Room, RoundAnswer
+from quiz.consumers import QuizConsumer
+from quiz.protocol import CompactCodec, COMPACT_TYPES, JsonCodec
+from quiz.question_cache import QuestionPayloadCache, question_cache
+from quiz.reaper import ARCHIVE_AFTER, archive_finished_rooms
+from quiz.room_codes import FREE_KEY, allocate_room_code, refill
+from quiz.room_state import RoomStateStore, store
+from quiz.services import (
+    apply_match_results, calculate_multiplayer_elo_deltas, create_match_room,
+    draw_question_deck, get_question_payloads, speed_points,
+)
+from quiz.spectators import SpectatorFeed, spectate_channel
+from quiz.timers import TimerWheel
 
-# Create your tests here.
+
+def make_question(**kwargs):
+    defaults = {
+        'text': 'She ___ to work every day.',
+        'a': 'go', 'b': 'goes', 'c': 'going', 'd': 'gone',
+        'correct': 'B',
+        'score': 10,
+    }
+    defaults.update(kwargs)
+    return Question.objects.create(**defaults)
+
+
+class FakeRedisMixin:
+    """get_redis() của các module trong redis_modules trả về cùng một fakeredis."""
+    redis_modules = ()
+
+    def setUp(self):
+        super().setUp()
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        self.sync_redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+        async def get_redis():
+            return self.redis
+
+        for module in self.redis_modules:
+            patcher = mock.patch(f'{module}.get_redis', get_redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class QuestionDeckTest(TestCase):
+    def setUp(self):
+        for _ in range(6):
+            make_question(difficulty='beginner', category='grammar')
+        for _ in range(4):
+            make_question(difficulty='advanced', category='vocabulary')
+
+    def test_deck_respects_room_filters(self):
+        Room.objects.create(code='DECK01', difficulty='advanced')
+        deck, payloads = draw_question_deck('DECK01', 4)
+        self.assertEqual(len(deck), 4)
+        self.assertEqual(len(set(deck)), 4)
+        self.assertTrue(all(payloads[qid]['difficulty'] == 'advanced' for qid in deck))
+
+    def test_deck_has_no_repeats_when_bank_is_large_enough(self):
+        Room.objects.create(code='DECK02')
+        deck, payloads = draw_question_deck('DECK02', 10)
+        self.assertEqual(sorted(deck), sorted(payloads))
+        self.assertEqual(len(set(deck)), 10)
+
+    def test_small_bank_is_repeated_to_fill_deck(self):
+        Room.objects.create(code='DECK03', category='vocabulary')
+        deck, payloads = draw_question_deck('DECK03', 10)
+        self.assertEqual(len(deck), 10)
+        self.assertEqual(len(payloads), 4)
+
+    def test_empty_filter_falls_back_to_whole_bank(self):
+        Room.objects.create(code='DECK04', category='listening')
+        deck, _ = draw_question_deck('DECK04', 5)
+        self.assertEqual(len(deck), 5)
+
+    def test_match_room_is_created_with_deck(self):
+        code, deck = create_match_room(10)
+        room = Room.objects.get(code=code)
+        self.assertTrue(room.matchmade)
+        self.assertEqual(len(deck), 10)
+
+
+class RoomCodeTest(TestCase):
+    def test_generated_codes_use_room_alphabet(self):
+        code = Room.generate_code()
+        self.assertEqual(len(code), Room.CODE_LENGTH)
+        self.assertTrue(set(code) <= set(Room.CODE_ALPHABET))
+
+    def test_code_of_finished_room_can_be_reused(self):
+        Room.objects.create(code='ABC123', finished=True)
+        Room.objects.create(code='ABC123')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Room.objects.create(code='ABC123')
+
+
+class RoomCodePoolTest(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        for target, value in (
+            ('quiz.room_codes.get_sync_redis', mock.Mock(return_value=self.redis)),
+            ('quiz.room_codes.refill_in_background', mock.Mock()),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_refill_skips_code_allocated_but_not_saved(self):
+        self.redis.sadd(FREE_KEY, 'ABC123')
+        self.assertEqual(allocate_room_code(), 'ABC123')
+
+        # Room của ABC123 chưa được lưu nên query code__in không thấy nó
+        with mock.patch.object(Room, 'generate_code', side_effect=['ABC123', 'XYZ789']):
+            self.assertEqual(refill(size=2), 1)
+        self.assertEqual(self.redis.smembers(FREE_KEY), {'XYZ789'})
+
+
+class RoomArchiveTest(TestCase):
+    def test_old_finished_rooms_without_history_are_deleted(self):
+        alice = User.objects.create_user(username='alice', password='x')
+        bob = User.objects.create_user(username='bob', password='x')
+        empty = Room.objects.create(code='OLD001', finished=True)
+        played = Room.objects.create(code='OLD002', finished=True)
+        GameHistory.objects.create(room=played, player1=alice, player2=bob)
+        recent = Room.objects.create(code='NEW001', finished=True)
+        Room.objects.filter(id__in=[empty.id, played.id]).update(
+            created_at=timezone.now() - ARCHIVE_AFTER * 2
+        )
+
+        self.assertEqual(archive_finished_rooms(), 1)
+        self.assertEqual(
+            set(Room.objects.values_list('id', flat=True)), {played.id, recent.id}
+        )
+
+
+class QuestionPayloadCacheTest(SimpleTestCase):
+    def test_lru_eviction(self):
+        cache = QuestionPayloadCache(maxsize=2, ttl=60)
+        cache.set_many({1: {'id': 1}, 2: {'id': 2}})
+        cache.get_many([1])
+        cache.set_many({3: {'id': 3}})
+        found, missing = cache.get_many([1, 2, 3])
+        self.assertEqual(sorted(found), [1, 3])
+        self.assertEqual(missing, [2])
+
+    def test_expired_entries_are_misses(self):
+        cache = QuestionPayloadCache(maxsize=10, ttl=-1)
+        cache.set_many({1: {'id': 1}})
+        found, missing = cache.get_many([1])
+        self.assertEqual(found, {})
+        self.assertEqual(missing, [1])
+
+
+class QuestionPayloadInvalidationTest(TestCase):
+    def setUp(self):
+        question_cache.clear()
+
+    def test_payloads_are_served_from_cache(self):
+        q = make_question()
+        get_question_payloads([q.id])
+        with self.assertNumQueries(0):
+            payloads = get_question_payloads([q.id])
+        self.assertEqual(payloads[q.id]['text'], q.text)
+
+    def test_save_and_delete_invalidate(self):
+        q = make_question()
+        get_question_payloads([q.id])
+
+        q.text = 'He ___ football on Sundays.'
+        q.save()
+        self.assertEqual(get_question_payloads([q.id])[q.id]['text'], q.text)
+
+        question_id = q.id
+        q.delete()
+        self.assertEqual(get_question_payloads([question_id]), {})
+
+
+class CompactCodecTest(SimpleTestCase):
+    def test_question_body_is_sent_once(self):
+        codec = CompactCodec()
+        question = {'id': 7, 'text': 'She ___ to work every day.'}
+        result = codec.compact({'type': 'result', 'next_question': question, 'message': 'Time up!'})
+        self.assertEqual(result, {'t': COMPACT_TYPES['result'], 'nq': question})
+
+        start = codec.compact({'type': 'start', 'question': question, 'question_num': 2})
+        self.assertEqual(start, {'t': COMPACT_TYPES['start'], 'qi': 7, 'n': 2})
+
+    def test_scores_are_sent_as_deltas(self):
+        codec = CompactCodec()
+        self.assertEqual(codec.compact({'type': 'result', 'scores': {'1': 0, '2': 0}})['s'], {'1': 0, '2': 0})
+        frame = codec.compact({'type': 'result', 'scores': {'1': 10, '2': 0}})
+        self.assertNotIn('s', frame)
+        self.assertEqual(frame['sd'], {'1': 10})
+
+
+class TimerWheelTest(SimpleTestCase):
+    def run_ticks(self, wheel, ticks):
+        for _ in range(ticks):
+            wheel.advance()
+
+    def test_fires_at_expected_tick_across_levels(self):
+        wheel = TimerWheel(tick=1, slots=4, levels=3)
+        fired = []
+        for delay in (1, 3, 5, 17, 70):
+            wheel.schedule(delay, delay, lambda d=delay: fired.append((d, wheel.current_tick)))
+        self.run_ticks(wheel, 80)
+        self.assertEqual(fired, [(1, 1), (3, 3), (5, 5), (17, 17), (70, 70)])
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(tick=1, slots=4, levels=2)
+        fired = []
+        wheel.schedule('room', 2, lambda: fired.append('old'))
+        wheel.schedule('room', 6, lambda: fired.append('new'))
+        wheel.schedule('other', 3, lambda: fired.append('other'))
+        wheel.cancel('other')
+        self.run_ticks(wheel, 10)
+        self.assertEqual(fired, ['new'])
+        self.assertEqual(wheel.timers, {})
+
+
+class HistogramTest(SimpleTestCase):
+    def test_renders_cumulative_buckets_per_label(self):
+        histogram = Histogram('test_seconds', 'Test histogram', ['action'], buckets=(0.1, 1))
+        self.addCleanup(REGISTRY.remove, histogram)
+        histogram.observe(0.05, action='answer')
+        histogram.observe(0.5, action='answer')
+        histogram.observe(2, action='join')
+
+        lines = histogram.render()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{action="answer",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{action="answer",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{action="answer",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_bucket{action="join",le="1"} 0', lines)
+        self.assertIn('test_seconds_count{action="join"} 1', lines)
+        self.assertIn('test_seconds_sum{action="join"} 2', lines)
+        self.assertIn('test_seconds_sum{action="answer"} 0.55', lines)
+
+    def test_metrics_endpoint_requires_token(self):
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(METRICS_TOKEN='secret', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class RedisPoolTest(SimpleTestCase):
+    def test_pool_is_shared_within_a_loop_and_separate_across_loops(self):
+        async def pools():
+            return get_async_pool(), (await get_redis()).connection_pool
+
+        loops = [asyncio.new_event_loop(), asyncio.new_event_loop()]
+        try:
+            (first, first_again), (second, _) = [loop.run_until_complete(pools()) for loop in loops]
+            self.assertIs(first, first_again)
+            self.assertIsNot(first, second)
+            # Mỗi pool là một series của gauge ở /metrics
+            for loop in loops:
+                self.assertIn(
+                    f'redis_pool_connections{{pool="async:{id(loop):x}",state="max_connections"}} '
+                    f'{first.max_connections}',
+                    render(),
+                )
+        finally:
+            for loop in loops:
+                loop.close()
+
+
+class HashRingTest(SimpleTestCase):
+    def test_adding_a_node_moves_few_groups(self):
+        groups = [f'quiz_{i:06d}' for i in range(2000)]
+        before = HashRing(['redis://r1', 'redis://r2', 'redis://r3'])
+        after = HashRing(['redis://r3', 'redis://r1', 'redis://r2', 'redis://r4'])
+
+        moved = [g for g in groups if before.get_node(g) != after.get_node(g)]
+        # Khoảng 1/4 group chuyển, và chỉ chuyển sang node mới
+        self.assertLess(len(moved), len(groups) * 0.35)
+        self.assertTrue(all(after.get_node(g) == 'redis://r4' for g in moved))
+
+
+class ApplyMatchResultsTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(code='MATCH1')
+        self.alice = User.objects.create_user(username='alice', password='x')
+        self.bob = User.objects.create_user(username='bob', password='x')
+
+    def record(self, match_id, alice_score, bob_score):
+        return {
+            'match_id': match_id,
+            'room_id': self.room.id,
+            'room_code': 'MATCH1',
+            'players': [
+                {'user_id': self.alice.id, 'score': alice_score},
+                {'user_id': self.bob.id, 'score': bob_score},
+            ],
+        }
+
+    def test_batch_applies_elo_sequentially(self):
+        written = apply_match_results([self.record('m1', 30, 10), self.record('m2', 30, 20)])
+        self.assertEqual(written, 2)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.elo_rating, 1031)
+        self.assertEqual(self.bob.elo_rating, 969)
+        self.assertEqual(self.alice.elo_profile.elo, 1031)
+        second = GameHistory.objects.get(match_id='m2')
+        self.assertEqual(second.player1_elo_before, 1016)
+        self.assertEqual(EloHistory.objects.count(), 4)
+
+    def test_replayed_records_are_skipped(self):
+        apply_match_results([self.record('m1', 30, 10)])
+        self.assertEqual(apply_match_results([self.record('m1', 30, 10)]), 0)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.elo_rating, 1016)
+        self.assertEqual(GameHistory.objects.count(), 1)
+
+    def test_multiplayer_match(self):
+        carol = User.objects.create_user(username='carol', password='x')
+        record = self.record('m3', 30, 20)
+        record['players'].append({'user_id': carol.id, 'score': 10})
+
+        apply_match_results([record])
+
+        history = GameHistory.objects.get(match_id='m3')
+        self.assertEqual(history.player_count, 3)
+        self.assertEqual(history.winner, self.alice)
+        ranks = {p.user_id: (p.rank, p.elo_change) for p in GameParticipant.objects.filter(history=history)}
+        self.assertEqual(ranks, {self.alice.id: (1, 16), self.bob.id: (2, 0), carol.id: (3, -16)})
+
+    def test_round_answers_are_written(self):
+        question = make_question()
+        record = self.record('m4', 10, 0)
+        record['rounds'] = [{
+            'q': question.id, 'n': 1, 'c': 'B',
+            'a': {str(self.alice.id): ['B', 1200, 10], str(self.bob.id): [None, None, 0]},
+        }]
+
+        apply_match_results([record])
+
+        answers = {a.user_id: a for a in RoundAnswer.objects.filter(history__match_id='m4')}
+        self.assertTrue(answers[self.alice.id].is_correct)
+        self.assertEqual(answers[self.alice.id].response_ms, 1200)
+        self.assertFalse(answers[self.bob.id].is_correct)
+        self.assertIsNone(answers[self.bob.id].response_ms)
+
+    def test_speed_points(self):
+        self.assertEqual(speed_points(10, 0, 30000), 10)
+        self.assertEqual(speed_points(10, 15000, 30000), 8)
+        self.assertEqual(speed_points(10, 30000, 30000), 5)
+        self.assertEqual(speed_points(10, None, 30000), 10)
+
+    def test_two_player_deltas_match_1v1(self):
+        self.assertEqual(calculate_multiplayer_elo_deltas([1000, 1000], [10, 20]), [-16, 16])
+
+
+class GameLoopRegistryTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.game_loop',)
+
+    def setUp(self):
+        super().setUp()
+        self.registry = GameLoopRegistry()
+        patcher = mock.patch.object(self.registry, 'ensure_running')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_first_submit_elects_caller(self):
+        await self.registry.submit('ROOM1', {'type': 'join', 'channel': 'c1'})
+
+        self.assertEqual(await self.redis.get(lease_key('ROOM1')), WORKER_ID)
+        action = json.loads(await self.redis.lpop(inbox_key(WORKER_ID)))
+        self.assertEqual((action['code'], action['type'], action['channel']), ('ROOM1', 'join', 'c1'))
+
+    async def test_actions_go_to_current_owner(self):
+        await self.redis.set(lease_key('ROOM1'), 'other-worker')
+        await self.registry.submit('ROOM1', {'type': 'leave', 'channel': 'c1'})
+
+        self.assertEqual(await self.redis.llen(inbox_key(WORKER_ID)), 0)
+        self.assertEqual(await self.redis.llen(inbox_key('other-worker')), 1)
+
+    async def test_renew_and_release_only_own_leases(self):
+        await self.redis.set(lease_key('MINE'), WORKER_ID)
+        await self.redis.set(lease_key('THEIRS'), 'other-worker')
+
+        owned = await self.registry.script(self.redis, RENEW_SCRIPT)(
+            keys=[lease_key('MINE'), lease_key('THEIRS'), lease_key('FREE')],
+            args=[WORKER_ID, LEASE_TTL_MS], client=self.redis,
+        )
+        self.assertEqual(owned, [1, 0, 1])
+        self.assertEqual(await self.redis.get(lease_key('FREE')), WORKER_ID)
+
+        release = self.registry.script(self.redis, RELEASE_SCRIPT)
+        self.assertEqual(await release(keys=[lease_key('THEIRS')], args=[WORKER_ID], client=self.redis), 0)
+        self.assertEqual(await release(keys=[lease_key('MINE')], args=[WORKER_ID], client=self.redis), 1)
+        self.assertEqual(await self.redis.get(lease_key('THEIRS')), 'other-worker')
+
+    async def test_dispatch_queues_actions_per_room(self):
+        with mock.patch.object(RoomGameLoop, 'start'):
+            self.registry.dispatch({'code': 'ROOM1', 'type': 'answer', 'channel': 'c1', 'answer': 'A'})
+            self.registry.dispatch({'code': 'ROOM1', 'type': 'leave', 'channel': 'c1'})
+            self.registry.dispatch({'type': 'leave', 'channel': 'c2'})
+
+        self.assertEqual(list(self.registry.rooms), ['ROOM1'])
+        queue = self.registry.rooms['ROOM1'].queue
+        self.assertEqual(queue.get_nowait(), {'type': 'answer', 'channel': 'c1', 'answer': 'A'})
+        self.assertEqual(queue.get_nowait(), {'type': 'leave', 'channel': 'c1'})
+
+    async def test_failing_action_does_not_stop_the_loop(self):
+        game_loop = RoomGameLoop(self.registry, 'ROOM1')
+        game_loop.on_answer = mock.AsyncMock(side_effect=RuntimeError('boom'))
+        game_loop.on_leave = mock.AsyncMock()
+
+        with self.assertLogs('quiz.game_loop', 'ERROR'):
+            await game_loop.dispatch({'type': 'answer', 'channel': 'c1', 'answer': 'A'})
+        await game_loop.dispatch({'type': 'leave', 'channel': 'c1'})
+        game_loop.on_leave.assert_awaited_once_with(channel='c1')
+
+    async def test_invalid_answers_are_rejected(self):
+        game_loop = RoomGameLoop(self.registry, 'ROOM1')
+        game_loop.state = {'active_players': ['c1'], 'answers': {}, 'answer_times': {}, 'histogram': {}}
+        with mock.patch('quiz.game_loop.store.record_answer', mock.AsyncMock()) as record_answer:
+            for answer in ('E', 'a', '', 'AB', 1, ['A'], {'A': 1}):
+                with self.assertLogs('quiz.game_loop', 'WARNING'):
+                    await game_loop.on_answer('c1', answer)
+            record_answer.assert_not_awaited()
+        self.assertEqual(game_loop.state['histogram'], {})
+
+
+class RoomGameLoopTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.game_loop', 'quiz.room_state', 'quiz.lobby', 'quiz.spectators')
+
+    def setUp(self):
+        super().setUp()
+        self.channel_layer = mock.Mock(group_send=mock.AsyncMock(), send=mock.AsyncMock())
+        for target, value in (
+            ('quiz.game_loop.get_channel_layer', lambda: self.channel_layer),
+            ('quiz.lobby.get_channel_layer', lambda: self.channel_layer),
+            ('quiz.game_loop.enqueue_match', mock.AsyncMock(return_value='1-0')),
+            ('quiz.game_loop.services.finish_room', mock.Mock(return_value=5)),
+            ('quiz.game_loop.services.set_player_count', mock.Mock()),
+            # Room đã kết thúc không còn trong active_rooms
+            ('quiz.game_loop.services.get_room_settings', mock.Mock(return_value={})),
+            ('quiz.game_loop.services.mark_room_stopped', mock.Mock(return_value=False)),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_leave_after_finish_does_not_relist_room(self):
+        registry = GameLoopRegistry()
+        finished = RoomGameLoop(registry, 'ROOM01')
+        finished.state = {
+            **new_state(),
+            'started': True,
+            'channel_to_user': {'c1': 1, 'c2': 2},
+            'user_snapshot': {'1': {'channel': 'c1'}, '2': {'channel': 'c2'}},
+            'scores': {'1': 10, '2': 0},
+        }
+        await finished.finish()
+        await finished.spectators.close()
+
+        registry.dispatch({'code': 'ROOM01', 'type': 'leave', 'channel': 'c1'})
+        registry.dispatch({'code': 'ROOM01', 'type': 'join', 'channel': 'c3', 'user_id': 3, 'username': 'carol'})
+        await registry.rooms['ROOM01'].task
+
+        self.assertEqual(await self.redis.zcard(LOBBY_KEY), 0)
+        self.assertNotIn('ROOM01', registry.rooms)
+        self.assertIsNone(await store.load('ROOM01'))
+        self.channel_layer.send.assert_awaited_once_with(
+            'c3', {'type': 'join.rejected', 'message': 'Phòng không tồn tại'}
+        )
+
+
+    async def test_rejoin_after_round_boundary(self):
+        game_loop = RoomGameLoop(GameLoopRegistry(), 'ROOM01')
+        await store.add_roster('ROOM01', ['1', '2'])
+        await store.add_player('ROOM01', 'c2', 2, 'bob')
+        await store.set_meta('ROOM01', started=True, expected_players=2, question_num=3)
+        await game_loop.load()
+        # alice rời ở round 2; round 3 được dựng lại không có alice
+        game_loop.state['user_snapshot'] = {'2': {'channel': 'c2', 'username': 'bob'}}
+
+        await game_loop.on_join('c1-new', 1, 'alice', last_seq=7)
+        await game_loop.on_join('c3', 3, 'carol', last_seq=7)
+
+        (accepted, _), (rejected, _) = self.channel_layer.send.await_args_list
+        self.assertEqual((accepted[0], accepted[1]['type']), ('c1-new', 'join.accepted'))
+        self.assertEqual((rejected[0], rejected[1]['type']), ('c3', 'join.rejected'))
+        self.assertEqual(game_loop.state['channel_to_user'], {'c2': 2, 'c1-new': 1})
+        self.assertEqual(await self.redis.hgetall('quiz:room:ROOM01:players'), {'c2': '2', 'c1-new': '1'})
+        self.assertEqual((await store.load('ROOM01'))['roster'], ['1', '2'])
+
+
+    async def test_reload_resends_unacked_result(self):
+        game_loop = RoomGameLoop(GameLoopRegistry(), 'ROOM01')
+        await store.add_roster('ROOM01', ['1', '2'])
+        await store.add_player('ROOM01', 'c2', 2, 'bob')
+        await store.set_meta('ROOM01', started=True, expected_players=2, last_results_by_user={
+            'results': {}, 'correct_answer': 'A', 'scores': {'1': 10}, 'question_num': 2,
+        })
+        await game_loop.load()
+
+        # Tải lại trang: không có last_seq
+        await game_loop.on_join('c1-new', 1, 'alice', last_seq=None)
+
+        (accepted_args, _), (result_args, _) = self.channel_layer.send.await_args_list
+        self.assertFalse(accepted_args[1]['resumed'])
+        self.assertEqual(result_args[1]['type'], 'round.transition')
+        self.assertEqual(result_args[1]['correct_answer'], 'A')
+
+
+class LobbySyncTest(FakeRedisMixin, SimpleTestCase):
+    def test_add_room_sync_uses_sync_client(self):
+        channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch('quiz.lobby.get_sync_redis', return_value=self.sync_redis), \
+                mock.patch('quiz.lobby.get_redis', side_effect=AssertionError('async client used')), \
+                mock.patch('quiz.lobby.get_channel_layer', return_value=channel_layer):
+            add_room_sync('ROOM01', 0, 4)
+
+        self.assertEqual(self.sync_redis.zrange(LOBBY_KEY, 0, -1), ['ROOM01'])
+        channel_layer.group_send.assert_awaited_once_with(LOBBY_GROUP, {
+            'type': 'lobby.update', 'action': 'add',
+            'room': {'code': 'ROOM01', 'player_count': 0, 'max_players': 4},
+        })
+
+
+class RoomStateStoreTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.room_state',)
+
+    async def start_round(self, store):
+        await store.add_player('R1', 'c1', 1, 'alice')
+        await store.add_player('R1', 'c2', 2, 'bob')
+        await store.start_round(
+            'R1', 7, {'1': {'channel': 'c1'}, '2': {'channel': 'c2'}}, question_num=1, processed=False,
+        )
+
+    async def test_record_answer_once_per_active_channel(self):
+        store = RoomStateStore()
+        await self.start_round(store)
+
+        self.assertEqual(await store.record_answer('R1', 'c1', 'A', 1200), (1, 2))
+        self.assertEqual(await store.record_answer('R1', 'c1', 'B', 1500), (-1, 2))
+        self.assertEqual(await store.record_answer('R1', 'c3', 'B', 100), (-1, 2))
+        self.assertEqual(await store.record_answer('R1', 'c2', None, 30000), (2, 2))
+
+        state = await store.load('R1')
+        self.assertEqual(state['channel_to_user'], {'c1': 1, 'c2': 2})
+        self.assertEqual(state['answers'], {'c1': 'A', 'c2': None})
+        self.assertEqual(state['answer_times'], {'c1': 1200, 'c2': 30000})
+        self.assertEqual(state['histogram'], {'A': 1})
+        self.assertEqual((state['question_num'], state['processed']), (1, False))
+
+    async def test_finish_round_and_delete(self):
+        store = RoomStateStore()
+        await self.start_round(store)
+        round_log = {'q': 7, 'n': 1, 'c': 'A', 'a': {'1': ['A', 1200, 10]}}
+        await store.finish_round('R1', {'1': 10, '2': 0}, round_log, processed=True, question_num=2)
+
+        state = await store.load('R1')
+        self.assertEqual(state['scores'], {'1': 10, '2': 0})
+        self.assertEqual(state['rounds'], [round_log])
+        self.assertEqual((state['question_num'], state['processed']), (2, True))
+
+        await store.delete('R1')
+        self.assertIsNone(await store.load('R1'))
+
+    async def test_read_events_range(self):
+        store = RoomStateStore()
+        for seq in range(1, 5):
+            await store.append_event('R1', {'type': 'player.answered', 'seq': seq})
+
+        self.assertEqual([e['seq'] for e in await store.read_events('R1', 1, 3)], [2, 3])
+        self.assertEqual([e['seq'] for e in await store.read_events('R1', 2)], [3, 4])
+        self.assertEqual(await store.read_events('R1', 4), [])
+        self.assertEqual(await store.read_events('R2', 0), [])
+
+
+class MatchWriterTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.match_writer',)
+
+    async def read_entries(self, writer, *match_ids):
+        await writer.ensure_group(self.redis)
+        for match_id in match_ids:
+            await self.redis.xadd(STREAM_KEY, {'record': json.dumps({'match_id': match_id})})
+        return (await self.redis.xreadgroup(GROUP, 'test', {STREAM_KEY: '>'}, count=10))[0][1]
+
+    async def test_poison_record_is_dead_lettered_after_max_deliveries(self):
+        writer = MatchWriter(consumer='test', max_deliveries=2)
+        entries = await self.read_entries(writer, 'good', 'poison', 'also-good')
+        applied = []
+
+        def apply_match_results(records):
+            if any(record['match_id'] == 'poison' for record in records):
+                raise ValueError('bad record')
+            applied.extend(record['match_id'] for record in records)
+            return len(records)
+
+        with mock.patch('quiz.match_writer.services.apply_match_results', apply_match_results):
+            with self.assertLogs('quiz.match_writer', 'WARNING'):
+                await writer.write(self.redis, entries)
+            self.assertEqual(applied, ['good', 'also-good'])
+            self.assertEqual(await self.redis.xrange(DEAD_LETTER_KEY), [])
+            self.assertEqual((await self.redis.xpending(STREAM_KEY, GROUP))['pending'], 1)
+
+            # Lần nhận thứ hai (claim lại): vượt giới hạn nên vào dead stream
+            _, claimed, *_ = await self.redis.xautoclaim(STREAM_KEY, GROUP, 'test', 0, start_id='0-0')
+            with self.assertLogs('quiz.match_writer', 'ERROR'):
+                await writer.write(self.redis, claimed)
+
+        dead = await self.redis.xrange(DEAD_LETTER_KEY)
+        self.assertEqual([json.loads(fields['record'])['match_id'] for _, fields in dead], ['poison'])
+        self.assertEqual(dead[0][1]['entry_id'], entries[1][0])
+        self.assertEqual((await self.redis.xpending(STREAM_KEY, GROUP))['pending'], 0)
+
+    async def test_database_errors_leave_records_pending(self):
+        writer = MatchWriter(consumer='test', max_deliveries=1)
+        entries = await self.read_entries(writer, 'a', 'b')
+
+        with mock.patch('quiz.match_writer.services.apply_match_results',
+                        side_effect=OperationalError('server closed the connection')), \
+                self.assertLogs('quiz.match_writer', 'WARNING'):
+            await writer.write(self.redis, entries)
+
+        self.assertEqual(await self.redis.xrange(DEAD_LETTER_KEY), [])
+        self.assertEqual((await self.redis.xpending(STREAM_KEY, GROUP))['pending'], 2)
+
+    def test_replay_dead_letters(self):
+        for match_id in ('fixed', 'still-bad'):
+            self.sync_redis.xadd(DEAD_LETTER_KEY, {'record': json.dumps({'match_id': match_id})})
+
+        def apply_match_results(records):
+            if records[0]['match_id'] == 'still-bad':
+                raise ValueError('bad record')
+            return 1
+
+        with mock.patch('quiz.match_writer.get_sync_redis', return_value=self.sync_redis), \
+                mock.patch('quiz.match_writer.services.apply_match_results', apply_match_results):
+            replayed, failed = replay_dead_letters()
+
+        self.assertEqual((replayed, len(failed)), (1, 1))
+        remaining = self.sync_redis.xrange(DEAD_LETTER_KEY)
+        self.assertEqual([json.loads(fields['record'])['match_id'] for _, fields in remaining], ['still-bad'])
+
+
+class MatchmakingTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.matchmaking',)
+
+    async def queue(self, user_id, elo, seen_ago_ms):
+        now = int(time.time() * 1000)
+        await self.redis.zadd(QUEUE_KEY, {user_id: elo})
+        await self.redis.hset(CHANNELS_KEY, user_id, f'chan-{user_id}')
+        await self.redis.hset(SEEN_KEY, user_id, now - seen_ago_ms)
+
+    async def test_stale_entries_are_skipped_and_removed(self):
+        matchmaker = Matchmaker()
+        await self.queue(1, 1000, 0)
+        await self.queue(2, 1001, STALE_AFTER_MS + 1000)  # worker đã chết
+        await self.queue(3, 1020, 1000)
+        matchmaker.waiting[1] = {'elo': 1000, 'channel': 'chan-1', 'since': time.monotonic()}
+
+        with mock.patch.object(matchmaker, 'create_match', mock.AsyncMock()) as create_match:
+            self.assertTrue(await matchmaker.try_match(1))
+
+        create_match.assert_awaited_once_with([1, 3], ['chan-1', 'chan-3'])
+        self.assertEqual(await self.redis.zcard(QUEUE_KEY), 0)
+        self.assertEqual(await self.redis.hlen(CHANNELS_KEY), 0)
+        self.assertEqual(await self.redis.hlen(SEEN_KEY), 0)
+
+
+class SpectatorFeedTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.spectators',)
+
+    async def test_keyframes_only_when_someone_watches(self):
+        feed = SpectatorFeed('R1')
+        feed.watched = False
+        feed.view = {'phase': 'question'}
+        feed.publish = mock.AsyncMock()
+
+        await feed.tick()
+        feed.publish.assert_not_awaited()
+
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(spectate_channel('R1'))
+        feed._last_keyframe = 0
+        await feed.tick()
+        feed.publish.assert_awaited_once_with('keyframe', {'phase': 'question'})
+        await pubsub.aclose()
+
+
+class QuizConsumerTest(FakeRedisMixin, SimpleTestCase):
+    redis_modules = ('quiz.room_state',)
+    question = {'id': 7, 'text': 'She ___ to work.', 'a': 'go', 'correct': 'B', 'explanation': 'Hiện tại đơn'}
+
+    def make_consumer(self, codec=None, last_seq=0):
+        consumer = QuizConsumer()
+        consumer.code = 'R1'
+        consumer.user_id = 1
+        consumer.username = 'alice'
+        consumer.prefetched = {}
+        consumer.last_seq = last_seq
+        consumer.synced = True
+        consumer.buffered = []
+        consumer.codec = codec or JsonCodec()
+        consumer.sent = []
+
+        async def send_message(message):
+            if consumer.last_seq is not None:
+                message['seq'] = consumer.last_seq
+            consumer.sent.append(message)
+
+        consumer.send_message = send_message
+        return consumer
+
+    async def test_question_payloads_hide_answer(self):
+        for codec in (JsonCodec(), CompactCodec()):
+            consumer = self.make_consumer(codec)
+            await consumer.round_transition({
+                'type': 'round.transition', 'seq': 1, 'correct_answer': 'A', 'explanation': 'x',
+                'question_num': 1, 'results_by_user': {}, 'next_question': self.question,
+            })
+            await consumer.start({
+                'type': 'start', 'seq': 2, 'question_id': 7, 'question_num': 2, 'timer': 30,
+            })
+            result, start = consumer.sent
+            self.assertEqual(result['correct_answer'], 'A')
+            for question in (result.get('next_question'), start['question']):
+                if question is not None:
+                    self.assertNotIn('correct', question)
+                    self.assertNotIn('explanation', question)
+            self.assertEqual(start['question']['text'], 'She ___ to work.')
+
+    async def log_events(self, *seqs):
+        for seq in seqs:
+            await store.append_event('R1', {'type': 'player.answered', 'seq': seq, 'answered_count': seq})
+
+    async def test_resume_replays_missed_then_buffered_events(self):
+        await self.log_events(1, 2, 3, 4)
+        consumer = self.make_consumer(last_seq=2)
+        consumer.synced = False
+
+        # Tới trước join.accepted: giữ lại, seq 4 cũng có trong log
+        await consumer.player_answered({'type': 'player.answered', 'seq': 4, 'answered_count': 4})
+        await consumer.player_answered({'type': 'player.answered', 'seq': 5, 'answered_count': 5})
+        self.assertEqual(consumer.sent, [])
+
+        await consumer.join_accepted({'type': 'join.accepted', 'seq': 4, 'resumed': True})
+        joined, *events = consumer.sent
+        self.assertEqual(joined['type'], 'joined')
+        self.assertTrue(joined['resumed'])
+        self.assertIsInstance(joined['server_time'], int)
+        self.assertEqual([e['answered_count'] for e in events], [3, 4, 5])
+        self.assertEqual([e['seq'] for e in events], [3, 4, 5])
+
+        # Event đã nhận rồi bị bỏ qua
+        await consumer.player_answered({'type': 'player.answered', 'seq': 5, 'answered_count': 5})
+        self.assertEqual(len(consumer.sent), 4)
+
+    async def test_fresh_join_does_not_replay(self):
+        await self.log_events(1, 2, 3)
+        consumer = self.make_consumer(last_seq=1)
+        consumer.synced = False
+
+        await consumer.join_accepted({'type': 'join.accepted', 'seq': 3, 'resumed': False})
+        self.assertEqual([m['type'] for m in consumer.sent], ['joined'])
+        self.assertEqual(consumer.last_seq, 3)
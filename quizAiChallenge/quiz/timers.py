@@ -0,0 +1,228 @@
+"""
+Timer cho các deadline của quiz room (hết giờ câu hỏi, hết thời gian xem
+kết quả).
+
+- TimerWheel: hierarchical timer wheel, một instance / process, chạy bằng
+  một task duy nhất thay vì một asyncio.sleep cho mỗi room.
+- DeadlineScheduler: ghi mỗi deadline vào Redis sorted set quiz:deadlines
+  (score = epoch ms). Wheel local bắn deadline đúng giờ; nếu worker sở hữu
+  room đã chết, sweeper của bất kỳ worker nào sẽ claim deadline quá hạn và
+  đẩy nó vào room như một action bình thường.
+"""
+import asyncio
+import logging
+import math
+import time
+from common.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEADLINES_KEY = 'quiz:deadlines'
+SWEEP_INTERVAL = 1.0
+# Deadline quá hạn lâu hơn khoảng này mới bị coi là mồ côi
+ORPHAN_GRACE_MS = 2000
+SWEEP_BATCH = 100
+
+# Claim các deadline đã quá hạn: ZRANGEBYSCORE + ZREM trong một script để
+# mỗi deadline chỉ được một worker xử lý.
+# KEYS[1] = deadlines key, ARGV = [max score, limit]
+CLAIM_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #members > 0 then
+    redis.call('ZREM', KEYS[1], unpack(members))
+end
+return members
+"""
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel: level 0 có `slots` ô, mỗi ô một tick; mỗi
+    level sau bao `slots` lần level trước. Timer ở level cao được cascade
+    xuống khi wheel quay tới ô của nó. Mỗi key chỉ có một timer (schedule lại
+    sẽ thay timer cũ).
+    """
+
+    def __init__(self, tick=0.1, slots=64, levels=3):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current_tick = 0
+        self.timers = {}  # key -> [expires_tick, callback]
+        self._task = None
+        self._wakeup = None
+        self._origin = None
+
+    def schedule(self, key, delay, callback):
+        self.cancel(key)
+        expires = self.current_tick + max(1, math.ceil(delay / self.tick))
+        entry = [expires, callback]
+        self.timers[key] = entry
+        self._place(key, entry)
+        self._ensure_running()
+
+    def cancel(self, key):
+        entry = self.timers.pop(key, None)
+        if entry:
+            # Xoá lazy: entry vẫn nằm trong ô nhưng callback bị gỡ
+            entry[1] = None
+
+    def _place(self, key, entry):
+        diff = entry[0] - self.current_tick
+        for level in range(self.levels):
+            span = self.slots ** (level + 1)
+            if diff < span or level == self.levels - 1:
+                slot = (entry[0] // self.slots ** level) % self.slots
+                self.wheels[level][slot].append((key, entry))
+                return
+
+    def advance(self):
+        """Quay wheel thêm một tick và chạy các timer đến hạn."""
+        self.current_tick += 1
+
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if self.current_tick % span == 0:
+                slot = (self.current_tick // span) % self.slots
+                bucket = self.wheels[level][slot]
+                self.wheels[level][slot] = []
+                for key, entry in bucket:
+                    if entry[1] is not None:
+                        self._place(key, entry)
+
+        slot = self.current_tick % self.slots
+        bucket = self.wheels[0][slot]
+        self.wheels[0][slot] = []
+        for key, entry in bucket:
+            if entry[1] is None:
+                continue
+            if entry[0] > self.current_tick:
+                # Timer vượt quá phạm vi wheel, đặt lại
+                self._place(key, entry)
+                continue
+            if self.timers.get(key) is entry:
+                del self.timers[key]
+            callback = entry[1]
+            entry[1] = None
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Timer callback for {key} failed: {e}", exc_info=True)
+
+    def _ensure_running(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Không có event loop (vd. unit test gọi advance() thủ công)
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._origin = loop.time() - self.current_tick * self.tick
+        while True:
+            if not self.timers:
+                # Không còn timer: ngủ tới khi có schedule mới
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                self._origin = loop.time() - self.current_tick * self.tick
+            target = self._origin + (self.current_tick + 1) * self.tick
+            await asyncio.sleep(max(0.0, target - loop.time()))
+            # Bắt kịp nếu event loop bị chậm
+            while self._origin + (self.current_tick + 1) * self.tick <= loop.time():
+                self.advance()
+
+
+class DeadlineScheduler:
+    """
+    Deadline của room (mỗi room tối đa một deadline) trên wheel local và
+    trong Redis. Khi deadline đến hạn, on_fire(code, action) được gọi với
+    action dạng {'type': 'deadline', 'kind': ..., 'token': ...}.
+    """
+
+    def __init__(self, on_fire, on_orphan, wheel=None):
+        self.wheel = wheel or TimerWheel()
+        self.on_fire = on_fire
+        self.on_orphan = on_orphan
+        self.members = {}  # code -> member trong quiz:deadlines
+        self._sweeper = None
+
+    @staticmethod
+    def member(code, kind, token):
+        return f'{code}|{kind}|{token}'
+
+    @staticmethod
+    def parse_member(member):
+        code, kind, token = member.split('|', 2)
+        return code, {'type': 'deadline', 'kind': kind, 'token': int(token)}
+
+    async def schedule(self, code, kind, token, deadline_at):
+        """deadline_at là epoch giây (time.time())."""
+        old = self.members.get(code)
+        member = self.member(code, kind, token)
+        self.members[code] = member
+        self.wheel.schedule(code, max(0.0, deadline_at - time.time()),
+                            lambda: asyncio.create_task(self._fire(code, member)))
+
+        redis_conn = await get_redis()
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            if old and old != member:
+                pipe.zrem(DEADLINES_KEY, old)
+            pipe.zadd(DEADLINES_KEY, {member: int(deadline_at * 1000)})
+            await pipe.execute()
+
+    async def cancel(self, code):
+        self.wheel.cancel(code)
+        member = self.members.pop(code, None)
+        if member:
+            redis_conn = await get_redis()
+            await redis_conn.zrem(DEADLINES_KEY, member)
+
+    def forget(self, code):
+        """Bỏ timer local (room không còn chạy trên worker này) nhưng giữ deadline trong Redis."""
+        self.wheel.cancel(code)
+        self.members.pop(code, None)
+
+    async def _fire(self, code, member):
+        if self.members.get(code) == member:
+            del self.members[code]
+        try:
+            redis_conn = await get_redis()
+            claimed = await redis_conn.zrem(DEADLINES_KEY, member)
+        except Exception as e:
+            logger.error(f"Could not claim deadline {member}: {e}")
+            claimed = 1
+        # claimed == 0: sweeper của worker khác đã xử lý deadline này
+        if claimed:
+            self.on_fire(*self.parse_member(member))
+
+    def ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                redis_conn = await get_redis()
+                members = await redis_conn.eval(
+                    CLAIM_SCRIPT, 1, DEADLINES_KEY,
+                    int(time.time() * 1000) - ORPHAN_GRACE_MS, SWEEP_BATCH,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Deadline sweep failed: {e}")
+                continue
+            for member in members:
+                logger.info(f"Firing orphaned deadline {member}")
+                code, action = self.parse_member(member)
+                self.forget(code)
+                try:
+                    await self.on_orphan(code, action)
+                except Exception as e:
+                    logger.error(f"Could not deliver orphaned deadline {member}: {e}")
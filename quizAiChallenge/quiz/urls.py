@@ -8,4 +8,5 @@ urlpatterns = [
     path('create/', views.create_room, name='create_room'),
     path('join/', views.join_room, name='join_room'),
     path('room/<str:code>/', views.quiz_room, name='quiz_room'),
+    path('room/<str:code>/watch/', views.spectate_room, name='spectate_room'),
 ]
\ No newline at end of file
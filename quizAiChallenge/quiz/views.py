@@ -1,16 +1,21 @@
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Room
-import random
-import string
+from django.db.models import F
+from .affinity import room_ws_host
+from .lobby import LOBBY_SIZE, add_room_sync, lobby_rooms
+from .models import Room, Question
+from .room_codes import allocate_room_code
+
+logger = logging.getLogger(__name__)
 
 @login_required
 def quiz_room(request, code):
     """
     View cho quiz room - yêu cầu đăng nhập
     """
-    room = get_object_or_404(Room, code=code)
+    room = get_object_or_404(Room, code=code, finished=False)
     
     # Kiểm tra profile đã hoàn thành chưa (optional)
     if hasattr(request.user, 'is_profile_completed'):
@@ -21,10 +26,22 @@ def quiz_room(request, code):
     context = {
         'room': room,
         'user': request.user,
+        'ws_host': room_ws_host(room.code),
     }
     return render(request, 'quiz/room.html', context)
 
 
+def spectate_room(request, code):
+    """
+    Xem trận đấu (chỉ đọc) - không cần đăng nhập
+    """
+    room = get_object_or_404(Room, code=code, finished=False)
+    return render(request, 'quiz/spectate.html', {
+        'room': room,
+        'ws_host': room_ws_host(room.code),
+    })
+
+
 @login_required
 def create_room(request):
     """
@@ -32,23 +49,37 @@ def create_room(request):
     """
     if request.method == 'POST':
         # Tạo room code ngẫu nhiên
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        
-        # Đảm bảo code unique
-        while Room.objects.filter(code=code).exists():
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        
+        code = allocate_room_code()
+
+        difficulty = request.POST.get('difficulty') or None
+        if difficulty not in dict(Question.DIFFICULTY_CHOICES):
+            difficulty = None
+
+        try:
+            max_players = int(request.POST.get('max_players', 2))
+        except ValueError:
+            max_players = 2
+        max_players = min(max(max_players, 2), Room.MAX_PLAYERS)
+
         room = Room.objects.create(
             code=code,
             created_by=request.user,  # Nếu Room model có field này
             player_count=0,
-            started=False
+            started=False,
+            difficulty=difficulty,
+            category=request.POST.get('category', '').strip() or None,
+            max_players=max_players,
         )
         
+        add_room_sync(code, 0, max_players)
+
         messages.success(request, f'Đã tạo phòng {code}')
         return redirect('quiz:quiz_room', code=code)
     
-    return render(request, 'quiz/create_room.html')
+    return render(request, 'quiz/create_room.html', {
+        'difficulty_choices': Question.DIFFICULTY_CHOICES,
+        'max_players_limit': Room.MAX_PLAYERS,
+    })
 
 
 @login_required
@@ -60,10 +91,10 @@ def join_room(request):
         code = request.POST.get('code', '').strip().upper()
         
         try:
-            room = Room.objects.get(code=code)
+            room = Room.objects.get(code=code, finished=False)
             
             # Kiểm tra phòng đã đầy chưa
-            if room.player_count >= 2:
+            if room.is_full:
                 messages.error(request, 'Phòng đã đầy!')
                 return redirect('quiz:join_room')
             
@@ -83,13 +114,21 @@ def join_room(request):
 
 def lobby(request):
     """
-    Trang chủ - hiển thị các phòng đang chờ
+    Trang chủ - hiển thị các phòng đang chờ (đọc từ lobby Redis, trang tự
+    cập nhật qua ws/quiz/lobby/)
     """
-    available_rooms = Room.objects.filter(
-        started=False,
-        player_count__lt=2
-    ).order_by('-id')[:10]
-    
+    try:
+        available_rooms = lobby_rooms()
+    except Exception as e:
+        # Redis lỗi: đọc thẳng từ DB
+        logger.warning(f"Lobby unavailable, falling back to DB: {e}")
+        available_rooms = Room.objects.filter(
+            started=False,
+            finished=False,
+            matchmade=False,
+            player_count__lt=F('max_players')
+        ).order_by('-id')[:LOBBY_SIZE]
+
     context = {
         'rooms': available_rooms,
         'is_authenticated': request.user.is_authenticated,
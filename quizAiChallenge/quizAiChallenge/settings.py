@@ -88,18 +88,62 @@ TEMPLATES = [
 WSGI_APPLICATION = 'quizAiChallenge.wsgi.application'
 ASGI_APPLICATION = 'quizAiChallenge.asgi.application'
 
+# Redis
+# Một cấu hình dùng chung cho channel layer và common.redis_pool
+# (pool riêng cho mỗi event loop, tối đa REDIS_POOL_MAX_CONNECTIONS connection)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_POOL_MAX_CONNECTIONS = int(os.getenv('REDIS_POOL_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = 5
+REDIS_HEALTH_CHECK_INTERVAL = 30
+
 # Channel Layers
 # Use InMemoryChannelLayer for development (without Redis)
 # For production, use: channels_redis.core.RedisChannelLayer
+# Nhiều Redis cho channel layer: CHANNEL_REDIS_URLS="redis://r1:6379/0,redis://r2:6379/0",
+# group quiz_{code} được chia theo consistent hashing (common.channel_layers)
+CHANNEL_REDIS_URLS = [
+    url.strip() for url in os.getenv('CHANNEL_REDIS_URLS', '').split(',') if url.strip()
+] or [REDIS_URL]
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': (
+            'common.channel_layers.ShardedRedisChannelLayer' if len(CHANNEL_REDIS_URLS) > 1
+            else 'channels_redis.core.RedisChannelLayer'
+        ),
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+            "hosts": [{
+                'address': url,
+                'max_connections': REDIS_POOL_MAX_CONNECTIONS,
+                'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+            } for url in CHANNEL_REDIS_URLS],
         },
     },
 }
 
+# Realtime quiz
+# Cache payload câu hỏi trong mỗi process Daphne (số câu hỏi, TTL giây)
+QUIZ_QUESTION_CACHE_SIZE = 2048
+QUIZ_QUESTION_CACHE_TTL = 300
+# Chạy match writer (ghi ELO/GameHistory từ stream quiz:matches) trong mỗi
+# process Daphne; tắt nếu chạy riêng bằng `manage.py run_match_writer`
+QUIZ_MATCH_WRITER_IN_PROCESS = os.environ.get('QUIZ_MATCH_WRITER_IN_PROCESS', '1') == '1'
+# Reaper định kỳ (đối chiếu Room với Redis, dọn room bỏ dở); tắt nếu chạy
+# `manage.py reap_rooms` bằng cron
+QUIZ_REAPER_IN_PROCESS = os.environ.get('QUIZ_REAPER_IN_PROCESS', '1') == '1'
+# Room affinity: host của các node Daphne nhận websocket (vd. "ws1.example.com,ws2.example.com").
+# Mọi người chơi / khán giả của một room kết nối tới cùng một node (quiz.affinity);
+# session cookie phải dùng được trên các host này (SESSION_COOKIE_DOMAIN) và
+# các host phải có trong ALLOWED_HOSTS. Để trống: dùng host của trang.
+QUIZ_WS_NODES = [node.strip() for node in os.getenv('QUIZ_WS_NODES', '').split(',') if node.strip()]
+# /metrics (Prometheus): scraper phải gửi "Authorization: Bearer <token>".
+# Không đặt token thì /metrics chỉ mở khi DEBUG.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Rating (leaderboard.rating): K của Elo cho từng trận, engine mặc định khi
+# tính lại theo rating period (`manage.py recalculate_ratings`): 'elo' | 'glicko2'
+ELO_K_FACTOR = int(os.getenv('ELO_K_FACTOR', 32))
+RATING_ENGINE = os.getenv('RATING_ENGINE', 'elo')
+
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
@@ -33,6 +33,9 @@ urlpatterns = [
     # Private
     path('home/', core_views.homepage, name='homepage'),
 
+    # Prometheus
+    path('metrics', core_views.metrics, name='metrics'),
+
     # App accounts
     path('accounts/', include('accounts.urls')),
 
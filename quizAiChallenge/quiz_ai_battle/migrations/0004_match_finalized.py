@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 16:10
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def mark_existing_finalized(apps, schema_editor):
+    # Trận cũ đã chơi xong (mọi round đã trả lời) hoặc đã được tính ELO khi mở
+    # trang summary. Trận đang chơi dở giữ finalized=False để được tính khi kết thúc.
+    Match = apps.get_model('quiz_ai_battle', 'Match')
+    Round = apps.get_model('quiz_ai_battle', 'Round')
+    rounds = Round.objects.filter(match=OuterRef('pk'))
+    unanswered = rounds.filter(Q(user_answer__isnull=True) | Q(user_answer=''))
+    Match.objects.filter(
+        Q(elo_after__isnull=False) | (Exists(rounds) & ~Exists(unanswered))
+    ).update(finalized=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_ai_battle', '0003_match_elo_after_match_elo_before_match_elo_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='finalized',
+            field=models.BooleanField(default=False, help_text='ELO và thống kê trận đã được ghi nhận'),
+        ),
+        migrations.RunPython(mark_existing_finalized, migrations.RunPython.noop),
+    ]
@@ -64,6 +64,7 @@ class Match(models.Model):
     elo_change = models.IntegerField(default=0, help_text="ELO points gained/lost in this match")
     elo_before = models.IntegerField(null=True, blank=True, help_text="User ELO before match")
     elo_after = models.IntegerField(null=True, blank=True, help_text="User ELO after match")
+    finalized = models.BooleanField(default=False, help_text="ELO và thống kê trận đã được ghi nhận")
 
     def __str__(self):
         return f"Match #{self.id} - {self.user.username} ({self.ai_mode}, {self.ai_difficulty})"
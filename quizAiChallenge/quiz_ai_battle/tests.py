@@ -1,3 +1,35 @@
+from importlib import import_module
+from django.apps import apps
 from django.test import TestCase
+from accounts.models import User
+from .models import Match, Question, Round
 
-# Create your tests here.
+migration_0004 = import_module('quiz_ai_battle.migrations.0004_match_finalized')
+
+
+class MarkExistingFinalizedTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='x')
+        self.question = Question.objects.create(
+            content='She ___ to work.', option_a='go', option_b='goes',
+            option_c='going', option_d='gone', correct_answer='B',
+        )
+
+    def make_match(self, answers, **kwargs):
+        match = Match.objects.create(user=self.user, **kwargs)
+        for answer in answers:
+            Round.objects.create(match=match, question=self.question, user_answer=answer)
+        return match
+
+    def test_only_completed_or_rated_matches_are_finalized(self):
+        completed = self.make_match(['B', 'A'])
+        in_progress = self.make_match(['B', None])
+        rated = self.make_match(['B', None], elo_before=1000, elo_after=1010)
+        empty = self.make_match([])
+
+        migration_0004.mark_existing_finalized(apps, None)
+
+        finalized = set(Match.objects.filter(finalized=True).values_list('id', flat=True))
+        self.assertEqual(finalized, {completed.id, rated.id})
+        self.assertNotIn(in_progress.id, finalized)
+        self.assertNotIn(empty.id, finalized)
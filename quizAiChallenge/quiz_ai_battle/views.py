@@ -6,6 +6,7 @@ import requests
 import json
 import logging
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -223,10 +224,7 @@ def summary(request, match_id):
     match = get_object_or_404(Match, id=match_id, user=request.user)
     rounds = Round.objects.filter(match=match)
 
-    # ✨ NEW: Update ELO rating based on match result
-    elo_change = _calculate_elo_change(match)
-    if elo_change != 0:
-        _update_user_elo(request.user, match, elo_change)
+    _finalize_match(request.user, match)
 
     return render(request, 'quiz_ai_battle/summary.html', {
         'match': match,
@@ -234,44 +232,42 @@ def summary(request, match_id):
     })
 
 
-def _calculate_elo_change(match):
-    """Calculate ELO change based on match result"""
-    result = match.result
-    
-    if result == 'win':
-        return 30  # Win: +30 points
-    elif result == 'loss':
-        return -20  # Loss: -20 points
-    else:
-        return 0   # Draw: no change
+def _finalize_match(user, match):
+    """
+    Tính ELO và thống kê trận đúng một lần: chỉ request chuyển được
+    finalized False -> True mới ghi (mở lại / F5 trang summary không cộng thêm).
+    """
+    from leaderboard.models import UserMatchStats
+    from leaderboard.services import record_match_results
+
+    with transaction.atomic():
+        if not Match.objects.filter(id=match.id, finalized=False).update(finalized=True):
+            return
+        match.finalized = True
+        elo_change = _calculate_elo_change(match, user.elo_rating)
+        if elo_change != 0:
+            _update_user_elo(user, match, elo_change)
+        record_match_results([(user.id, UserMatchStats.MODE_AI, match.result)])
+
+
+def _calculate_elo_change(match, user_elo=None):
+    """ELO change vs. the AI, rated as a fixed-rating opponent by difficulty (expected-score Elo)"""
+    from leaderboard.rating import AI_RATINGS, EloEngine
+
+    if user_elo is None:
+        user_elo = match.user.elo_rating
+    ai_elo = AI_RATINGS.get(match.ai_difficulty, AI_RATINGS['medium'])
+    return EloEngine().match_deltas([user_elo, ai_elo], [match.user_score, match.ai_score])[0]
 
 
 def _update_user_elo(user, match, elo_change):
-    """Update user ELO rating and record history"""
-    from leaderboard.models import UserElo, EloHistory
-    
-    # Record history before change (use User.elo_rating as source of truth)
-    elo_before = user.elo_rating
-    
-    # Update user profile with new ELO
-    user.elo_rating += elo_change
-    user.save(update_fields=['elo_rating'])
-    
-    # Get or create UserElo and sync
-    user_elo, created = UserElo.objects.get_or_create(user=user)
-    user_elo.elo = user.elo_rating
-    user_elo.save(update_fields=['elo'])
-    
+    """Update user ELO rating (atomic, via leaderboard service) and record it on the match"""
+    from leaderboard.services import update_elo
+
+    elo_before, elo_after = update_elo(user, elo_change)
+
     # Update match record
     match.elo_before = elo_before
-    match.elo_after = user.elo_rating
+    match.elo_after = elo_after
     match.elo_change = elo_change
     match.save(update_fields=['elo_before', 'elo_after', 'elo_change'])
-    
-    # Record in ELO history
-    EloHistory.objects.create(
-        user=user,
-        elo_before=elo_before,
-        elo_after=user.elo_rating,
-        change=elo_change
-    )